@@ -227,7 +227,7 @@ def classify(dbFileLoc, gtfsDir, nPts=1, agency="dbus", kneighbors=10,
 
     utils.printCurrentTime()
     print "Building service calendar"
-    serviceCalendar = utils.buildServiceCalendar(gtfsDir, agency=agency)
+    serviceCalendar = utils.compileServiceCalendar(gtfsDir, agency=agency)
 
     trainData, testData = readData(dbFileLoc)
 
@@ -241,28 +241,23 @@ def classify(dbFileLoc, gtfsDir, nPts=1, agency="dbus", kneighbors=10,
     testData.reset_index(inplace=True)
     trainData.reset_index(inplace=True)
 
-    # Split testData by date and match to trainData by serviceID
+    # Split testData by date and match to trainData by service
+    # (a calendar entry, -1 if there is no single one for the date)
     utils.printCurrentTime()
-    print "Grouping data by date"
-    testGroupDate = testData.groupby(testData['time'].apply(pd.datetime.date))
-    trainGroupDate = trainData.groupby(trainData['time'].apply(pd.datetime.date))
+    print "Assigning services by date"
+    testDates = testData['time'].apply(pd.datetime.date)
+    testService = serviceCalendar.getSingleEntries(testDates.values)
+    trainService = serviceCalendar.getSingleEntries(
+        trainData['time'].apply(pd.datetime.date).values)
 
     # Eliminate data that doesn't exist in serviceCalendar (e.g. Jan 6)
-    testData = testGroupDate.filter(lambda x:
-        len(utils.getServiceForDate(x.name, serviceCalendar)) == 1)
-    trainData = trainGroupDate.filter(lambda x:
-        len(utils.getServiceForDate(x.name, serviceCalendar)) == 1)
+    testData = testData[testService >= 0]
+    testDates = testDates[testService >= 0]
+    trainData = trainData[trainService >= 0]
+    trainService = trainService[trainService >= 0]
 
-    # Regroup filtered data
-    testGroupDate = testData.groupby(testData['time'].apply(pd.datetime.date))
-    trainGroupDate = trainData.groupby(trainData['time'].apply(pd.datetime.date))
-
-    utils.printCurrentTime()
-    print "Assigning service IDs to training data"
-    trainDateServiceDict = {}
-    for dt, trainGroup in trainGroupDate:
-        service = utils.getServiceForDate(dt, serviceCalendar)
-        trainDateServiceDict[dt] = service
+    # Group filtered data
+    testGroupDate = testData.groupby(testDates)
 
     utils.printCurrentTime()
     print "preprocessing training data"
@@ -286,24 +281,19 @@ def classify(dbFileLoc, gtfsDir, nPts=1, agency="dbus", kneighbors=10,
     for dt, testGroup in testGroupDate:
         utils.printCurrentTime()
         print "Selecting data for ", dt
-        service = utils.getServiceForDate(dt, serviceCalendar)
-
-        # Get training data that matches serviceID for this test date
-        trainSel = trainGroupDate.filter(
-            lambda x: all([(trainDateServiceDict[x.name][col] ==
-                            service[col]).values[0]
-                            for col in service.columns])
-            )
+        service = serviceCalendar.getSingleEntries(dt)
 
         testIdx = testGroup.index # index for test data with this date
-        trainIdx = trainSel.index # index for training data with same serviceID
+        # index for training data with same service
+        trainIdx = trainData.index[trainService == service]
 
         print "Train set size: ", len(trainIdx)
         print "Test set size: ", len(testIdx)
 
         # Handle case where no training data exists (e.g. new schedule change)
         if len(trainIdx) == 0:
-            print "No training data with this service: ", service
+            print "No training data with this service: ", \
+                serviceCalendar.describeEntry(service)
             print "Setting trip IDs to None"
             yHat[testIdx] = encoder.transform([None])
             continue
@@ -6,6 +6,14 @@ from datetime import datetime
 from collections import Iterable
 import sqlite3
 
+try:
+    from pygtfs.serviceCalendar import readServiceCalendar
+except ImportError:
+    import sys
+    path, filename = os.path.split(__file__)
+    sys.path.append(os.path.abspath(os.path.join(path,"../assigner/")))
+    from pygtfs.serviceCalendar import readServiceCalendar
+
 # np datetime64[W] weeks start on 1970/1/1 (Thursday)
 # subtract to have weeks start on Monday
 npWeekdayOffset = np.timedelta64(datetime(1970,1,1).weekday()+1, 'D')
@@ -104,64 +112,21 @@ def getGTFSFileList(gtfsDir, agency="dbus"):
 
     return gtfsFileList
 
-def buildServiceCalendar(gtfsDir, agency="dbus", exclude0000=True):
-    """Concatenate all GTFS calendar tables into a dataframe
+def compileServiceCalendar(gtfsDir, agency="dbus", exclude0000=True):
+    """Compile the calendar and calendar_dates tables of all GTFS db files
+    into a ServiceCalendar (a date x calendar entry boolean matrix)
 
     Inputs:
         gtfsDir - path to directory with GTFS db files
         agency - string prefix for db filenames
     Returns:
-        serviceCalendar - pandas dataframe with calendars, duplicates removed
-    """
-    gtfsFileList = getGTFSFileList(gtfsDir, agency=agency)
-
-    # Copy calendar table from each GTFS db into :memory: db
-    fc = sqlite3.connect(":memory:")
-    for ii, gdbFile in enumerate(gtfsFileList):
-        fc.execute("ATTACH DATABASE '{}' AS gdb".format(gdbFile))
-        if ii==0:
-            cur = fc.execute("CREATE TABLE main.calendar AS SELECT * FROM gdb.calendar")
-        else:
-            cur = fc.execute("INSERT INTO main.calendar SELECT * FROM gdb.calendar")
-        fc.execute("DETACH DATABASE gdb")
-
-    # Extract concatenated calendar into pandas dataframe
-    query = "SELECT * FROM main.calendar"
-    sc = pd.io.sql.frame_query(query, fc).drop_duplicates()
-    fc.close()
-
-    ### Clean up dataframe
-
-    # Remove special service ID
-    if exclude0000:
-        sc = sc[sc['service_id'] != '0000']
-
-    # Sort and re-index
-    sc.sort(("service_id", "start_date", "end_date"), inplace=True)
-    sc.reset_index(inplace=True, drop=True)
-
-    # Convert start and end dates to datetime objects
-    default = datetime(1970,1,1)
-    sc['start_date'] = sc['start_date'].apply(lambda x:
-        pd.datetools.dateutil_parse(x, default=default)[0])
-    sc['end_date'] = sc['end_date'].apply(lambda x:
-        pd.datetools.dateutil_parse(x, default=default)[0])
-
-    return sc
-
-def getServiceForDate(dt, serviceCalendar):
-    """Search GTFS calendars for service info given a datetime object
-
-    Input:
-        dt - datetime object
-        serviceCalendar - pd dataframe with calendar data
-    Returns:
-        serviceID
+        ServiceCalendar - see pygtfs.serviceCalendar; getSingleEntries and
+            getServiceIdsForDate take a date or an array of dates
     """
+    connList = [sqlite3.connect(gdbFile)
+                for gdbFile in getGTFSFileList(gtfsDir, agency=agency)]
+    serviceCalendar = readServiceCalendar(connList, exclude0000=exclude0000)
+    for conn in connList:
+        conn.close()
 
-    dayDict = {1:"monday", 2:"tuesday", 3:"wednesday", 4:"thursday",
-               5:"friday", 6:"saturday", 7:"sunday"}
-    match = ((serviceCalendar[dayDict[dt.isoweekday()]] == '1') &
-             (serviceCalendar['start_date'] <= dt) &
-             (serviceCalendar['end_date'] >= dt))
-    return serviceCalendar[['service_id','start_date','end_date']][match]
+    return serviceCalendar
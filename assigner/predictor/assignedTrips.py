@@ -51,6 +51,10 @@ class AssignedTrips(object):
         badList = []
         for deviceId in self.assignedTripDict:
             assignedBlock = self.assignedTripDict[deviceId].block
+            
+            if deviceId not in self.tripDistances.candidateBlocks:
+                # not checked against this GtfsData yet
+                continue
 
             candidateBlocks = [x['block'] for x in 
                                self.tripDistances.candidateBlocks[deviceId]]
@@ -160,6 +164,11 @@ class AssignedTrips(object):
             
         return blockList
     
+    
+    def getAssignedBlockIds(self):
+        return set(assignment.block.blockId
+                   for assignment in self.assignedTripDict.itervalues())
+    
         
     def projectLocation(self, rawLoc, postTarget=None):
         deviceId = rawLoc.deviceId
@@ -289,6 +298,30 @@ class AssignedTrips(object):
                                                        stopSeqDep)        
     
             
+    def remapAssignments(self, oldAssignedTrips):
+        '''
+        Take over the assignments of oldAssignedTrips (made with another
+        GtfsData) whose trips are in this GtfsData, with their progress
+        along the trip. Devices assigned to trips that are gone are left
+        unassigned.
+        '''
+        for deviceId, oldAssignment in oldAssignedTrips.assignedTripDict.items():
+            tripId = oldAssignment.trip.tripId
+            trip = self.gtfsData.getTripFromTripId(tripId)
+            if trip is None:
+                self.logger.info("Trip %s of device %s is not in the new data. Deassigning device."
+                                 % (tripId, deviceId))
+                continue
+            
+            assignment = AssignedTrip(trip, 
+                                      self.gtfsData.getBlockFromTripId(tripId),
+                                      oldAssignment.time, oldAssignment.post,
+                                      oldAssignment.arrivedStop, 
+                                      oldAssignment.departedStop)
+            assignment._postMax = oldAssignment._postMax
+            self.assignedTripDict[deviceId] = assignment
+    
+            
     def assignUnassignedTripToDevice(self, deviceId, startTime, newTrip, newBlock, post):
         match = False
         # Check to see if the given trip is already assigned.
@@ -0,0 +1,108 @@
+'''
+Created on Oct 18, 2026
+'''
+from pygtfs.gtfsData import GtfsData
+import logging
+import multiprocessing
+import threading
+
+
+def buildSnapshot(agency, dbFileLoc, snapshotFileLoc):
+    # in the worker process: load the feed from the db, writing the snapshot
+    GtfsData(agency, dbFileLoc, snapshotFileLoc=snapshotFileLoc)
+
+
+class GtfsRebuild(object):
+    '''
+    Builds the GtfsData of a new feed in the background. A worker process
+    loads the feed from its db, which also adds the derived tables and
+    stop postmiles to the db and writes a snapshot (see GtfsData), and a
+    thread then loads the GtfsData from the snapshot, so the caller is not
+    held up. Poll isDone(), then call getGtfsData().
+
+    In lazy mode, no snapshot is written, and the thread sets up a lazy
+    GtfsData on the prepared db instead, loading the service day of
+    preloadTime if given. The GtfsData keeps a connection to the db, which
+    can only be used in the thread that opened it, so getGtfsData() opens
+    a new one in the caller's thread; that is all the caller does.
+    '''
+
+
+    def __init__(self, agency, dbFileLoc, snapshotFileLoc, loggerName=None,
+                 lazy=False, preloadTime=None):
+        '''
+        Constructor
+
+        preloadTime -- lazy mode: a time (in millis) whose service day to
+                       load in the background.
+        '''
+        self.agency = agency
+        self.dbFileLoc = dbFileLoc
+        self.snapshotFileLoc = snapshotFileLoc
+        self.lazy = lazy
+        self.preloadTime = preloadTime
+        self.logger = logging.getLogger(loggerName)
+
+        self.gtfsData = None
+
+        if self.lazy:
+            snapshotFileLoc = None
+        self.process = multiprocessing.Process(target=buildSnapshot,
+                                               args=(agency, dbFileLoc,
+                                                     snapshotFileLoc))
+        self.process.daemon = True
+        self.process.start()
+
+        if self.lazy:
+            self.thread = threading.Thread(target=self.loadLazy)
+        else:
+            self.thread = threading.Thread(target=self.loadSnapshot)
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def workerSucceeded(self):
+        self.process.join()
+        if (self.process.exitcode != 0):
+            self.logger.error("Rebuild of %s failed in worker (exit code %s)"
+                              % (self.dbFileLoc, self.process.exitcode))
+            return False
+        return True
+
+
+    def loadSnapshot(self):
+        try:
+            if self.workerSucceeded():
+                self.gtfsData = GtfsData(self.agency, self.dbFileLoc,
+                                         snapshotFileLoc=self.snapshotFileLoc)
+        except Exception as e:
+            self.logger.error("Rebuild of %s failed: %s" % (self.dbFileLoc, e))
+
+
+    def loadLazy(self):
+        try:
+            if self.workerSucceeded():
+                gtfsData = GtfsData(self.agency, self.dbFileLoc, lazy=True)
+                if self.preloadTime is not None:
+                    gtfsData.getTodayBlocks(self.preloadTime)
+                self.gtfsData = gtfsData
+        except Exception as e:
+            self.logger.error("Rebuild of %s failed: %s" % (self.dbFileLoc, e))
+
+
+    def isDone(self):
+        return not self.thread.is_alive()
+
+
+    def wait(self):
+        self.thread.join()
+
+
+    def getGtfsData(self):
+        '''
+        Return the new GtfsData, or None if the rebuild failed. Call once
+        isDone() is True.
+        '''
+        if (self.lazy and self.gtfsData is not None):
+            self.gtfsData.reconnect()
+        return self.gtfsData
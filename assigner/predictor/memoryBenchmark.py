@@ -0,0 +1,132 @@
+'''
+Created on Oct 18, 2026
+
+Estimate the memory footprint of stop times for a full feed and of raw
+locations for a 10-minute fleet window. Each is measured for three
+representations: plain objects with a __dict__ (as the classes used to be),
+the __slots__ classes, and arrays (Trip stop time arrays, LocationArray).
+'''
+
+from pygtfs.gtfsData import GtfsData
+from pygtfs.locationArray import createLocationArrayFromList
+from rawLocation import rawLocation
+from argparse import ArgumentParser
+import random
+import sys
+
+
+class DictStopTime(object):
+    # StopTime as it was before __slots__
+    def __init__(self, tripId, stopId, stopSequence, arrTimeMillis, depTimeMillis, postKm):
+        self.tripId = tripId
+        self.stopId = stopId
+        self.stopSequence = stopSequence
+        self.arrTimeMillis = arrTimeMillis
+        self.depTimeMillis = depTimeMillis
+        self.postKm = postKm
+
+
+class DictRawLocation(object):
+    # rawLocation as it was before __slots__
+    def __init__(self, device_id, time, lat, lon, spd=None, bearing=None, accuracy=None, driver_id=None, bus_id=None, dt=None):
+        self.deviceId = device_id
+        self.ts = time
+        self.lat = lat
+        self.lon = lon
+        self.spd = spd
+        self.bearing = bearing
+        self.accuracy = accuracy
+        self.driver_id = driver_id
+        self.bus_id = bus_id
+        self.dt = dt
+
+
+def getObjectsSize(objList):
+    '''
+    Return the bytes used by the objects, their __dict__s (if any) and the
+    float/int values they hold. Strings and ids (shared with the rest of the
+    program) are not counted.
+    '''
+    nBytes = 0
+    for obj in objList:
+        nBytes += sys.getsizeof(obj)
+        if hasattr(obj, '__dict__'):
+            nBytes += sys.getsizeof(obj.__dict__)
+            values = obj.__dict__.values()
+        else:
+            values = [getattr(obj, name) for name in obj.__slots__]
+        for value in values:
+            if isinstance(value, (float, int, long)):
+                nBytes += sys.getsizeof(value)
+    return nBytes
+
+
+def printSizes(title, nItems, sizeList):
+    print "%s (%d items)" % (title, nItems)
+    for name, nBytes in sizeList:
+        print "    %-20s %10.1f MB %8.1f bytes/item" % (name, nBytes/1e6,
+                                                      nBytes/float(max(nItems, 1)))
+
+
+def benchmarkFeed(dbFileLoc):
+    gtfsData = GtfsData('benchmark', dbFileLoc)
+
+    stopTimeList = []
+    arrayBytes = 0
+    for block in gtfsData.blockDict.values():
+        for trip in block.getTripList():
+            stopTimeList.extend(trip.stopTimeList)
+            arrayBytes += (trip.stopSeqArray.nbytes + trip.arrArray.nbytes +
+                           trip.depArray.nbytes + trip.postArray.nbytes)
+
+    dictList = [DictStopTime(st.tripId, st.stopId, st.stopSequence,
+                             st.arrTimeMillis, st.depTimeMillis, st.postKm)
+                for st in stopTimeList]
+
+    printSizes("Stop times for the full feed", len(stopTimeList),
+               [("dict objects", getObjectsSize(dictList)),
+                ("slots objects", getObjectsSize(stopTimeList)),
+                ("arrays", arrayBytes)])
+
+
+def benchmarkFleetWindow(nDevices, intervalSecs, windowMins=10):
+    random.seed(1)
+    t0 = 1385938800000
+
+    rawArgs = []
+    for i in range(nDevices):
+        deviceId = 'device%05d' % i
+        for ts in range(t0, t0 + windowMins*60*1000, intervalSecs*1000):
+            rawArgs.append((deviceId, ts, 43.3 + random.uniform(-0.05, 0.05),
+                            -1.96 + random.uniform(-0.05, 0.05),
+                            random.uniform(0., 15.)))
+
+    dictList = [DictRawLocation(*args) for args in rawArgs]
+    slotsList = [rawLocation(*args) for args in rawArgs]
+    locArray = createLocationArrayFromList(slotsList)
+
+    printSizes("Raw locations for a %d-minute window of %d devices"
+               % (windowMins, nDevices), len(rawArgs),
+               [("dict objects", getObjectsSize(dictList)),
+                ("slots objects", getObjectsSize(slotsList)),
+                ("LocationArray", locArray.nbytes())])
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(prog='memoryBenchmark')
+    parser.add_argument("-g", "--gtfs-db-file", dest="dbfileloc",
+                        default=None,
+                        metavar="GTFS_DB_FILE",
+                        help="path to GTFS data (in sqlite3 db format); the feed is skipped if not given")
+    parser.add_argument("-n", "--n-devices", dest="ndevices", type=int,
+                        default=500,
+                        help="number of devices in the fleet window")
+    parser.add_argument("-i", "--interval", dest="interval", type=int,
+                        default=10,
+                        help="seconds between locations from a device")
+
+    args = parser.parse_args()
+
+    if args.dbfileloc is not None:
+        benchmarkFeed(args.dbfileloc)
+    benchmarkFleetWindow(args.ndevices, args.interval)
@@ -5,6 +5,7 @@ Created on Sep 2, 2013
 '''
 
 from pygtfs.gtfsData import GtfsData
+from pygtfs.feedRouter import FeedRouter
 from argparse import ArgumentParser
 import logging
 import time
@@ -12,6 +13,7 @@ from datetime import datetime
 from dateutil.relativedelta import relativedelta
 import os
 from tripClassifier import TripClassifier
+from gtfsRebuild import GtfsRebuild
 import sqlite3
 from rawLocation import rawLocation
 import pickle as pickle
@@ -31,23 +33,55 @@ class Predictor(object):
     '''
 
 
-    def __init__(self, agency, loggerName, dbFileLoc):
+    def __init__(self, agency, loggerName, dbFileLoc,
+                 snapshotFileLoc='gtfs.snapshot.npz', lazy=False, gtfsDir=None,
+                 jointAssignment=False):
         '''
         Constructor
+        
+        snapshotFileLoc -- where to keep the GtfsData snapshot used for fast
+                           restarts (None to always load from dbFileLoc).
+        lazy -- load schedule data one service day at a time (see GtfsData).
+        gtfsDir -- optional directory of dated feeds (see FeedRouter) to use
+                   in place of dbFileLoc; the feed follows the time of the
+                   incoming locations, and snapshots are kept next to the
+                   feeds unless snapshotFileLoc is None. The feed of the
+                   next service day is loaded in the background ahead of
+                   time (see checkPreload).
+        jointAssignment -- choose blocks for all unassigned devices at once
+                           (see TripClassifier).
         '''
         
+        self.agency = agency
+        self.lazy = lazy
+        self.jointAssignment = jointAssignment
+        self.loggerName = loggerName
         self.logger = logging.getLogger(loggerName)
-        self.logger.info("Attempting to load GtfsData from pickle.")
-        try:
-            with open('temp.pickle','r') as f:
-                self.gtfsData = pickle.load(f)
-        except:
-            self.logger.info("Failed to load GtfsData from pickle. Loading from dbfile.")
-            self.gtfsData = GtfsData(agency, dbFileLoc)
-            with open('temp.pickle','wb') as f:
-                pickle.dump(self.gtfsData, f)
+        
+        # GtfsRebuild in progress, see rebuildGtfsData
+        self.rebuild = None
+        
+        # feed index of the GtfsData in use, and (feed index, GtfsRebuild)
+        # of the last feed loaded ahead of time, see routeFeed
+        self.feedIndex = None
+        self.preload = None
+        
+        if gtfsDir is not None:
+            snapshotDir = None
+            if snapshotFileLoc is not None:
+                snapshotDir = gtfsDir
+            self.feedRouter = FeedRouter(agency, gtfsDir, loggerName,
+                                         snapshotDir=snapshotDir, lazy=lazy)
+            # set up by the first location, see routeFeed
+            self.gtfsData = None
+            self.tripClassifier = None
+        else:
+            self.feedRouter = None
+            self.gtfsData = GtfsData(agency, dbFileLoc,
+                                     snapshotFileLoc=snapshotFileLoc, lazy=lazy)
             
-        self.tripClassifier = TripClassifier(self.gtfsData, loggerName)
+            self.tripClassifier = TripClassifier(self.gtfsData, loggerName,
+                                                 jointAssignment)
         
         self.time = 0
         
@@ -63,6 +97,10 @@ class Predictor(object):
         self.logger.debug("Received message %d." % self.count)
         if (self.count % 1000 == 0):
             self.logger.info("Received message %d." % self.count)
+        if self.rebuild is not None:
+            self.checkRebuild()
+        if self.feedRouter is not None:
+            self.routeFeed(max(self.time, rawLocation.ts))
         self.tripClassifier.newRawLocation(rawLocation)
         newTime = rawLocation.ts
         
@@ -70,6 +108,135 @@ class Predictor(object):
         self.updateTime(newTime)
         
                 
+    def routeFeed(self, time):
+        '''
+        Switch to the feed for the given time, if it is not the one in use,
+        and start loading the feed of the next service day if that is
+        another one (see checkPreload).
+        '''
+        feedIndex = self.feedRouter.getFeedIndexForTime(time)
+        if (feedIndex != self.feedIndex):
+            if (self.preload is not None and self.preload[0] == feedIndex and
+                self.preload[1] is not None):
+                # not ready in time: wait for it rather than load it again
+                self.preload[1].wait()
+                self.takePreload()
+            
+            gtfsData = self.feedRouter.getGtfsDataForTime(time)
+            self.logger.info("Switching to feed %s" % gtfsData.dbFileLoc)
+            self.feedIndex = feedIndex
+            self.swapGtfsData(gtfsData)
+        
+        self.checkPreload(time)
+        
+        
+    def checkPreload(self, time):
+        '''
+        Hand a finished preload over to the FeedRouter, or start loading
+        the feed of the service day after that of the given time in the
+        background (see GtfsRebuild), if it is another feed and not loaded
+        yet, so that it is ready when that day comes.
+        '''
+        if (self.preload is not None and self.preload[1] is not None):
+            if self.preload[1].isDone():
+                self.takePreload()
+            return
+        
+        nextDateOrd = self.feedRouter.serviceDays.getDateOrdinal(time) + 1
+        nextIndex = self.feedRouter.getFeedIndexForDateOrdinal(nextDateOrd)
+        if (nextIndex == self.feedIndex or self.feedRouter.hasGtfsData(nextIndex) or
+            (self.preload is not None and self.preload[0] == nextIndex)):
+            return
+        
+        dbFileLoc = self.feedRouter.feedList[nextIndex][1]
+        self.logger.info("Preloading feed %s" % dbFileLoc)
+        nextDayFirst = self.feedRouter.serviceDays.getDay(nextDateOrd)[0]
+        self.preload = (nextIndex,
+                        GtfsRebuild(self.agency, dbFileLoc,
+                                    self.feedRouter.getSnapshotFileLoc(nextIndex),
+                                    self.loggerName, self.lazy,
+                                    preloadTime=nextDayFirst))
+        
+        
+    def takePreload(self):
+        # give the preloaded GtfsData to the FeedRouter (the preload is kept
+        # as done, so that a failed one is not tried again)
+        feedIndex, rebuild = self.preload
+        self.preload = (feedIndex, None)
+        gtfsData = rebuild.getGtfsData()
+        if gtfsData is None:
+            self.logger.error("Preload of %s failed. Loading it when needed."
+                              % rebuild.dbFileLoc)
+            return
+        self.feedRouter.addGtfsData(feedIndex, gtfsData)
+        
+        
+    def rebuildGtfsData(self, dbFileLoc, snapshotFileLoc=None):
+        '''
+        Start building the GtfsData of a new feed in the background (see
+        GtfsRebuild). Locations keep being handled with the current
+        GtfsData, and the new one is swapped in between messages once it
+        is ready.
+        
+        snapshotFileLoc -- where the rebuild writes its snapshot (by default
+                           next to dbFileLoc).
+        '''
+        if self.feedRouter is not None:
+            raise Exception('Feeds are chosen by the FeedRouter')
+        if self.rebuild is not None:
+            raise Exception('A rebuild of %s is in progress' % self.rebuild.dbFileLoc)
+        
+        if snapshotFileLoc is None:
+            snapshotFileLoc = os.path.splitext(dbFileLoc)[0] + '.snapshot.npz'
+        
+        self.logger.info("Rebuilding GtfsData from %s" % dbFileLoc)
+        self.rebuild = GtfsRebuild(self.agency, dbFileLoc, snapshotFileLoc,
+                                   self.loggerName, self.lazy,
+                                   preloadTime=self.time if self.time > 0 else None)
+        
+        
+    def checkRebuild(self):
+        # swap in the rebuilt GtfsData, if it is ready
+        if not self.rebuild.isDone():
+            return
+        
+        rebuild = self.rebuild
+        self.rebuild = None
+        gtfsData = rebuild.getGtfsData()
+        if gtfsData is None:
+            self.logger.error("Rebuild of %s failed. Keeping the current GtfsData." 
+                              % rebuild.dbFileLoc)
+            return
+        
+        self.logger.info("Swapping in GtfsData from %s" % rebuild.dbFileLoc)
+        self.swapGtfsData(gtfsData)
+        
+        
+    def swapGtfsData(self, gtfsData):
+        '''
+        Start using gtfsData in place of the current GtfsData, with a new
+        TripClassifier. Location buckets carry over, and so do assignments
+        to trips that are in gtfsData. Candidate blocks are not worked out
+        here: each device's are, with gtfsData, on its next location (see
+        TripClassifier.newRawLocation) or at the next assignment round,
+        whichever comes first, so the swap does not hold up the messages.
+        '''
+        tripClassifier = TripClassifier(gtfsData, self.loggerName,
+                                        self.jointAssignment)
+        oldClassifier = self.tripClassifier
+        if oldClassifier is not None:
+            tripClassifier.tripDistances.locationBuckets = \
+                oldClassifier.tripDistances.locationBuckets
+            tripClassifier.manualBlocks = oldClassifier.manualBlocks
+            if (self.time > 0):
+                tripClassifier.updateTime(self.time)
+            tripClassifier.assignedTrips.remapAssignments(
+                oldClassifier.assignedTrips)
+        
+        self.gtfsData = gtfsData
+        self.tripClassifier = tripClassifier
+        
+        
     def updateTime(self, newTime):
         self.time = max(self.time, newTime)
         self.tripClassifier.updateTime(self.time)
@@ -98,15 +265,21 @@ if __name__ == "__main__":
                         help="log level of Predictor (one of CRITICAL, ERROR, WARNING, INFO, or DEBUG)",
                         choices=('CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG'))
     parser.add_argument("-g", "--gtfs-db-file", dest="dbfileloc", 
-                        required=True,
+                        default=None,
                         metavar="GTFS_DB_FILE",
                         help="path to GTFS data (in sqlite3 db format)")
+    parser.add_argument("-G", "--gtfs-dir", dest="gtfsdir",
+                        default=None,
+                        metavar="GTFS_DIR",
+                        help="directory of dated GTFS feeds (AGENCY_YYMMDD.db), used in place of GTFS_DB_FILE")
     parser.add_argument("-e", "-events-db-file", dest = "events_db",
                         required=True,
                         metavar="EVENTS_DB_FILE",
                         help="path to events data (in sqlite3 db format)")
     
     args = parser.parse_args()
+    if (args.dbfileloc is None and args.gtfsdir is None):
+        parser.error("one of GTFS_DB_FILE or GTFS_DIR is required")
         
     loggerName = '%s_assigner' % (args.agency)
     
@@ -123,7 +296,8 @@ if __name__ == "__main__":
         logging.basicConfig(format='%(asctime)s [%(module)s.%(funcName)s] %(message)s',
                             level=logLevel)
         
-    myPredictor = Predictor(args.agency, loggerName, args.dbfileloc)
+    myPredictor = Predictor(args.agency, loggerName, args.dbfileloc,
+                            gtfsDir=args.gtfsdir)
 
     ## LocationManager CLASS NEEDS TO BE IMPLEMENTED ##
     # Basically, all it needs to call the newRawLocation method of myPredictor
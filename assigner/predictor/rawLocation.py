@@ -1,5 +1,8 @@
 
 class rawLocation(object):
+	__slots__ = ('deviceId', 'ts', 'lat', 'lon', 'spd', 'bearing', 'accuracy',
+	             'driver_id', 'bus_id', 'dt')
+
 	def __init__(self, device_id, time, lat, lon, spd=None, bearing=None, accuracy=None, driver_id=None, bus_id=None, dt=None):
 		self.deviceId = device_id
 		self.ts = time
@@ -5,6 +5,8 @@ Created on Sep 8, 2013
 '''
 from tripDistances import TripDistances
 from assignedTrips import AssignedTrips
+from scipy.optimize import linear_sum_assignment
+import numpy
 import logging
 import pprint
 
@@ -14,11 +16,16 @@ class TripClassifier(object):
     '''
 
 
-    def __init__(self, gtfsData, loggerName):
+    def __init__(self, gtfsData, loggerName, jointAssignment=False):
         '''
         Constructor
+        
+        jointAssignment -- choose blocks for all unassigned devices at once
+                           (see chooseBlocksJointly) rather than one device
+                           at a time (see chooseObviousBlock).
         '''
         self.gtfsData = gtfsData
+        self.jointAssignment = jointAssignment
         
         self.tripDistances = TripDistances(self.gtfsData, loggerName)
         self.assignedTrips = AssignedTrips(self.gtfsData, loggerName,
@@ -34,6 +41,11 @@ class TripClassifier(object):
     def newRawLocation(self, loc):
         deviceId = loc.deviceId
         self.tripDistances.addLocation(loc)
+        if (deviceId not in self.tripDistances.candidateBlocks and
+            self.assignedTrips.isDeviceAssigned(deviceId)):
+            # an assignment carried over from another GtfsData (see
+            # Predictor.swapGtfsData), to check against the new blocks
+            self.tripDistances.checkBucketAgainstAllBlocks(deviceId)
         self.assignedTrips.newRawLocation(loc)
 #         if self.assignedTrips.isDeviceAssigned(deviceId):
 #             # Check for end of trip.
@@ -44,16 +56,15 @@ class TripClassifier(object):
         # Look over the other devices, and see if this block is more 
         # likely for this device than for other devices. This helps
         # to prevent early-morning confusion.
+        # Only the devices with this block among their candidates can
+        # count, so look those up rather than going over all devices.
         probMaxOther = 0.0
-        for otherId in self.tripDistances.locationBuckets:
+        otherProbDict = self.tripDistances.getCandidateProbsForBlock(block.blockId)
+        for otherId, otherProb in otherProbDict.iteritems():
             if (otherId != deviceId and 
-                not self.assignedTrips.isDeviceAssigned(otherId)):
-                otherProb = [x['prob'] for x in
-                            self.tripDistances.candidateBlocks[otherId]
-                            if x['block'] == block]
-                if (otherProb is not None and len(otherProb) > 0 
-                    and otherProb[0] > probMaxOther):
-                    probMaxOther = otherProb[0]
+                not self.assignedTrips.isDeviceAssigned(otherId) and
+                otherProb > probMaxOther):
+                probMaxOther = otherProb
         return probMaxOther
       
       
@@ -83,9 +94,10 @@ class TripClassifier(object):
             prob0 = possibilities[0]['prob']
             prob1 = 0.
             # get next best unassigned trip:
+            assignedBlockIds = self.assignedTrips.getAssignedBlockIds()
             for otherBlockDict in possibilities[1:]:
                 block = otherBlockDict['block']
-                if (block not in self.assignedTrips.getAssignedBlocks()):
+                if (block.blockId not in assignedBlockIds):
                     prob1 = otherBlockDict['prob']
             
             probMaxOther = self.getMaxOtherProb(possibilities[0]['block'], 
@@ -124,10 +136,80 @@ class TripClassifier(object):
         return None, None
     
     
+    def chooseBlocksJointly(self, deviceIdList):
+        '''
+        Choose blocks for the given unassigned devices together: match
+        devices to their candidate blocks (other than blocks already
+        assigned) with the highest total probability, as a linear
+        assignment problem. A match is kept if it passes the gates of
+        chooseObviousBlock, measured against what the matching leaves open:
+        the best other block of the device not matched to another device,
+        and the best probability of the block for another unassigned
+        device left without a match.
+        
+        Return a dictionary from deviceId to (block, postKm).
+        '''
+        assignedBlockIds = self.assignedTrips.getAssignedBlockIds()
+        
+        blockList = []
+        blockIndexDict = {}
+        candidateDictDict = {}
+        for d, deviceId in enumerate(deviceIdList):
+            for candidateDict in self.tripDistances.candidateBlocks[deviceId]:
+                blockId = candidateDict['block'].blockId
+                if blockId in assignedBlockIds:
+                    continue
+                if blockId not in blockIndexDict:
+                    blockIndexDict[blockId] = len(blockList)
+                    blockList.append(candidateDict['block'])
+                candidateDictDict.setdefault((d, blockIndexDict[blockId]),
+                                             candidateDict)
+        
+        if (len(blockList) == 0):
+            return {}
+        
+        # devices x blocks, 0 where the block isn't a candidate
+        probMatrix = numpy.zeros((len(deviceIdList), len(blockList)))
+        for (d, b), candidateDict in candidateDictDict.iteritems():
+            probMatrix[d, b] = candidateDict['prob']
+        
+        rows, cols = linear_sum_assignment(-probMatrix)
+        matchList = [(d, b) for d, b in zip(rows, cols) if probMatrix[d, b] > 0]
+        matchedDeviceIds = set(deviceIdList[d] for d, b in matchList)
+        matchedBlocks = set(b for d, b in matchList)
+        
+        choiceDict = {}
+        for d, b in matchList:
+            deviceId = deviceIdList[d]
+            probThis = probMatrix[d, b]
+            
+            isOpen = numpy.ones(len(blockList), dtype=bool)
+            isOpen[list(matchedBlocks)] = False
+            probNext = probMatrix[d, isOpen].max() if isOpen.any() else 0.
+            
+            probMaxOther = 0.0
+            otherProbDict = self.tripDistances.getCandidateProbsForBlock(
+                blockList[b].blockId)
+            for otherId, otherProb in otherProbDict.iteritems():
+                if (otherId != deviceId and otherId not in matchedDeviceIds and
+                    not self.assignedTrips.isDeviceAssigned(otherId) and
+                    otherProb > probMaxOther):
+                    probMaxOther = otherProb
+            
+            if (probThis - probNext > 0.25 and probThis - probMaxOther > 0.25):
+                choiceDict[deviceId] = (blockList[b],
+                                        candidateDictDict[(d, b)]['postKm'])
+        
+        return choiceDict
+    
+    
     def checkAllUnassignedForObviousBlocks(self):
         # Generate the list of trip distances
         self.tripDistances.checkAllBucketsBlind()
         
+        # devices left for chooseBlocksJointly
+        jointDeviceIdList = []
+        
         # for all devices:
         for deviceId in self.tripDistances.locationBuckets:
             if self.assignedTrips.isDeviceAssigned(deviceId):
@@ -147,6 +229,9 @@ class TripClassifier(object):
                                                                         self.time,
                                                                         trip, post)
                     
+                elif self.jointAssignment:
+                    jointDeviceIdList.append(deviceId)
+                    
                 else:
                     # No manual assignment. See if there's an obvious best block.
                     block, post = self.chooseObviousBlock(deviceId)
@@ -157,6 +242,18 @@ class TripClassifier(object):
                                                                         trip,
                                                                         block, 
                                                                         post)
+        
+        if (len(jointDeviceIdList) > 0):
+            choiceDict = self.chooseBlocksJointly(jointDeviceIdList)
+            for deviceId in jointDeviceIdList:
+                if deviceId in choiceDict:
+                    block, post = choiceDict[deviceId]
+                    trip = self.tripDistances.getBestTrip(deviceId, block)
+                    self.assignedTrips.assignUnassignedTripToDevice(deviceId,
+                                                                    self.time,
+                                                                    trip,
+                                                                    block,
+                                                                    post)
     
     
     def updateTime(self, time):
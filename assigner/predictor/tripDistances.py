@@ -4,6 +4,7 @@ Created on Sep 8, 2013
 @author: jacob
 '''
 from pygtfs.locationBucket import LocationBucket
+from pygtfs.pointGrid import PointGrid
 from pygtfs.util import kmBetweenLatLonPair
 from util import probGivenDeviation
 import math
@@ -18,17 +19,30 @@ class TripDistances(object):
     '''
 
 
-    def __init__(self, gtfsData, loggerName):
+    def __init__(self, gtfsData, loggerName, vectorized=True, prefilterKm=10.0):
         '''
         Constructor
+        
+        vectorized -- score candidate blocks with scoreBucketAgainstBlocks
+                      (all blocks at once) rather than avgMillisFromBlock
+                      (one block and location at a time); the results are
+                      the same.
+        prefilterKm -- only score a device against the blocks scheduled to
+                       be within this distance of its latest location (see
+                       getNearbyBlocks), or None to score all of them.
         '''
         self.gtfsData = gtfsData
+        self.vectorized = vectorized
+        self.prefilterKm = prefilterKm
         
         self.logger = logging.getLogger(loggerName)
         
         self.locationBuckets = {}
         # self.candidateTrips = {}
         self.candidateBlocks = {}
+        # Inverted candidateBlocks: blockId -> {deviceId: prob}, for the
+        # devices with the block among their candidates.
+        self.blockCandidateDict = {}
         self.time = 0
         self.daystart = 0
 
@@ -42,6 +56,18 @@ class TripDistances(object):
         # Always consider locations from the last 10 minutes
         self.ageMillis = 1000*60*10
         
+        # Per device, for scoreBucketAgainstBlocks: the block x location
+        # distances already worked out (see getCachedDistances), and the
+        # projections of the locations onto shapes, as
+        # {timestamp: {shapeId: (postKm, perpKm)}}.
+        self.scoreCacheDict = {}
+        self.projCacheDict = {}
+        
+        # For getNearbyBlocks: the grid of the scheduled block positions,
+        # and the (time, blocks) it was built for.
+        self.blockGrid = None
+        self.blockGridKey = None
+        
         
     def addLocation(self, loc):
         if (loc.deviceId not in self.locationBuckets):
@@ -59,8 +85,16 @@ class TripDistances(object):
         candidateBlocks = []
         self.logger.debug("Generating candidate blocks for device %s." % (deviceId))
         avgMillisMin = 4*60*60*1000
-        for block in self.gtfsData.getTodayBlocks(self.time):
-            avgMillis, postKm = self.avgMillisFromBlock(deviceId, block)
+        todayBlocks = self.gtfsData.getTodayBlocks(self.time)
+        if self.prefilterKm is not None:
+            todayBlocks = self.getNearbyBlocks(deviceId, todayBlocks)
+        if self.vectorized:
+            scoreList = self.scoreBucketAgainstBlocks(deviceId, todayBlocks)
+        else:
+            projDict = self.projectBucketToBlocks(deviceId, todayBlocks)
+            scoreList = [self.avgMillisFromBlock(deviceId, block, projDict)
+                         for block in todayBlocks]
+        for block, (avgMillis, postKm) in zip(todayBlocks, scoreList):
             # print block
             # print avgMillis
             if (avgMillis < avgMillisMin):
@@ -76,12 +110,144 @@ class TripDistances(object):
                 candidateDict['prob'] = probGivenDeviation(avgMillis)
                 candidateBlocks.append(candidateDict)
                     
+        self.indexCandidateBlocks(deviceId, candidateBlocks)
         self.candidateBlocks[deviceId] = candidateBlocks
         printList = sorted(candidateBlocks, key=lambda k: k['prob'])
         self.logger.debug(pprint.pformat(printList))
     
 
-    def avgMillisFromBlock(self, deviceId, block):
+    def indexCandidateBlocks(self, deviceId, candidateBlocks):
+        # replace the device's entries in blockCandidateDict
+        for candidateDict in self.candidateBlocks.get(deviceId, []):
+            blockId = candidateDict['block'].blockId
+            deviceProbDict = self.blockCandidateDict.get(blockId)
+            if deviceProbDict is not None:
+                deviceProbDict.pop(deviceId, None)
+                if (len(deviceProbDict) == 0):
+                    del self.blockCandidateDict[blockId]
+        
+        for candidateDict in candidateBlocks:
+            deviceProbDict = self.blockCandidateDict.setdefault(
+                candidateDict['block'].blockId, {})
+            deviceProbDict.setdefault(deviceId, candidateDict['prob'])
+    
+    
+    def getCandidateProbsForBlock(self, blockId):
+        '''
+        Return a dictionary from deviceId to the probability of the block,
+        for the devices with the block among their candidates.
+        '''
+        return self.blockCandidateDict.get(blockId, {})
+    
+    
+    def getNearbyBlocks(self, deviceId, blockList):
+        '''
+        Return the blocks of blockList (in the same order) scheduled to be
+        within prefilterKm of the latest location of the device, along with
+        the blocks it was a candidate for last time, so that a bus running
+        late isn't dropped once it falls out of range of its own schedule.
+        Blocks with no scheduled position are always kept. If no block is
+        near, return all of them.
+        '''
+        locList = self.locationBuckets[deviceId].getRecent(self.ageMillis)
+        if len(locList) == 0:
+            return blockList
+        lastLoc = locList[-1]
+        
+        grid, blockIdList, unplacedSet = self.getBlockGrid(blockList)
+        
+        nearSet = set(unplacedSet)
+        if grid is not None:
+            for i in grid.getPointsWithin(lastLoc.lat, lastLoc.lon,
+                                          self.prefilterKm):
+                nearSet.add(blockIdList[i])
+        if (len(nearSet) == 0):
+            return blockList
+        
+        for candidateDict in self.candidateBlocks.get(deviceId, []):
+            nearSet.add(candidateDict['block'].blockId)
+        
+        return tuple(block for block in blockList if block.blockId in nearSet)
+    
+    
+    def getBlockGrid(self, blockList):
+        '''
+        Return a PointGrid of the scheduled positions of the given blocks at
+        the current time (None if none of them has one), the list of the
+        block ids of its points, and the set of ids of the blocks with no
+        scheduled position. Built once per time.
+        '''
+        key = (self.time, self.daystart, blockList)
+        if (self.blockGridKey == key):
+            return self.blockGrid
+        
+        tRelMillis = self.time - self.daystart
+        blockIdList = []
+        latList = []
+        lonList = []
+        unplacedSet = set()
+        for block in blockList:
+            trip = block.getTripForTime(tRelMillis)
+            # (the timeline has the stop times as arrays, see TripTimeline)
+            timeline = self.gtfsData.getTripTimeline(trip)
+            # before its first trip a block waits at the first stop, and
+            # after its last trip at the last stop
+            tripMillis = max(tRelMillis, timeline.arrList[0])
+            if not timeline.hasNext:
+                tripMillis = min(tripMillis, timeline.depList[-1])
+            latLon = timeline.getLatLonAtTime(tripMillis)
+            if latLon is None:
+                unplacedSet.add(block.blockId)
+            else:
+                blockIdList.append(block.blockId)
+                latList.append(latLon[0])
+                lonList.append(latLon[1])
+        
+        grid = None
+        if len(blockIdList) > 0:
+            grid = PointGrid(latList, lonList, self.prefilterKm)
+        
+        self.blockGridKey = key
+        self.blockGrid = (grid, blockIdList, unplacedSet)
+        return self.blockGrid
+    
+
+    def projectBucketToBlocks(self, deviceId, blockList):
+        '''
+        Project the recent locations of a device onto the shapes of the
+        trips the given blocks are scheduled to run at those times, in one
+        batch.
+
+        Return a dictionary mapping (timestamp, shapeId) to (postKm, perpKm).
+        '''
+        locList = self.locationBuckets[deviceId].getRecent(self.ageMillis)
+        if len(locList) <= 1:
+            # avgMillisFromBlock won't use any projections
+            return {}
+
+        timeArray = numpy.array([loc.ts for loc in locList]) - self.daystart
+
+        pairSet = set()
+        for block in blockList:
+            tripList = block.getTripList()
+            tripIndices = block.getTripIndicesForTimes(timeArray)
+            for loc, i in zip(locList, tripIndices):
+                pairSet.add((loc, tripList[i].shapeId))
+
+        pairList = list(pairSet)
+        postKm, perpKm, latProj, lonProj = \
+            self.gtfsData.projectManyToShapes([loc.lat for loc, shapeId in pairList],
+                                              [loc.lon for loc, shapeId in pairList],
+                                              [shapeId for loc, shapeId in pairList])
+
+        projDict = {}
+        for i, (loc, shapeId) in enumerate(pairList):
+            projDict[(loc.ts, shapeId)] = (float(postKm[i]), float(perpKm[i]))
+
+        return projDict
+
+
+    def avgMillisFromBlock(self, deviceId, block, projDict=None):
         locList = self.locationBuckets[deviceId].getRecent(self.ageMillis)
         
         distSeries = []
@@ -129,9 +295,12 @@ class TripDistances(object):
             shape = self.gtfsData.getShapeFromShapeId(trip.shapeId)
             totalPost = shape.pointList[-1]['post']
 
-            projLoc = self.gtfsData.projectToShape(shape, loc)
-            postKm = projLoc.postKm
-            perpKm = projLoc.perpKm
+            if projDict is not None and (loc.ts, trip.shapeId) in projDict:
+                postKm, perpKm = projDict[(loc.ts, trip.shapeId)]
+            else:
+                projLoc = self.gtfsData.projectToShape(shape, loc)
+                postKm = projLoc.postKm
+                perpKm = projLoc.perpKm
 
             postDist = abs(postTrip - postKm)
             # "half-circle fix' : if we've passed slightly into the next trip,
@@ -179,92 +348,259 @@ class TripDistances(object):
         return avgMillis, finalPost
         
     
+    def scoreBucketAgainstBlocks(self, deviceId, blockList):
+        '''
+        Vectorized avgMillisFromBlock: score the recent locations of a
+        device against all of the given blocks at once, as a matrix of
+        distances with a row per block and a column per location. Only the
+        distances of locations new since the last call are worked out
+        (see getCachedDistances).
+        
+        Return a list of (avgMillis, postKm), one per block.
+        '''
+        locList = self.locationBuckets[deviceId].getRecent(self.ageMillis)
+        
+        if len(locList) <= 1:
+            # Return arbitrary large deviation if we have few
+            # location in the bucket.
+            return [(4*60*60*1000, 0.0)]*len(blockList)
+        if len(blockList) == 0:
+            return []
+        
+        timeArray = numpy.array([loc.ts for loc in locList], dtype=numpy.int64)
+        distMatrix, postMatrix = self.getCachedDistances(deviceId, locList,
+                                                         timeArray, blockList)
+        timeSeries = timeArray.astype(float)
+        
+        totTime = float(locList[-1].ts - locList[0].ts)
+        increaseFactor = (float(self.ageMillis)/totTime)**2.0
+        
+        dInt = integrate.simps(distMatrix, timeSeries, axis=1)
+        dWeight = 1.0
+        
+        distAvg = numpy.mean(distMatrix, axis=1)
+        distSeriesNorm = numpy.absolute(distMatrix - distAvg[:, numpy.newaxis])
+        
+        fInt = integrate.simps(distSeriesNorm, timeSeries, axis=1)
+        fWeight = 6.0
+        
+        avgMillis = (dWeight*dInt + fWeight*fInt)/totTime*increaseFactor
+        return zip(avgMillis.tolist(), postMatrix[:, -1].tolist())
+        
+        
+    def getCachedDistances(self, deviceId, locList, timeArray, blockList):
+        '''
+        Return the distance and postKm matrices (block x location, see
+        getDistanceMatrix) for the given locations of a device. The rows
+        of blocks and columns of locations seen in the last call are
+        reused, so that only new locations (and blocks) are worked out; the
+        cache starts over when the daystart changes. The Simpson integrals
+        can't be updated this way (they pair up intervals from the start
+        of the window, which moves), but they are cheap next to the
+        distances.
+        '''
+        cache = self.scoreCacheDict.get(deviceId)
+        if (cache is None or cache['daystart'] != self.daystart):
+            cache = {'daystart': self.daystart,
+                     'rowDict': {},
+                     'times': numpy.zeros(0, dtype=numpy.int64),
+                     'dist': numpy.zeros((0, 0)),
+                     'post': numpy.zeros((0, 0))}
+            self.scoreCacheDict[deviceId] = cache
+        
+        rowDict = cache['rowDict']
+        keptIndices = [b for b, block in enumerate(blockList) 
+                       if block.blockId in rowDict]
+        addedIndices = [b for b, block in enumerate(blockList) 
+                        if block.blockId not in rowDict]
+        keptRows = [rowDict[blockList[b].blockId] for b in keptIndices]
+        
+        isCached = numpy.in1d(timeArray, cache['times'])
+        isKept = numpy.in1d(cache['times'], timeArray)
+        if (isCached.all() and isKept.all() and len(addedIndices) == 0 and
+            keptRows == range(len(rowDict))):
+            return cache['dist'], cache['post']
+        
+        # drop the projections of locations that have aged out
+        projCache = self.projCacheDict.setdefault(deviceId, {})
+        for ts in set(projCache) - set(timeArray.tolist()):
+            del projCache[ts]
+        
+        distMatrix = numpy.empty((len(blockList), len(locList)))
+        postMatrix = numpy.empty((len(blockList), len(locList)))
+        
+        if len(keptIndices) > 0:
+            # new columns for the blocks already there
+            keptBlocks = [blockList[b] for b in keptIndices]
+            newLocList = [loc for loc, cached in zip(locList, isCached) if not cached]
+            newDist, newPost = self.getDistanceMatrix(newLocList, keptBlocks,
+                                                      projCache)
+            
+            # Put the columns in time order, as are the locations. (numpy.take
+            # keeps the rows contiguous, which the sums along them depend on
+            # to come out the same to the last bit.)
+            times = numpy.concatenate([cache['times'][isKept], timeArray[~isCached]])
+            order = numpy.argsort(times, kind='mergesort')
+            distMatrix[keptIndices] = numpy.take(
+                numpy.hstack([cache['dist'][keptRows][:, isKept], newDist]),
+                order, axis=1)
+            postMatrix[keptIndices] = numpy.take(
+                numpy.hstack([cache['post'][keptRows][:, isKept], newPost]),
+                order, axis=1)
+        
+        if len(addedIndices) > 0:
+            # all columns for the blocks that are new
+            addedBlocks = [blockList[b] for b in addedIndices]
+            distMatrix[addedIndices], postMatrix[addedIndices] = \
+                self.getDistanceMatrix(locList, addedBlocks, projCache)
+        
+        cache['rowDict'] = dict((block.blockId, b) for b, block in enumerate(blockList))
+        cache['times'] = timeArray
+        cache['dist'] = distMatrix
+        cache['post'] = postMatrix
+        
+        return distMatrix, postMatrix
+        
+        
+    def getDistanceMatrix(self, locList, blockList, projCache=None):
+        '''
+        Return the matrices (block x location) of the distances between the
+        given locations and where the blocks are scheduled to be at those
+        times, and of the postKms of the locations on the shapes of the
+        blocks' trips, as computed one at a time by avgMillisFromBlock.
+        
+        projCache -- optional dictionary of projections already made,
+                     {timestamp: {shapeId: (postKm, perpKm)}}, added to.
+        '''
+        if projCache is None:
+            projCache = {}
+        if len(locList) == 0:
+            return (numpy.zeros((len(blockList), 0)), 
+                    numpy.zeros((len(blockList), 0)))
+        
+        timeArray = numpy.array([loc.ts for loc in locList], dtype=numpy.int64)
+        
+        # The trip each block is on at the time of each location, as an
+        # index into tripList.
+        tripList = []
+        tripIndexDict = {}
+        tripMatrix = numpy.empty((len(blockList), len(locList)), dtype=int)
+        for b, block in enumerate(blockList):
+            blockTripList = block.getTripList()
+            indices = block.getTripIndicesForTimes(timeArray - self.daystart)
+            blockIndices, inverse = numpy.unique(indices, return_inverse=True)
+            for i in blockIndices:
+                trip = blockTripList[i]
+                if trip.tripId not in tripIndexDict:
+                    tripIndexDict[trip.tripId] = len(tripList)
+                    tripList.append(trip)
+            tripIndices = numpy.array([tripIndexDict[blockTripList[i].tripId]
+                                       for i in blockIndices])
+            tripMatrix[b] = tripIndices[inverse]
+        
+        shapeIdList = sorted(set(trip.shapeId for trip in tripList))
+        shapeIndexDict = dict((shapeId, i) for i, shapeId in enumerate(shapeIdList))
+        
+        firstDep = numpy.array([trip.getFirstDepartureMillis() for trip in tripList],
+                               dtype=numpy.int64)[tripMatrix] + self.daystart
+        lastArr = numpy.array([trip.getLastArrivalMillis() for trip in tripList],
+                              dtype=numpy.int64)[tripMatrix] + self.daystart
+        hasNext = numpy.array([self.gtfsData.getNextTripInBlock(trip.tripId) is not None
+                               for trip in tripList])[tripMatrix]
+        totalPost = numpy.array(
+            [self.gtfsData.getShapeFromShapeId(shapeId).postArray[-1]
+             for shapeId in shapeIdList])
+        shapeMatrix = numpy.array([shapeIndexDict[trip.shapeId]
+                                   for trip in tripList])[tripMatrix]
+        
+        # As in avgMillisFromBlock: before the trip, compare with the start
+        # of the trip and add the time to its departure; after it, with
+        # the scheduled position (on the way to the next trip), or if it
+        # is the last trip, with its end plus the time since.
+        times = numpy.broadcast_to(timeArray, tripMatrix.shape)
+        inTrip = (times > firstDep) & (times < lastArr)
+        isBefore = ~inTrip & (times <= firstDep)
+        isAfterLast = ~inTrip & ~isBefore & (times >= lastArr) & ~hasNext
+        postTime = numpy.where(isBefore, firstDep,
+                               numpy.where(isAfterLast, lastArr, times))
+        timeDist = numpy.where(isBefore, firstDep - times,
+                               numpy.where(isAfterLast, times - lastArr, 0))
+        
+        postTrip = numpy.empty(tripMatrix.shape)
+        for i, trip in enumerate(tripList):
+            inTrip = (tripMatrix == i)
+            postTrip[inTrip] = self.getPostmilesAtTimes(postTime[inTrip], trip)
+        
+        # project each location onto each shape it is compared with, once
+        pairKeys = numpy.arange(len(locList))*len(shapeIdList) + shapeMatrix
+        uniqueKeys, pairIndices = numpy.unique(pairKeys, return_inverse=True)
+        pairList = [(locList[key // len(shapeIdList)], 
+                     shapeIdList[key % len(shapeIdList)]) for key in uniqueKeys]
+        
+        newPairList = [(loc, shapeId) for loc, shapeId in pairList
+                       if shapeId not in projCache.get(loc.ts, {})]
+        if len(newPairList) > 0:
+            postKmArray, perpKmArray, latProj, lonProj = \
+                self.gtfsData.projectManyToShapes(
+                    [loc.lat for loc, shapeId in newPairList],
+                    [loc.lon for loc, shapeId in newPairList],
+                    [shapeId for loc, shapeId in newPairList])
+            for (loc, shapeId), postKm, perpKm in zip(newPairList, postKmArray,
+                                                      perpKmArray):
+                projCache.setdefault(loc.ts, {})[shapeId] = (float(postKm),
+                                                             float(perpKm))
+        
+        projArray = numpy.array([projCache[loc.ts][shapeId]
+                                 for loc, shapeId in pairList], dtype=float)
+        postKm = projArray[pairIndices, 0].reshape(tripMatrix.shape)
+        perpKm = projArray[pairIndices, 1].reshape(tripMatrix.shape)
+        
+        # "half-circle fix", see avgMillisFromBlock
+        postDist = numpy.absolute(postTrip - postKm)
+        shapeTotal = totalPost[shapeMatrix]
+        postDist = numpy.where(postDist > shapeTotal/2.0, shapeTotal - postDist,
+                               postDist)
+        
+        # (numpy.power, not **, which squares by multiplying and so can
+        # differ from Python's float power in the last bit)
+        distMatrix = numpy.sqrt(numpy.power(postDist/self.vfid, 2.0) +
+                                numpy.power(timeDist.astype(float), 2.0) +
+                                numpy.power(perpKm/self.vfid_perp, 2.0))
+        
+        return distMatrix, postKm
+        
+        
+    def getPostmilesAtTimes(self, timeArray, trip):
+        '''
+        Vectorized getPostmileAtTime: NaN where it gives None.
+        '''
+        relArray = numpy.asarray(timeArray, dtype=numpy.int64) - self.daystart
+        return self.gtfsData.getTripTimeline(trip).getPostsAtTimes(relArray)
+        
+    
+    def getLocsAtTimes(self, timeArray, trip):
+        '''
+        Vectorized getLocAtTime: arrays of lats and lons, NaN where it
+        gives None.
+        '''
+        relArray = numpy.asarray(timeArray, dtype=numpy.int64) - self.daystart
+        return self.gtfsData.getTripTimeline(trip).getLatLonsAtTimes(relArray)
+        
+    
     def getLocAtTime(self, timeMillis, trip):
+        # Scheduled (lat, lon) of the trip at the given time, moving
+        # linearly between stops (see TripTimeline), or None before the
+        # trip or after the end of its block.
         tRelMillis = timeMillis - self.daystart
-        nextTrip = self.gtfsData.getNextTripInBlock(trip.tripId)
-
-        for i, st in enumerate(trip.stopTimeList):
-            if (tRelMillis >= st.arrTimeMillis and tRelMillis <= st.depTimeMillis):
-                # Should be waiting at the stop
-                stop = self.gtfsData.getStopFromStopId(st.stopId)
-                return stop.stopLat, stop.stopLon
-            
-            if (i+1 < len(trip.stopTimeList)):
-                stNext = trip.stopTimeList[i+1]
-                if (st.depTimeMillis < tRelMillis and tRelMillis < stNext.arrTimeMillis):
-                    # Should be between two stops.
-                    # OVERLY SIMPLIFIED IMPLEMENTATION!
-                    # This function does simple interpolation between adjacent stops.
-                    prevStop = self.gtfsData.getStopFromStopId(st.stopId)
-                    nextStop = self.gtfsData.getStopFromStopId(stNext.stopId)
-                    
-                    pct = (tRelMillis-st.depTimeMillis)/float(stNext.arrTimeMillis-st.depTimeMillis)
-                    
-                    btwLat = prevStop.stopLat + pct*(nextStop.stopLat - prevStop.stopLat)
-                    btwLon = prevStop.stopLon + pct*(nextStop.stopLon - prevStop.stopLon)
-                    
-                    return btwLat, btwLon
-
-            else:
-                # we're beyond the final stop
-                if nextTrip is not None:
-                    stNext = nextTrip.stopTimeList[0]
-                    pct = (tRelMillis-st.depTimeMillis)/float(stNext.arrTimeMillis-st.depTimeMillis)
-
-                    prevStop = self.gtfsData.getStopFromStopId(st.stopId)
-                    nextStop = self.gtfsData.getStopFromStopId(stNext.stopId)
-
-                    btwLat = prevStop.stopLat + pct*(nextStop.stopLat - prevStop.stopLat)
-                    btwLon = prevStop.stopLon + pct*(nextStop.stopLon - prevStop.stopLon)
-                    
-                    return btwLat, btwLon
-
+        return self.gtfsData.getTripTimeline(trip).getLatLonAtTime(tRelMillis)
                 
                 
     def getPostmileAtTime(self, timeMillis, trip):
         # OVERLY SIMPLIFIED IMPLEMENTATION!
-        # This function does simple postmile interpolation between adjacent stops.
-
+        # This function does simple postmile interpolation between adjacent
+        # stops (see TripTimeline).
         tRelMillis = timeMillis - self.daystart
-        
-        shape = self.gtfsData.getShapeFromShapeId(trip.shapeId)
-        nextTrip = self.gtfsData.getNextTripInBlock(trip.tripId)
-        
-        for i, st in enumerate(trip.stopTimeList):
-            if (tRelMillis >= st.arrTimeMillis and tRelMillis <= st.depTimeMillis):
-                # Should be waiting at the stop
-#                print "waiting at stop..."
-#                print tRelMillis, st, st.arrTimeMillis, st.depTimeMillis
-                return st.postKm
-
-            if (i+1 < len(trip.stopTimeList)):
-                stNext = trip.stopTimeList[i+1]
-                if (st.depTimeMillis < tRelMillis and tRelMillis < stNext.arrTimeMillis):
-                    # Should be between two stops.
-                    try:
-                        pct = (tRelMillis-st.depTimeMillis)/float(stNext.arrTimeMillis-st.depTimeMillis)
-                    except:
-                        pct = 0
-
-#                    print "between stops..."
-#                    print st, st.postKm, stNext, stNext.postKm, pct
-                    
-                    return st.postKm + pct*(stNext.postKm - st.postKm)
-            else:
-                # we're beyond the final stop
-                if nextTrip is not None:
-                    stNext = nextTrip.stopTimeList[0]
-                    try:
-                        pct = (tRelMillis-st.depTimeMillis)/float(stNext.arrTimeMillis-st.depTimeMillis)
-                    except:
-                        pct=0
-
-                    nextPost = stNext.postKm + shape.pointList[-1]['post']
-
-#                    print "beyond final stop..."
-#                    print st, st.postKm, stNext, nextPost, pct
-                    
-                    return st.postKm + pct*(nextPost - st.postKm)
+        return self.gtfsData.getTripTimeline(trip).getPostAtTime(tRelMillis)
 
                 
             
@@ -3,6 +3,8 @@ Created on Sep 2, 2013
 
 @author: jacob
 '''
+import bisect
+import numpy as np
 
 class Block(object):
 
@@ -14,6 +16,13 @@ class Block(object):
         # serviceId corresponds to "calendar" information
         self.serviceId = serviceId
         
+        # Trips sorted by first departure, with their first departures (in
+        # millis since daystart) as a list and an array. Built on demand and
+        # invalidated by addTrip.
+        self.tripList = None
+        self.firstDepList = None
+        self.firstDepArray = None
+        
         
     def __eq__(self, other):
         return self.blockId == other.blockId
@@ -30,45 +39,52 @@ class Block(object):
     def addTrip(self, trip):
         if (trip.tripId not in self.tripDict):
             self.tripDict[trip.tripId] = trip
+            self.tripList = None
+
+
+    def buildTripList(self):
+        self.tripList = self.tripDict.values()
+        self.tripList.sort()
+        
+        self.firstDepList = [trip.getFirstDepartureMillis() for trip in self.tripList]
+        self.firstDepArray = np.array(self.firstDepList)
+
+
+    def getTripList(self):
+        if self.tripList is None:
+            self.buildTripList()
+        
+        return self.tripList
 
 
     def getTripForTime(self, millisSinceDaystart):
-        # handle edge cases (time before first trip or after last trip)
-        firstTrip = self.getFirstTrip()
-        firstTripStart = firstTrip.getFirstDepartureMillis()
+        # The trip is the last one departing at or before the given time;
+        # times before the first trip map to the first trip.
+        if self.tripList is None:
+            self.buildTripList()
+        
+        i = bisect.bisect_right(self.firstDepList, millisSinceDaystart) - 1
+        
+        return self.tripList[max(i, 0)]
+
+
+    def getTripIndicesForTimes(self, millisSinceDaystart):
+        '''
+        Vectorized getTripForTime: return an array of indices into
+        getTripList() for an array of times.
+        '''
+        if self.tripList is None:
+            self.buildTripList()
+        
+        indices = np.searchsorted(self.firstDepArray, millisSinceDaystart,
+                                  side='right') - 1
         
-        if (millisSinceDaystart < firstTripStart):
-            return firstTrip
-
-        lastTrip = self.getLastTrip()
-        lastTripStart = lastTrip.getFirstDepartureMillis()
-
-        if (millisSinceDaystart >= lastTripStart):
-            return lastTrip
-
-        # now handle intermediate trips
-        tripList = self.tripDict.values()
-        tripList.sort()
-
-        for i, trip in enumerate(tripList):
-            if (i < len(tripList) - 1):
-                firstDep = trip.getFirstDepartureMillis()
-                firstDepNext = tripList[i+1].getFirstDepartureMillis()
-                if (millisSinceDaystart >= firstDep and millisSinceDaystart < firstDepNext):
-                    return trip
-                
-        return None
+        return np.maximum(indices, 0)
         
 
     def getFirstTrip(self):
-        tripList = self.tripDict.values()
-        tripList.sort()
-            
-        return tripList[0]
+        return self.getTripList()[0]
 
 
     def getLastTrip(self):
-        tripList = self.tripDict.values()
-        tripList.sort()
-            
-        return tripList[-1]
+        return self.getTripList()[-1]
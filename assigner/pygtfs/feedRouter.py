@@ -0,0 +1,177 @@
+'''
+Created on Oct 18, 2026
+'''
+from pygtfs.gtfsData import GtfsData
+from pygtfs.gtfsDbManager import GtfsDbManager
+from pygtfs.localDays import LocalDays
+from collections import OrderedDict
+from datetime import datetime
+import bisect
+import logging
+import os
+import re
+
+
+def getFeedFileList(gtfsDir, agency):
+    '''
+    Return a list of (publish date ordinal, path) for the feeds in gtfsDir,
+    named <agency>_YYMMDD.db, sorted by publish date.
+    '''
+    fileFmt = "^" + re.escape(agency) + "_([0-9]{6})\.db$"
+
+    feedList = []
+    for fileName in os.listdir(gtfsDir):
+        match = re.match(fileFmt, fileName)
+        if match:
+            publishOrd = datetime.strptime(match.group(1), "%y%m%d").toordinal()
+            feedList.append((publishOrd, os.path.join(gtfsDir, fileName)))
+
+    feedList.sort()
+    return feedList
+
+
+class FeedRouter(object):
+    '''
+    Routes times to the GTFS feed in effect on their service date, for a
+    directory of feeds published over time (<agency>_YYMMDD.db).
+
+    Only the calendars of the feeds are read up front, to index each
+    service date to one feed: of the feeds with a service running on that
+    date, the latest published on or before it (or, failing that, the
+    earliest published). Dates without service go to the feed in effect
+    by publish date. The GtfsData of a feed is loaded the first time
+    it is needed, unless it was loaded ahead of time and handed over with
+    addGtfsData (see Predictor.checkPreload), and at most maxFeeds of them
+    are kept, dropping the least recently used.
+    '''
+
+
+    def __init__(self, agency, gtfsDir, loggerName=None, maxFeeds=2,
+                 snapshotDir=None, lazy=False):
+        '''
+        Constructor
+
+        maxFeeds -- number of loaded feeds to keep (2 covers the days on
+                    either side of a schedule change).
+        snapshotDir -- optional directory for the snapshots of the feeds
+                       (see GtfsData).
+        lazy -- load each feed in lazy mode (see GtfsData).
+        '''
+        if loggerName is not None:
+            self.loggerName = loggerName
+        else:
+            self.loggerName = "feedRouter"
+        self.logger = logging.getLogger(self.loggerName)
+
+        self.agency = agency
+        self.maxFeeds = maxFeeds
+        self.snapshotDir = snapshotDir
+        self.lazy = lazy
+
+        self.feedList = getFeedFileList(gtfsDir, agency)
+        if (len(self.feedList) == 0):
+            raise Exception('No %s feeds in %s' % (agency, gtfsDir))
+        self.publishOrdList = [publishOrd for publishOrd, dbFileLoc in self.feedList]
+
+        # date ordinal -> index of the feed in feedList
+        self.dateFeedDict = {}
+
+        # feed index -> GtfsData, least recently used first
+        self.gtfsDataDict = OrderedDict()
+
+        self.timezone = None
+        self.logger.info('Indexing %d feeds' % len(self.feedList))
+        for feedIndex, (publishOrd, dbFileLoc) in enumerate(self.feedList):
+            self.indexFeed(feedIndex, publishOrd, dbFileLoc)
+
+        # Treat 4AM as the changeover between days, as GtfsData does
+        self.zeroHour = 4
+        self.serviceDays = LocalDays(self.timezone, self.zeroHour)
+
+
+    def indexFeed(self, feedIndex, publishOrd, dbFileLoc):
+        dbManager = GtfsDbManager(dbFileLoc, extraTables=False)
+        if self.timezone is None:
+            self.timezone = dbManager.getTimezone()
+
+        # (the same calendar as GtfsData.compileServiceCalendar)
+        dateOrdSet = set(dbManager.getServiceCalendar().getServiceDateDict())
+        dbManager.conn.close()
+
+        # Feeds are indexed in order of publication, so a later feed
+        # takes over from its publish date on.
+        for dateOrd in dateOrdSet:
+            if (dateOrd not in self.dateFeedDict or dateOrd >= publishOrd):
+                self.dateFeedDict[dateOrd] = feedIndex
+
+
+    def getFeedIndexForDateOrdinal(self, dateOrd):
+        '''
+        Return the index in feedList of the feed for the given service date.
+        '''
+        feedIndex = self.dateFeedDict.get(dateOrd)
+        if feedIndex is None:
+            # no service: the last feed published by then, if any
+            feedIndex = max(bisect.bisect_right(self.publishOrdList, dateOrd) - 1, 0)
+        return feedIndex
+
+
+    def getFeedIndexForTime(self, timeMillis):
+        '''
+        Return the index in feedList of the feed for the service date of
+        the given time.
+        '''
+        return self.getFeedIndexForDateOrdinal(
+            self.serviceDays.getDateOrdinal(timeMillis))
+
+
+    def getFeedFileForTime(self, timeMillis):
+        return self.feedList[self.getFeedIndexForTime(timeMillis)][1]
+
+
+    def getGtfsDataForTime(self, timeMillis):
+        '''
+        Return the GtfsData of the feed for the service date of the given
+        time, loading it if needed.
+        '''
+        feedIndex = self.getFeedIndexForTime(timeMillis)
+        gtfsData = self.gtfsDataDict.get(feedIndex)
+        if gtfsData is None:
+            gtfsData = self.loadFeed(feedIndex)
+        self.addGtfsData(feedIndex, gtfsData)
+
+        return gtfsData
+
+
+    def hasGtfsData(self, feedIndex):
+        return (feedIndex in self.gtfsDataDict)
+
+
+    def addGtfsData(self, feedIndex, gtfsData):
+        '''
+        Keep gtfsData as the loaded GtfsData of the feed, as the most
+        recently used.
+        '''
+        self.gtfsDataDict.pop(feedIndex, None)
+        self.gtfsDataDict[feedIndex] = gtfsData
+
+        while (len(self.gtfsDataDict) > self.maxFeeds):
+            oldIndex = self.gtfsDataDict.popitem(last=False)[0]
+            self.logger.info('Dropping feed %s' % self.feedList[oldIndex][1])
+
+
+    def getSnapshotFileLoc(self, feedIndex):
+        if self.snapshotDir is None:
+            return None
+        dbFileLoc = self.feedList[feedIndex][1]
+        return os.path.join(self.snapshotDir,
+            os.path.splitext(os.path.basename(dbFileLoc))[0] + '.snapshot.npz')
+
+
+    def loadFeed(self, feedIndex):
+        dbFileLoc = self.feedList[feedIndex][1]
+        self.logger.info('Loading feed %s' % dbFileLoc)
+
+        return GtfsData(self.agency, dbFileLoc,
+                        snapshotFileLoc=self.getSnapshotFileLoc(feedIndex),
+                        lazy=self.lazy)
@@ -5,28 +5,42 @@ Created on Sep 2, 2013
 '''
 
 from pygtfs.trip import Trip
+from pygtfs.tripTimeline import TripTimeline
 from pygtfs.block import Block
+from pygtfs.shape import Shape
 from pygtfs.projectedLocation import ProjectedLocation
 from pygtfs.gtfsDbManager import GtfsDbManager
 from pygtfs.stopTime import StopTime
+from pygtfs.gtfsSnapshot import loadSnapshot, saveSnapshot
+from pygtfs.localDays import LocalDays
 import time
 from datetime import datetime
 import pytz
 import calendar
 import math
-from util import kmBetweenLatLonPair, kmPerDeg
+from util import kmBetweenLatLonPair, kmBetweenLatLonArrays, kmPerDeg
 from pygtfs.location import Location
 import logging
-import copy
+import numpy as np
 
 class GtfsData(object):
     '''
     classdocs
     '''
 
-    def __init__(self, agency, dbFileLoc, loggerName=None, service_id=None):
+    def __init__(self, agency, dbFileLoc, loggerName=None, service_id=None,
+                 snapshotFileLoc=None, lazy=False):
         '''
         Constructor
+        
+        snapshotFileLoc -- optional path of a snapshot (see gtfsSnapshot) to
+                           load from, if it was made from the same db file,
+                           and to write otherwise.
+        lazy -- if True, only load the services (calendar) up front; blocks,
+                trips and stop times of a service are loaded the first time
+                getTodayBlocks needs them and dropped once their service
+                day has passed, and shapes and stops are loaded as needed.
+                Snapshots are not used in lazy mode.
         '''
         
         if loggerName is not None:
@@ -39,25 +53,36 @@ class GtfsData(object):
         self.logger.info('Initializing GtfsData')
         
         self.agency = agency
+        self.dbFileLoc = dbFileLoc
+        self.lazy = lazy
         
 #         dbFileLoc = "../../../res/beartransit.db"
 #         dbFileLoc = "../../../res/virtualDbus.db"
         
-        dbManager = GtfsDbManager(dbFileLoc)
-        
         self.blockDict = {}
         self.stopDict = {}
         self.shapeDict = {}
         self.serviceDict = {}
         
+        # (prevShapeId, shapeId) -> shapes stitched together, see
+        # getStitchedShape
+        self.stitchedShapeDict = {}
+        
+        # Trip lookup indexes, filled in as blocks are added.
+        self.tripDict = {}
+        self.tripBlockDict = {}
+        self.nextTripDict = {}
+        self.prevTripDict = {}
+        
+        # tripId -> TripTimeline, built as needed (see getTripTimeline)
+        self.timelineDict = {}
+        
         self.service_id = service_id
 
         # Treat 4AM as the changeover between days (strictly speaking, we
         # should match trips on a per-trip basis)
         self.zeroHour = 4
         
-        self.timezone = dbManager.getTimezone()
-        
         self.dayDict = {0: 'monday',
                         1: 'tuesday',
                         2: 'wednesday',
@@ -66,14 +91,20 @@ class GtfsData(object):
                         5: 'saturday',
                         6: 'sunday'}
         
-        self.logger.info('Working on shapes')
-        for shapeId in dbManager.getShapeIds():
-            self.addShape(dbManager.getShape(shapeId))
+        if snapshotFileLoc is not None and not self.lazy:
+            self.logger.info('Attempting to load GtfsData from snapshot')
+            if loadSnapshot(self, snapshotFileLoc, dbFileLoc):
+                self.initLocalDays()
+                self.logger.info('Compiling service calendar')
+                self.compileServiceCalendar()
+                return
+            self.logger.info('No usable snapshot. Loading from db file.')
+        
+        dbManager = GtfsDbManager(dbFileLoc)
+        
+        self.timezone = dbManager.getTimezone()
+        self.initLocalDays()
         
-        self.logger.info('Working on stops')
-        for stop in dbManager.getStops():
-            self.addStop(stop)
-            
         self.logger.info('Working on services')
         if self.service_id is None:
             for serviceId in dbManager.getServiceIds():
@@ -81,6 +112,27 @@ class GtfsData(object):
         else:
             self.addService(dbManager.getService(self.service_id))
         
+        if self.lazy:
+            # see loadServiceDay
+            self.dbManager = dbManager
+            self.blockServiceDict = dbManager.getServiceIdsByBlockId()
+            self.stopPostDict = dbManager.getStopShapePosts()
+            self.nSavedPosts = len(self.stopPostDict)
+            self.loadedServiceIds = set()
+            self.loadedDateOrd = None
+            
+            self.logger.info('Compiling service calendar')
+            self.compileServiceCalendar()
+            return
+        
+        self.logger.info('Working on shapes')
+        for shape in dbManager.getAllShapes().values():
+            self.addShape(shape)
+        
+        self.logger.info('Working on stops')
+        for stop in dbManager.getStops():
+            self.addStop(stop)
+            
         self.logger.info('Creating temporary dict of stop times')
         t_start = time.time()
         tempStopTimeDict = dbManager.getAllStopTimes()
@@ -93,32 +145,83 @@ class GtfsData(object):
         t_end = time.time()
         self.logger.info(str(t_end-t_start) + 's to create dict of trips')
         
+        # Stops are projected onto shapes once per (shape, stop) pair, and
+        # the results are kept in the db for the next startup.
+        self.logger.info('Loading saved stop postmiles')
+        stopPostDict = dbManager.getStopShapePosts()
+        nSavedPosts = len(stopPostDict)
+        
+        blockServiceDict = dbManager.getServiceIdsByBlockId()
+        blockTripsDict = dbManager.getTripIdsByBlockId()
+        
         for blockId in dbManager.getBlockIds(self.service_id):
-            serviceId = dbManager.getServiceIdForBlockId(blockId)
-            tripsInBlock = dbManager.getTripsForBlockId(blockId)
+            serviceId = blockServiceDict.get(blockId)
+            tripsInBlock = blockTripsDict.get(blockId, [])
             self.addBlock(self.createBlock(blockId, serviceId, tripsInBlock,
-                                           tempStopTimeDict, tempTripDict))
+                                           tempStopTimeDict, tempTripDict,
+                                           stopPostDict))
+        
+        if (len(stopPostDict) > nSavedPosts):
+            self.logger.info('Saving stop postmiles')
+            dbManager.saveStopShapePosts(stopPostDict)
+        
+        self.logger.info('Compiling service calendar')
+        self.compileServiceCalendar()
+        
+        if snapshotFileLoc is not None:
+            # (db file stat and hash taken after loading, which may have
+            # added derived tables)
+            self.logger.info('Writing snapshot')
+            try:
+                saveSnapshot(self, snapshotFileLoc, dbFileLoc)
+            except IOError as e:
+                self.logger.warning("Failed to write snapshot: %s" % e)
             
     
+    def initLocalDays(self):
+        # calendar days, and service days (which start at zeroHour)
+        self.localDays = LocalDays(self.timezone)
+        self.serviceDays = LocalDays(self.timezone, self.zeroHour)
+    
+    
     # to handle pickling
     def __getstate__(self):
         d = dict(self.__dict__)
         del d['logger']
+        d.pop('dbManager', None)
         return d
     
     def __setstate__(self, d):
         self.__dict__.update(d)
         self.logger = logging.getLogger(self.loggerName)
+        if d.get('lazy'):
+            self.dbManager = GtfsDbManager(self.dbFileLoc)
+    
+    
+    def reconnect(self):
+        '''
+        Lazy mode: reopen the connection to the db in the calling thread,
+        for a GtfsData set up in another thread (see GtfsRebuild).
+        '''
+        if self.lazy:
+            self.dbManager.reconnect()
         
             
-    def createBlock(self, blockId, serviceId, tripsInBlock, stopTimeDict, tripDict):
+    def createBlock(self, blockId, serviceId, tripsInBlock, stopTimeDict, tripDict,
+                    stopPostDict=None):
         '''
         Return a Block object corresponding to the given id.
             
         Keyword arguments:
         blockId -- string representing block id.
+        stopPostDict -- optional dictionary mapping (shapeId, stopId) to the
+                        postKm of the stop on the shape; used in place of
+                        projecting, and updated with new projections.
         '''
         
+        if stopPostDict is None:
+            stopPostDict = {}
+        
         # Instantiate empty block:
         block = Block(blockId, serviceId)
         self.logger.info('Working on block ' + blockId)
@@ -131,20 +234,25 @@ class GtfsData(object):
                 stopTimesDictList = stopTimeDict[tripId]
                 trip = Trip(tripId, blockId, routeId, shapeId)
                 shape = self.getShapeFromShapeId(shapeId)
+                newStopTimeList = []
                 for stopTime in stopTimesDictList:
-                    stop = self.getStopFromStopId(stopTime['stopId'])
-                    lat, lon = stop.stopLat, stop.stopLon
-                    loc = Location()
-                    loc.lat = lat
-                    loc.lon = lon
-                    projLoc = self.projectToShape(shape, loc)
+                    postKey = (shapeId, stopTime['stopId'])
+                    if postKey not in stopPostDict:
+                        stop = self.getStopFromStopId(stopTime['stopId'])
+                        lat, lon = stop.stopLat, stop.stopLon
+                        loc = Location()
+                        loc.lat = lat
+                        loc.lon = lon
+                        projLoc = self.projectToShape(shape, loc)
+                        stopPostDict[postKey] = projLoc.postKm
                     newStopTime = StopTime(tripId,
                                            stopTime['stopId'],
                                            stopTime['stopSequence'],
                                            stopTime['arrTimeMillis'],
                                            stopTime['depTimeMillis'],
-                                           projLoc.postKm)
-                    trip.addStopTime(newStopTime)
+                                           stopPostDict[postKey])
+                    newStopTimeList.append(newStopTime)
+                trip.addStopTimes(newStopTimeList)
                     
                 block.addTrip(trip)
             except Exception as e:
@@ -157,6 +265,7 @@ class GtfsData(object):
     def addBlock(self, block):
         if (block.blockId not in self.blockDict):
             self.blockDict[block.blockId] = block
+            self.indexBlock(block)
             
     
     def addStop(self, stop):
@@ -166,6 +275,7 @@ class GtfsData(object):
             
     def addShape(self, shape):
         if (shape.shapeId not in self.shapeDict):
+            shape.buildIndex()
             self.shapeDict[shape.shapeId] = shape
             
             
@@ -174,69 +284,107 @@ class GtfsData(object):
             self.serviceDict[service.serviceId] = service
             
     
+    def removeBlock(self, block):
+        if (block.blockId in self.blockDict):
+            del self.blockDict[block.blockId]
+            for trip in block.getTripList():
+                for indexDict in (self.tripDict, self.tripBlockDict,
+                                  self.nextTripDict, self.prevTripDict,
+                                  self.timelineDict):
+                    indexDict.pop(trip.tripId, None)
+            
+    
     def inBlockList(self, block):
-        return (block in self.blockDict.values())
+        return (block.blockId in self.blockDict)
+    
+    
+    def indexBlock(self, block):
+        '''
+        Add the trips of a block to the trip lookup indexes: tripId to trip,
+        tripId to block, and links to the next and previous trips in the
+        block (in order of first departure).
+        '''
+        tripList = block.getTripList()
+        
+        for i, trip in enumerate(tripList):
+            self.tripDict[trip.tripId] = trip
+            self.tripBlockDict[trip.tripId] = block
+            self.timelineDict.pop(trip.tripId, None)
+            
+            if (i > 0):
+                self.prevTripDict[trip.tripId] = tripList[i-1]
+            else:
+                self.prevTripDict[trip.tripId] = None
+            
+            if (i < len(tripList) - 1):
+                self.nextTripDict[trip.tripId] = tripList[i+1]
+            else:
+                self.nextTripDict[trip.tripId] = None
     
     
     def getBlockFromBlockId(self, blockId):
-        for block in self.blockDict.values():
-            if block.blockId == blockId:
-                return block
-                
-        return None
+        return self.blockDict.get(blockId)
+    
+    
+    def getBlockFromTripId(self, tripId):
+        return self.tripBlockDict.get(tripId)
     
     
     def getTripFromTripId(self, tripId):
-        for block in self.blockDict.values():
-            if tripId in block.tripDict:
-                return block.tripDict[tripId]
-                
-        return None
+        return self.tripDict.get(tripId)
     
     
     def getNextTripInBlock(self, tripId):
-        trip = self.getTripFromTripId(tripId)
-        tripList = None
-        for block in self.blockDict.values():
-            if tripId in block.tripDict:
-                tripList = block.tripDict.values()
-                break
-        
-        if tripList is not None:
-            tripList.sort()
-            thisTripIndex = tripList.index(trip)
-            if (thisTripIndex < len(tripList) - 1):
-                nextTripIndex = thisTripIndex + 1
-                return tripList[nextTripIndex]
-            else:
-                return None
-            
-        return None
+        return self.nextTripDict.get(tripId)
+
 
     def getPreviousTripInBlock(self, tripId):
-        trip = self.getTripFromTripId(tripId)
-        tripList = None
-        for block in self.blockDict.values():
-            if tripId in block.tripDict:
-                tripList = block.tripDict.values()
-                break
-        
-        if tripList is not None:
-            tripList.sort()
-            thisTripIndex = tripList.index(trip)
-            if (thisTripIndex > 0):
-                prevTripIndex = thisTripIndex - 1
-                return tripList[prevTripIndex]
-            else:
-                return None
-            
-        return None
+        return self.prevTripDict.get(tripId)
 
     
+    def getTripTimeline(self, trip):
+        '''
+        Return the TripTimeline of a trip (its scheduled position over
+        time, up to the start of the next trip in its block), building it
+        the first time.
+        '''
+        timeline = self.timelineDict.get(trip.tripId)
+        if timeline is not None:
+            return timeline
+        
+        nextTrip = self.getNextTripInBlock(trip.tripId)
+        stopIdList = trip.getStopIds()
+        for t in (trip, nextTrip):
+            if (t is not None and t.stopTimeDict is None and
+                t._stopTimeList is not None):
+                t.freeze()
+        if nextTrip is not None:
+            stopIdList.append(nextTrip.getStopIds()[0])
+        
+        stopLatLonDict = {}
+        for stopId in stopIdList:
+            stop = self.getStopFromStopId(stopId)
+            stopLatLonDict[stopId] = (stop.stopLat, stop.stopLon)
+        
+        shape = self.getShapeFromShapeId(trip.shapeId)
+        timeline = TripTimeline(trip, nextTrip, shape.postArray[-1],
+                                stopLatLonDict)
+        self.timelineDict[trip.tripId] = timeline
+        return timeline
+    
+    
     def getStopFromStopId(self, stopId):
         if stopId in self.stopDict:
             return self.stopDict[stopId]
         
+        if self.lazy:
+            try:
+                stop = self.dbManager.getStops([stopId])[0]
+            except IndexError:
+                return None
+            self.addStop(stop)
+            return stop
+        
         return None
     
     
@@ -244,6 +392,12 @@ class GtfsData(object):
         if shapeId in self.shapeDict:
             return self.shapeDict[shapeId]
         
+        if self.lazy:
+            shape = self.dbManager.getAllShapes([shapeId]).get(shapeId)
+            if shape is not None:
+                self.addShape(shape)
+            return shape
+        
         return None
     
     def projectToShape_Shapely(self, shape, rawLoc):
@@ -254,8 +408,20 @@ class GtfsData(object):
             return self.projectToShape(shape, rawLoc)
 
         point = shapely.geometry.asPoint((rawLoc.lon, rawLoc.lat))
+
+        # Only hand shapely the stretch of the shape spanning the segments
+        # near the point, if the shape has a segment index.
+        i0, i1 = 0, len(shape.pointList) - 1
+        for segIndices, reachDeg in shape.getSegmentsNear(rawLoc.lat, rawLoc.lon):
+            j0, j1 = segIndices[0], segIndices[-1] + 1
+            subLine = shapely.geometry.LineString(
+                zip(shape.lonArray[j0:j1+1], shape.latArray[j0:j1+1]))
+            if (subLine.length > 0. and subLine.distance(point) <= reachDeg):
+                i0, i1 = j0, j1
+                break
+
         line = shapely.geometry.asLineString([[pt['lon'], pt['lat']]
-                                              for pt in shape.pointList])
+                                              for pt in shape.pointList[i0:i1+1]])
         projPt = line.interpolate(line.project(point))
 
         projLoc = ProjectedLocation()
@@ -263,50 +429,22 @@ class GtfsData(object):
         projLoc.lon = projPt.x
         projLoc.perpKm = kmBetweenLatLonPair(point.y, point.x,
                                              projPt.y, projPt.x)
-        projLoc.postKm = (line.project(projPt, normalized=True) *
-                          shape.pointList[-1]['post'])
+        projLoc.postKm = (shape.pointList[i0]['post'] +
+                          line.project(projPt, normalized=True) *
+                          (shape.pointList[i1]['post'] -
+                           shape.pointList[i0]['post']))
 
         return projLoc
 
     def projectToShape(self, shape, rawLoc):
-        # lat, lon constitute the origin of our local coordinate system.
-        # Latitudes represent y-distances, longitudes x-distances (need to
-        # correct for the local latitude, though). Iterate over points in 
-        # the shape to find the point on a line segment which is closest to
-        # the given origin.
-        
-        # Without worrying about ellipsoidalness, this gives the relationship 
-        # between the length of a point of latitude and the length of a point
-        # of longitude (to within ~0.5% for ~spherical Earth).
-        
+        # The closest point over all segments of the shape is found in a
+        # single array expression; see Shape.projectPoint.
         lat = rawLoc.lat
         lon = rawLoc.lon
-        
-        convFactor = math.cos(lat*math.pi/180.)
-        
-        perpDistMin = 0.
-        
-        for i, point in enumerate(shape.pointList):
-            if (i < len(shape.pointList) - 1):
-                y1 = point['lat']-lat
-                y2 = shape.pointList[i+1]['lat']-lat
-                x1 = (point['lon']-lon)*convFactor
-                x2 = (shape.pointList[i+1]['lon']-lon)*convFactor
-                xproj, yproj = self.getClosestPointOnSegment(0., 0., x1, x2, y1, y2)
-                perpDist = (xproj**2.0 + yproj**2.0)**0.5
-                if (i == 0 or perpDist < perpDistMin):
-                    perpDistMin = perpDist
-                    xmin, ymin = xproj, yproj
-                    segLen = ((x2-x1)**2.0 + (y2-y1)**2.0)**0.5
-                    if (segLen > 0.0):
-                        frac = ((xproj-x1)**2.0 + (yproj-y1)**2.0)**0.5 / segLen
-                        postKm = point['post'] + frac*(shape.pointList[i+1]['post'] - point['post'])
-                    else:
-                        postKm = point['post']
-                        
+
+        latProj, lonProj, postKm = shape.projectPoint(lat, lon)
+
         # Calculate lateral distance.
-        lonProj = xmin/convFactor + lon
-        latProj = ymin + lat
         perpKm = kmBetweenLatLonPair(lat, lon, latProj, lonProj)
         
         projLoc = ProjectedLocation()
@@ -318,72 +456,76 @@ class GtfsData(object):
         return projLoc
     
     
+    def projectManyToShapes(self, lats, lons, shapeIds):
+        '''
+        Project many points at once, point i onto the shape shapeIds[i].
+        Work is grouped by shape, so each shape is handled by one array
+        computation.
+
+        Return arrays (postKm, perpKm, latProj, lonProj).
+        '''
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+
+        indexDict = {}
+        for i, shapeId in enumerate(shapeIds):
+            indexDict.setdefault(shapeId, []).append(i)
+
+        latProj = np.empty(len(lats))
+        lonProj = np.empty(len(lats))
+        postKm = np.empty(len(lats))
+
+        for shapeId in indexDict:
+            shape = self.getShapeFromShapeId(shapeId)
+            sel = np.array(indexDict[shapeId], dtype=int)
+            latProj[sel], lonProj[sel], postKm[sel] = \
+                shape.projectPoints(lats[sel], lons[sel])
+
+        perpKm = kmBetweenLatLonArrays(lats, lons, latProj, lonProj)
+
+        return postKm, perpKm, latProj, lonProj
+
+
+    def getStitchedShape(self, prevShape, shape):
+        '''
+        Return a Shape made of prevShape followed by shape, with the posts
+        of prevShape shifted so that it ends at post 0. These are built once
+        per pair of shapes and kept until either shape is unloaded (see
+        unloadService).
+        '''
+        key = (prevShape.shapeId, shape.shapeId)
+        stitched = self.stitchedShapeDict.get(key)
+        if stitched is None:
+            for s in (prevShape, shape):
+                if s.latArray is None:
+                    s.buildArrays()
+            
+            stitched = Shape(key)
+            stitched.setArrays(np.concatenate((prevShape.latArray, shape.latArray)),
+                               np.concatenate((prevShape.lonArray, shape.lonArray)),
+                               np.concatenate((prevShape.seqArray, shape.seqArray)),
+                               np.concatenate((prevShape.postArray - prevShape.postArray[-1],
+                                               shape.postArray)))
+            self.stitchedShapeDict[key] = stitched
+        
+        return stitched
+    
+    
     def projectToShapeWithTarget(self, shape, prevShape, rawLoc, postTarget):
-        # lat, lon constitute the origin of our local coordinate system.
-        # Latitudes represent y-distances, longitudes x-distances (need to
-        # correct for the local latitude, though). Iterate over points in 
-        # the shape to find the point on a line segment which is closest to
-        # the given origin.
-        
-        # Without worrying about ellipsoidalness, this gives the relationship 
-        # between the length of a point of latitude and the length of a point
-        # of longitude (to within ~0.5% for ~spherical Earth).
+        # Find the closest point on the shape whose postmile is within 200
+        # meters of postTarget (see Shape.projectPointWithTarget).
         lat = rawLoc.lat
         lon = rawLoc.lon
         
-        convFactor = math.cos(lat*math.pi/180.)
+        # Before the first stop on this trip, the previous shape is stitched
+        # on in front of this one (with posts running up to 0).
+        if prevShape is not None and postTarget < 0:
+            shape = self.getStitchedShape(prevShape, shape)
         
-        minPerpDist = 0.
+        latProj, lonProj, postKmMin = \
+            shape.projectPointWithTarget(lat, lon, postTarget, 0.2)
         
-        allPoints = copy.deepcopy(shape.pointList)
-
-        # Add previous shape to this shape if we haven't yet reached the first
-        # stop on this trip.
-        if prevShape is not None and postTarget < 0:
-            postMax = prevShape.pointList[-1]['post']
-            prevPoints = copy.deepcopy(prevShape.pointList)
-            for point in prevPoints:
-                point['post'] = point['post'] - postMax
-            allPoints = prevPoints + allPoints
-
-        for i, point in enumerate(allPoints):
-            if (i < len(allPoints) - 1):
-
-                y1 = point['lat']-lat
-                y2 = allPoints[i+1]['lat']-lat
-                x1 = (point['lon']-lon)*convFactor
-                x2 = (allPoints[i+1]['lon']-lon)*convFactor
-                
-                # project to segment
-                xproj, yproj = self.getClosestPointOnSegment(0., 0., x1, x2, y1, y2)
-                
-                # get lateral distance
-                perpDist = (xproj**2.0 + yproj**2.0)**0.5
-                segLen = ((x2-x1)**2.0 + (y2-y1)**2.0)**0.5
-                
-                # get the post-km
-                if (segLen > 0.0):
-                    frac = ((xproj-x1)**2.0 + (yproj-y1)**2.0)**0.5 / segLen
-                    postKm = point['post'] + frac*(allPoints[i+1]['post'] - point['post'])
-                else:
-                    postKm = point['post']
-                    
-                postDev = math.fabs(postKm - postTarget)
-
-                # Arbitrarily ensure that deviation from expected postmile is
-                # less than 500 meters.
-                if (i == 0 or (perpDist < minPerpDist and postDev < 0.2)):
-                    minPerpDist = perpDist
-                    xmin, ymin = xproj, yproj
-#                     print "postKm, postTarget:"
-#                     print postKm, postTarget
-#                     print "sumMin, perpDist, postDev"
-#                     print sumMin, perpDist, postDev
-                    postKmMin = postKm
-                        
         # Calculate lateral distance.
-        lonProj = xmin/convFactor + lon
-        latProj = ymin + lat
         perpKm = kmBetweenLatLonPair(lat, lon, latProj, lonProj)
         
         projLoc = ProjectedLocation()
@@ -413,8 +555,14 @@ class GtfsData(object):
     
     
     def getDaystartFromTimestampMillis(self, timeMillis):
-        mydate = self.getDatetimeForTimestampMillis(timeMillis)
-        return self.getTimestampMillisForDate(mydate, 0, 0, 0)
+        return self.localDays.getDayStart(timeMillis)
+    
+    
+    def getDaystartsFromTimestampMillis(self, timeArray):
+        '''
+        Vectorized getDaystartFromTimestampMillis for an array of times.
+        '''
+        return self.localDays.getDayStarts(timeArray)
         
         
     def getDatetimeForTimestampMillis(self, timestampMillis):
@@ -465,25 +613,133 @@ class GtfsData(object):
         return stamp
     
     
+    def compileServiceCalendar(self):
+        '''
+        Compile the services of the feed into a dictionary mapping each
+        service date (as a date ordinal) to the frozenset of services
+        running on that date, as read by readServiceCalendar: from start
+        date to end date inclusive, with the calendar_dates exceptions.
+        '''
+        # frozenset of service ids -> tuple of their blocks, filled in by
+        # getTodayBlocks
+        self.blocksForServicesDict = {}
+        
+        serviceIds = None
+        if self.service_id is not None:
+            serviceIds = set([self.service_id])
+        
+        dbManager = GtfsDbManager(self.dbFileLoc, extraTables=False)
+        self.serviceDateDict = dbManager.getServiceCalendar().getServiceDateDict(serviceIds)
+        dbManager.conn.close()
+    
+    
     def getTodayBlocks(self, time):
-        date = self.getDatetimeForTimestampMillis(time)
+        '''
+        Return the tuple of blocks active at the given time. The service date
+        rolls over at zeroHour, local time.
+        '''
+        dateOrd = self.serviceDays.getDateOrdinal(time)
+        if (self.lazy and dateOrd != self.loadedDateOrd):
+            self.loadServiceDay(dateOrd)
+        
+        serviceIds = self.serviceDateDict.get(dateOrd)
+        if serviceIds is None:
+            return ()
+        
+        blocks = self.blocksForServicesDict.get(serviceIds)
+        if blocks is None:
+            # dates with the same services share one tuple
+            blocks = tuple(block for block in self.blockDict.values()
+                           if block.serviceId in serviceIds)
+            self.blocksForServicesDict[serviceIds] = blocks
+        
+        return blocks
+    
+    
+    def loadServiceDay(self, dateOrd):
+        '''
+        Lazy mode: load the blocks of the services running on the given
+        service day (a date ordinal), and drop those of services running
+        neither on that day nor on the day before (whose trips may still
+        be assigned).
+        '''
+        serviceIds = self.serviceDateDict.get(dateOrd, frozenset())
+        keepIds = serviceIds | self.serviceDateDict.get(dateOrd - 1, frozenset())
         
-        #dayInt is 0 for Sunday, 1 for Monday, etc
-        dayInt = date.weekday()
+        for serviceId in list(self.loadedServiceIds):
+            if serviceId not in keepIds:
+                self.unloadService(serviceId)
+        
+        for serviceId in serviceIds:
+            if serviceId not in self.loadedServiceIds:
+                self.loadService(serviceId)
+        
+        self.loadedDateOrd = dateOrd
+    
+    
+    def loadService(self, serviceId):
+        '''
+        Lazy mode: create the blocks of the given service, with their trips
+        and stop times, loading the shapes and stops they use.
+        '''
+        self.logger.info('Loading service %s' % serviceId)
+        
+        tripDict = self.dbManager.getTripsDict(serviceId)
+        stopTimeDict = self.dbManager.getAllStopTimes(serviceId=serviceId)
+        blockTripsDict = self.dbManager.getTripIdsByBlockId(serviceId)
+        
+        shapeIdList = [shapeId for shapeId in
+                       set(trip['shapeId'] for trip in tripDict.values())
+                       if shapeId not in self.shapeDict]
+        for shape in self.dbManager.getAllShapes(shapeIdList).values():
+            self.addShape(shape)
+        
+        stopIdList = [stopId for stopId in
+                      set(stopTime['stopId'] for stopTimeList in stopTimeDict.values()
+                          for stopTime in stopTimeList)
+                      if stopId not in self.stopDict]
+        for stop in self.dbManager.getStops(stopIdList):
+            self.addStop(stop)
+        
+        for blockId in blockTripsDict:
+            if (self.blockServiceDict.get(blockId) == serviceId):
+                self.addBlock(self.createBlock(blockId, serviceId,
+                                               blockTripsDict[blockId],
+                                               stopTimeDict, tripDict,
+                                               self.stopPostDict))
+        
+        if (len(self.stopPostDict) > self.nSavedPosts):
+            self.dbManager.saveStopShapePosts(self.stopPostDict)
+            self.nSavedPosts = len(self.stopPostDict)
+        
+        self.loadedServiceIds.add(serviceId)
+        self.blocksForServicesDict = {}
+    
+    
+    def unloadService(self, serviceId):
+        '''
+        Lazy mode: drop the blocks of the given service, and the shapes and
+        stops no other loaded block uses.
+        '''
+        self.logger.info('Unloading service %s' % serviceId)
         
-        blockList = []
         for block in self.blockDict.values():
-            service = self.serviceDict[block.serviceId]
-            
-            # dates are in YYYYMMDD string format
-            startDate = service.startDate
-            endDate = service.endDate
-            
-            startTime= self.getTimestampForDateString(startDate, self.zeroHour, 0, 0)
-            endTime= self.getTimestampForDateString(endDate, self.zeroHour, 0, 0)
-            
-            if (service.dayList[dayInt] and startTime < time
-                and endTime > time):
-                blockList.append(block)
-                 
-        return blockList
+            if (block.serviceId == serviceId):
+                self.removeBlock(block)
+        
+        shapeIds = set()
+        stopIds = set()
+        for trip in self.tripDict.values():
+            shapeIds.add(trip.shapeId)
+            stopIds.update(trip.getStopIds())
+        for shapeId in [shapeId for shapeId in self.shapeDict if shapeId not in shapeIds]:
+            del self.shapeDict[shapeId]
+        # (stitched shapes are copies of the arrays of both of their shapes)
+        for key in [key for key in self.stitchedShapeDict
+                    if key[0] not in shapeIds or key[1] not in shapeIds]:
+            del self.stitchedShapeDict[key]
+        for stopId in [stopId for stopId in self.stopDict if stopId not in stopIds]:
+            del self.stopDict[stopId]
+        
+        self.loadedServiceIds.discard(serviceId)
+        self.blocksForServicesDict = {}
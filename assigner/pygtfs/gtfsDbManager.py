@@ -9,8 +9,18 @@ from pygtfs.stopTime import StopTime
 from pygtfs.stop import Stop
 from pygtfs.shape import Shape
 from pygtfs.service import Service
+from pygtfs.serviceCalendar import readServiceCalendar
+from pygtfs.util import kmBetweenLatLonArrays
 import logging
 import time
+import numpy as np
+
+# Version of the derived tables built by ensure_extra_tables. Bump it when
+# their definitions change, so that existing dbs get them rebuilt.
+DERIVED_SCHEMA_VERSION = 1
+
+# block ids with trips in a given service (as query parameter)
+BLOCKS_FOR_SERVICE_QUERY = "SELECT block_id FROM trips_simple WHERE service_id = ?"
 
 class GtfsDbManager(object):
     '''
@@ -18,7 +28,8 @@ class GtfsDbManager(object):
     '''
 
 
-    def __init__(self, dbFileLoc, loggerName = None, service_id = None):
+    def __init__(self, dbFileLoc, loggerName = None, service_id = None,
+                 extraTables = True):
         self._dbFileLoc = dbFileLoc
         
         self.conn = sqlite3.connect(dbFileLoc)
@@ -29,23 +40,43 @@ class GtfsDbManager(object):
         self.logger = logging.getLogger(loggerName)
         
         self.service_id = service_id
-        self.ensure_extra_tables()
+        
+        # see getServiceCalendar
+        self.serviceCalendar = None
+        
+        # see getStopShapeFingerprint and saveStopShapePosts
+        self.stopShapeFingerprint = None
+        self.savedPostKeys = None
+        
+        # (not needed to just read the calendar, see FeedRouter)
+        if extraTables:
+            self.ensure_extra_tables()
 
 
+    def reconnect(self):
+        '''
+        Open a new connection to the db, for use in the calling thread (a
+        sqlite connection can only be used in the thread that opened it).
+        '''
+        self.conn = sqlite3.connect(self._dbFileLoc)
+    
+    
     def ensure_extra_tables(self):
+        '''
+        Create the derived tables (and their indexes) used by the queries
+        below, unless they are already up to date. See ensureDerivedTable.
+        '''
 #        create_trips_table = "CREATE TABLE IF NOT EXISTS trips_simple AS select trip_id," \
 #        + " route_id, block_id, service_id, direction FROM trips, directions WHERE" \
 #        + " trips.shape_id = directions.shape_id;"
-        create_trips_table = """CREATE TABLE IF NOT EXISTS trips_simple AS
-            SELECT trip_id, route_id, block_id, service_id, direction_id
+        create_trips_table = """CREATE TABLE trips_simple AS
+            SELECT trip_id, route_id, block_id, service_id, direction_id, shape_id
             FROM trips;
         """
-        t_start = time.time()
-        self.conn.execute(create_trips_table);
-        t_end = time.time()
-        self.logger.debug(str(t_end-t_start) + " s to create trips table")
+        self.ensureDerivedTable('trips_simple', ('trips',), create_trips_table,
+                                ('trip_id', 'block_id', 'service_id'))
         
-        create_stop_times_table = "CREATE TABLE IF NOT EXISTS stop_times_simple AS" \
+        create_stop_times_table = "CREATE TABLE stop_times_simple AS" \
         + " SELECT trip_id, stop_id, " \
         + " (cast(substr(arrival_time, 1,2) AS int)/24)*24*3600 + strftime('%s', substr('0' ||" \
         + " cast(cast(substr(arrival_time, 1,2) AS int) % 24 AS string) ||" \
@@ -57,17 +88,8 @@ class GtfsDbManager(object):
         + " substr('0'||departure_time, -8) AS departure_time, stop_id, stop_sequence" \
         + " FROM stop_times);"
         
-        t_start = time.time()
-        self.conn.execute(create_stop_times_table);
-        t_end = time.time()
-        self.logger.debug(str(t_end-t_start) + " s to create stop_times_simple")
-        
-#         create_index = "CREATE INDEX `idx1` ON `stop_times_simple` (`trip_id` ASC);"
-#         
-#         t_start = time.time()
-#         self.conn.execute(create_index);
-#         t_end = time.time()
-#         print str(t_end-t_start) + " s to create index on stop_times_simple"
+        self.ensureDerivedTable('stop_times_simple', ('stop_times',),
+                                create_stop_times_table, ('trip_id', 'stop_id'))
         
 #         headways_table_name = "headways_" + self.service_id
         
@@ -91,6 +113,53 @@ class GtfsDbManager(object):
 #         self.logger.debug(str(t_end-t_start) + " s to create headways table")
         
     
+    def ensureDerivedTable(self, tableName, sourceTables, createSql, indexColumns):
+        '''
+        Make sure the derived table tableName exists, built by createSql
+        from sourceTables, with an index on each of indexColumns.
+        
+        The table is (re)built only if it was built under a different
+        DERIVED_SCHEMA_VERSION or from source tables with different change
+        markers (see getTableMarker), as recorded in the derived_tables_meta
+        table.
+        '''
+        
+        fingerprint = ",".join(self.getTableMarker(sourceTable)
+                               for sourceTable in sourceTables)
+        
+        self.conn.execute("CREATE TABLE IF NOT EXISTS derived_tables_meta"
+                          + " (table_name TEXT PRIMARY KEY, schema_version INTEGER,"
+                          + " fingerprint TEXT)")
+        
+        cursor = self.conn.execute("SELECT schema_version, fingerprint"
+                                   + " FROM derived_tables_meta WHERE table_name = ?",
+                                   (tableName,))
+        row = cursor.fetchone()
+        
+        cursor = self.conn.execute("SELECT count(*) FROM sqlite_master"
+                                   + " WHERE type = 'table' AND name = ?", (tableName,))
+        tableExists = cursor.fetchone()[0] > 0
+        
+        if (tableExists and row is not None and
+            row[0] == DERIVED_SCHEMA_VERSION and row[1] == fingerprint):
+            return
+        
+        self.logger.info("Building derived table %s" % tableName)
+        t_start = time.time()
+        with self.conn:
+            self.conn.execute("DROP TABLE IF EXISTS %s" % tableName)
+            self.conn.execute(createSql)
+            for column in indexColumns:
+                self.conn.execute("CREATE INDEX IF NOT EXISTS idx_%s_%s ON %s (%s)"
+                                  % (tableName, column, tableName, column))
+            # recorded last, so that an interrupted build is redone
+            self.conn.execute("INSERT OR REPLACE INTO derived_tables_meta"
+                              + " VALUES (?, ?, ?)",
+                              (tableName, DERIVED_SCHEMA_VERSION, fingerprint))
+        t_end = time.time()
+        self.logger.debug(str(t_end-t_start) + " s to create " + tableName)
+    
+    
     def getBlockIds(self, route_id_list=None):
         '''
         Return the list of blocks in the GTFS database.
@@ -163,36 +232,38 @@ class GtfsDbManager(object):
     
     def getStops(self, stopIdList=None):
         '''
-        Return the list of stops in the GTFS database.
+        Return the list of stops in the GTFS database, or those in
+        stopIdList (in that order, leaving out ids with no stop), read in
+        as few queries as possible.
         
         '''
 
         stopList = []
+        sqlQuery = "select stop_id, stop_lat, stop_lon, stop_name from stops"
         if stopIdList is None:
-            sqlQuery = "select stop_id, stop_lat, stop_lon, stop_name from stops" \
-                + " order by stop_id asc"
-            cursor = self.conn.execute(sqlQuery)
+            cursorList = [self.conn.execute(sqlQuery + " order by stop_id asc")]
         else:
-            sqlQuery = "select stop_id, stop_lat, stop_lon, stop_name from stops" \
-                + " where stop_id in ({0}) order by stop_id asc".format(', '.join(['?' for ii in stopIdList]))
-            cursor = self.conn.execute(sqlQuery, tuple(stopIdList))
-
-        for row in cursor:
-            stop = Stop(row[0], float(row[1]), float(row[2]), stopName=row[3])
-            stopList.append(stop)
+            # (in chunks, to stay below sqlite's limit on query parameters)
+            stopIdList = list(stopIdList)
+            cursorList = []
+            for i in range(0, len(stopIdList), 500):
+                chunk = tuple(stopIdList[i:i+500])
+                cursorList.append(self.conn.execute(
+                    sqlQuery + " where stop_id in ({0})".format(', '.join('?' for _ in chunk)),
+                    chunk))
+
+        for cursor in cursorList:
+            for row in cursor:
+                stop = Stop(row[0], float(row[1]), float(row[2]), stopName=row[3])
+                stopList.append(stop)
 
         if stopIdList is not None:
-            nStops = len(stopList)
-            ind = [0] * nStops
-            for ii in range(nStops):
-                ss = Stop(stopIdList[ii],0,0) # dummy stop
-                ind[ii] = stopList.index(ss)
-
-            return [stopList[ii] for ii in ind]
+            stopDict = dict((stop.stopId, stop) for stop in stopList)
+            return [stopDict[stopId] for stopId in stopIdList if stopId in stopDict]
 
         return stopList
-
-
+    
+    
     def getUniqueStops(self, route_id_list):
         '''
         Return the list of stops in the GTFS database that are visited on
@@ -314,18 +385,66 @@ class GtfsDbManager(object):
         
         sqlQuery = "select shape_id, shape_pt_lat, shape_pt_lon, "\
             + " shape_pt_sequence from shapes" \
-            + " where shape_id=" + shapeId \
+            + " where shape_id = ?" \
             + " order by shape_pt_sequence asc"
                 
         shape = Shape(shapeId)
         
-        cursor = self.conn.execute(sqlQuery)
+        cursor = self.conn.execute(sqlQuery, (shapeId,))
         for row in cursor:
             shape.addPoint(float(row[1]), float(row[2]), int(row[3]))
             
         return shape
     
     
+    def getAllShapes(self, shapeIdList=None):
+        '''
+        Return a dictionary mapping shape id to shape, for all the shapes
+        in the GTFS database (or those in shapeIdList), read in a single
+        scan. The shapes hold their points as arrays (see Shape.setArrays).
+        '''
+        
+        sqlQuery = "select shape_id, shape_pt_lat, shape_pt_lon, "\
+            + " shape_pt_sequence from shapes"
+        orderBy = " order by shape_id asc, shape_pt_sequence asc"
+        
+        if shapeIdList is None:
+            cursorList = [self.conn.execute(sqlQuery + orderBy)]
+        else:
+            # (in chunks, to stay below sqlite's limit on query parameters)
+            shapeIdList = list(shapeIdList)
+            cursorList = []
+            for i in range(0, len(shapeIdList), 500):
+                chunk = tuple(shapeIdList[i:i+500])
+                cursorList.append(self.conn.execute(
+                    sqlQuery + " where shape_id in ({0})".format(', '.join('?' for _ in chunk))
+                    + orderBy, chunk))
+        
+        rowsDict = {}
+        
+        for cursor in cursorList:
+            for row in cursor:
+                if row[0] not in rowsDict:
+                    rowsDict[row[0]] = ([], [], [])
+                latList, lonList, seqList = rowsDict[row[0]]
+                latList.append(float(row[1]))
+                lonList.append(float(row[2]))
+                seqList.append(int(row[3]))
+        
+        shapeDict = {}
+        for shapeId in rowsDict:
+            latArray, lonArray, seqArray = [np.array(x) for x in rowsDict[shapeId]]
+            postArray = np.zeros(len(latArray))
+            postArray[1:] = np.cumsum(kmBetweenLatLonArrays(latArray[:-1], lonArray[:-1],
+                                                            latArray[1:], lonArray[1:]))
+            
+            shape = Shape(shapeId)
+            shape.setArrays(latArray, lonArray, seqArray, postArray)
+            shapeDict[shapeId] = shape
+            
+        return shapeDict
+    
+    
     def getService(self, serviceId=None):
         '''
         Return the calendar information corresponding to the given 
@@ -363,12 +482,12 @@ class GtfsDbManager(object):
         '''
         
         sqlQuery = "SELECT DISTINCT trip_id " \
-                + "FROM trips " \
-                + "WHERE block_id  = \"" + blockId + "\""
+                + "FROM trips_simple " \
+                + "WHERE block_id = ?"
                 
         tripIdList = []
         
-        cursor = self.conn.execute(sqlQuery)
+        cursor = self.conn.execute(sqlQuery, (blockId,))
         for row in cursor:
             tripId = row[0]
             tripIdList.append(tripId)
@@ -376,17 +495,50 @@ class GtfsDbManager(object):
         return tripIdList
     
     
-    def getTripsDict(self):
+    def getTripIdsByBlockId(self, serviceId=None):
+        '''
+        Return a dictionary mapping each block id to the list of its trip
+        ids, read in a single scan. If serviceId is given, only the blocks
+        with trips in that service are included.
+        '''
+        
+        sqlQuery = "SELECT DISTINCT block_id, trip_id " \
+                + "FROM trips "
+        if serviceId is not None:
+            sqlQuery += "WHERE block_id IN (" + BLOCKS_FOR_SERVICE_QUERY + ") "
+            queryTuple = (serviceId,)
+        else:
+            queryTuple = ()
+        sqlQuery += "ORDER BY block_id"
+        
+        blockTripsDict = {}
+        
+        cursor = self.conn.execute(sqlQuery, queryTuple)
+        for row in cursor:
+            blockTripsDict.setdefault(row[0], []).append(row[1])
+            
+        return blockTripsDict
+    
+    
+    def getTripsDict(self, serviceId=None):
         '''
         Return a dictionary associating route and shape ids with trip ids.
+        If serviceId is given, only the trips of blocks with trips in that
+        service are included.
         '''
         
         sqlQuery = "SELECT trip_id, shape_id, route_id, service_id " \
                 + "FROM trips" \
                 
+        if serviceId is not None:
+            sqlQuery += " WHERE block_id IN (" + BLOCKS_FOR_SERVICE_QUERY + ")"
+            queryTuple = (serviceId,)
+        else:
+            queryTuple = ()
+        
         tripsDict = {}
         
-        cursor = self.conn.execute(sqlQuery)
+        cursor = self.conn.execute(sqlQuery, queryTuple)
         for row in cursor:
             tripDict = {'routeId' : row[2],
                         'shapeId' : row[1],
@@ -409,10 +561,10 @@ class GtfsDbManager(object):
         sqlQuery = "SELECT stop_sequence, " \
             + "arr_sec, dep_sec, stop_id " \
             + "FROM stop_times_simple " \
-            + "WHERE trip_id = \"" + tripId + "\" " \
+            + "WHERE trip_id = ? " \
             + "ORDER BY stop_sequence"
             
-        cursor = self.conn.execute(sqlQuery)
+        cursor = self.conn.execute(sqlQuery, (tripId,))
         for row in cursor:
             stopTimeDict = {}
             stopTimeDict['stopSequence'] = int(row[0])
@@ -424,17 +576,26 @@ class GtfsDbManager(object):
         return stopTimesList
     
     
-    def getAllStopTimes(self, tripIdList=None):
+    def getAllStopTimes(self, tripIdList=None, serviceId=None):
         '''
         Return the shape id for the given trip.
 
         Keyword arguments:
         tripId -- string representing trip id.
+        serviceId -- if given (and tripIdList isn't), only return the stop
+                     times of blocks with trips in that service.
         '''
 
         stopTimesDict = {}
 
-        if tripIdList is None:
+        if tripIdList is None and serviceId is not None:
+            sqlQuery = "SELECT trip_id, stop_sequence, " \
+            + "arr_sec, dep_sec, stop_id " \
+            + "FROM stop_times_simple " \
+            + "WHERE trip_id in (SELECT trip_id FROM trips_simple WHERE block_id IN (" \
+            + BLOCKS_FOR_SERVICE_QUERY + "))"
+            cursor = self.conn.execute(sqlQuery, (serviceId,))
+        elif tripIdList is None:
             sqlQuery = "SELECT trip_id, stop_sequence, " \
             + "arr_sec, dep_sec, stop_id " \
             + "FROM stop_times_simple "
@@ -471,9 +632,9 @@ class GtfsDbManager(object):
         
         shapeId = None
         
-        sqlQuery = "SELECT shape_id from trips where trip_id='" + tripId + "'"
+        sqlQuery = "SELECT shape_id from trips_simple where trip_id = ?"
             
-        cursor = self.conn.execute(sqlQuery)
+        cursor = self.conn.execute(sqlQuery, (tripId,))
         for row in cursor:
             shapeId = row[0]
             
@@ -490,15 +651,32 @@ class GtfsDbManager(object):
         
         serviceId = None
         
-        sqlQuery = "SELECT distinct service_id from trips where block_id='" + blockId + "'"
+        sqlQuery = "SELECT distinct service_id from trips_simple where block_id = ?"
             
-        cursor = self.conn.execute(sqlQuery)
+        cursor = self.conn.execute(sqlQuery, (blockId,))
         for row in cursor:
             serviceId = row[0]
             
         return serviceId
     
     
+    def getServiceIdsByBlockId(self):
+        '''
+        Return a dictionary mapping each block id to its service id, read
+        in a single scan.
+        '''
+        
+        sqlQuery = "SELECT DISTINCT block_id, service_id FROM trips"
+        
+        blockServiceDict = {}
+        
+        cursor = self.conn.execute(sqlQuery)
+        for row in cursor:
+            blockServiceDict[row[0]] = row[1]
+            
+        return blockServiceDict
+    
+    
     def getRouteIdForTripId(self, tripId):
         '''
         Return the route id for the given trip.
@@ -509,9 +687,9 @@ class GtfsDbManager(object):
         
         routeId = None
         
-        sqlQuery = "SELECT route_id from trips where trip_id='" + tripId + "'"
+        sqlQuery = "SELECT route_id from trips_simple where trip_id = ?"
             
-        cursor = self.conn.execute(sqlQuery)
+        cursor = self.conn.execute(sqlQuery, (tripId,))
         for row in cursor:
             routeId = row[0]
             
@@ -557,6 +735,103 @@ class GtfsDbManager(object):
         return sched_dict
     
     
+    def getTableMarker(self, tableName):
+        '''
+        Return a cheap change marker for a table: its row count and largest
+        rowid. Loading a new feed into the db (or appending to or deleting
+        from a table) changes it; rows updated in place do not.
+        '''
+        cursor = self.conn.execute("SELECT count(*), max(rowid) FROM %s" % tableName)
+        row = cursor.fetchone()
+        
+        return "%s:%d:%s" % (tableName, row[0], row[1])
+    
+    
+    def getStopShapeFingerprint(self):
+        '''
+        Return a fingerprint of the shapes and stops tables, which are all
+        that stop postmiles depend on. It is made of their change markers
+        (see getTableMarker) and worked out once per manager.
+        '''
+        if self.stopShapeFingerprint is None:
+            self.stopShapeFingerprint = self.getTableMarker("shapes") + "," + \
+                self.getTableMarker("stops")
+        
+        return self.stopShapeFingerprint
+    
+    
+    def getStopShapePosts(self):
+        '''
+        Return a dictionary mapping (shapeId, stopId) to the postKm of the
+        stop projected onto the shape, as saved by saveStopShapePosts. The
+        dictionary is empty if nothing was saved or the shapes or stops
+        have changed since.
+        '''
+        
+        stopPostDict = {}
+        
+        try:
+            cursor = self.conn.execute("SELECT fingerprint FROM stop_shape_posts_meta")
+            rows = cursor.fetchall()
+        except sqlite3.OperationalError:
+            # no saved postmiles
+            return stopPostDict
+        
+        if (len(rows) != 1 or rows[0][0] != self.getStopShapeFingerprint()):
+            self.logger.info("Saved stop postmiles are out of date.")
+            return stopPostDict
+        
+        sqlQuery = "SELECT shape_id, stop_id, post_km FROM stop_shape_posts"
+        
+        cursor = self.conn.execute(sqlQuery)
+        for row in cursor:
+            stopPostDict[(row[0], row[1])] = row[2]
+        
+        self.savedPostKeys = set(stopPostDict)
+            
+        return stopPostDict
+    
+    
+    def saveStopShapePosts(self, stopPostDict):
+        '''
+        Save a dictionary mapping (shapeId, stopId) to postKm into the
+        derived table stop_shape_posts. If the saved postmiles are up to
+        date (as read by getStopShapePosts or saved before), only the pairs
+        not saved yet are inserted; otherwise the table is replaced.
+        '''
+        
+        fingerprint = self.getStopShapeFingerprint()
+        
+        try:
+            with self.conn:
+                if self.savedPostKeys is None:
+                    self.conn.execute("DROP TABLE IF EXISTS stop_shape_posts")
+                    self.conn.execute("CREATE TABLE stop_shape_posts"
+                                      + " (shape_id TEXT, stop_id TEXT, post_km REAL,"
+                                      + " PRIMARY KEY (shape_id, stop_id))")
+                    self.conn.execute("CREATE TABLE IF NOT EXISTS stop_shape_posts_meta"
+                                      + " (fingerprint TEXT)")
+                    self.conn.execute("DELETE FROM stop_shape_posts_meta")
+                    savedPostKeys = set()
+                else:
+                    savedPostKeys = self.savedPostKeys
+                
+                newKeys = [key for key in stopPostDict if key not in savedPostKeys]
+                self.conn.executemany("INSERT OR IGNORE INTO stop_shape_posts"
+                                      + " VALUES (?, ?, ?)",
+                                      ((key[0], key[1], stopPostDict[key])
+                                       for key in newKeys))
+                
+                if self.savedPostKeys is None:
+                    # recorded last, so that an interrupted save is redone
+                    self.conn.execute("INSERT INTO stop_shape_posts_meta VALUES (?)",
+                                      (fingerprint,))
+            savedPostKeys.update(newKeys)
+            self.savedPostKeys = savedPostKeys
+        except sqlite3.Error as e:
+            self.logger.warning("Failed to save stop postmiles: %s" % e)
+    
+    
     def getMillisFromTimeString(self, timeString):
         hour, minute, second = timeString.split(":")
         return (int(second) + 60*int(minute) + 3600*int(hour))*1000
@@ -591,26 +866,25 @@ class GtfsDbManager(object):
 
         return routeIdList
 
+    def getServiceCalendar(self):
+        '''
+        Return the ServiceCalendar compiled from the calendar and
+        calendar_dates tables, built on first use.
+        '''
+        if self.serviceCalendar is None:
+            self.serviceCalendar = readServiceCalendar([self.conn],
+                                                       exclude0000=False)
+        return self.serviceCalendar
+
     def getServiceIdsForDate(self, dt, exclude0000=True):
-        """Return list of service_ids that match a given datetime
+        """Return list of service_ids that match a given datetime,
+        including the calendar_dates exceptions
 
         Inputs:
-            day - int monday=1, sunday =7
+            dt - datetime or date
         """
 
-        dayDict = {1:"monday", 2:"tuesday", 3:"wednesday", 4:"thursday",
-                   5:"friday", 6:"saturday", 7:"sunday"}
-        sqlQuery = "select service_id from calendar" \
-          + " where {} = 1".format(dayDict[dt.isoweekday()]) \
-          + " and start_date <= ? and end_date >= ?;"
-
-        dtstr = dt.date().isoformat().replace('-','')
-        queryTuple = (dtstr, dtstr)
-        cursor = self.conn.execute(sqlQuery, queryTuple)
-
-        serviceIdList = []
-        for row in cursor:
-            serviceIdList.append(row[0])
+        serviceIdList = self.getServiceCalendar().getServiceIdsForDate(dt)
 
         # Get rid of weird serviceId
         if exclude0000:
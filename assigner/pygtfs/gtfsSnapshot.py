@@ -0,0 +1,248 @@
+'''
+Created on Oct 18, 2026
+'''
+from pygtfs.shape import Shape
+from pygtfs.stop import Stop
+from pygtfs.service import Service
+from pygtfs.trip import Trip
+from pygtfs.block import Block
+import hashlib
+import os
+import numpy as np
+
+# bump when the layout of the arrays below changes
+SNAPSHOT_VERSION = 2
+
+# stands for None in the id arrays (a noncharacter, so not in any real id)
+NULL_ID = u'\uffff'
+
+
+def getDbFileStat(dbFileLoc):
+    '''
+    Return (size, mtime) of the GTFS db file, which tell cheaply whether it
+    is the file a snapshot was made from.
+    '''
+    stat = os.stat(dbFileLoc)
+    return stat.st_size, stat.st_mtime
+
+
+def getDbFileHash(dbFileLoc, chunkSize=1 << 20):
+    '''
+    Return the sha1 hex digest of the contents of the GTFS db file.
+    '''
+    digest = hashlib.sha1()
+    with open(dbFileLoc, 'rb') as f:
+        chunk = f.read(chunkSize)
+        while chunk:
+            digest.update(chunk)
+            chunk = f.read(chunkSize)
+
+    return digest.hexdigest()
+
+
+def concatOrEmpty(arrayList, dtype):
+    if (len(arrayList) == 0):
+        return np.zeros(0, dtype=dtype)
+    return np.concatenate(arrayList).astype(dtype)
+
+
+def toIdArray(idList):
+    # ids (or dates) as a fixed-width unicode array, None as NULL_ID, so
+    # that the snapshot has no object arrays (which np.load refuses)
+    return np.array([NULL_ID if x is None else unicode(x) for x in idList],
+                    dtype=np.unicode_)
+
+
+def fromIdArray(idArray):
+    return [None if x == NULL_ID else x for x in idArray.tolist()]
+
+
+def saveSnapshot(gtfsData, fileLoc, dbFileLoc):
+    '''
+    Write the shapes, stops, services, blocks, trips and stop times of
+    gtfsData to fileLoc as flat NumPy arrays (.npz), tagged with the size,
+    modification time and hash of the db file it was loaded from, and the
+    service id gtfsData was restricted to (if any).
+    Variable-length members (shape points, stop times) are concatenated,
+    with an offsets array giving where each shape or trip starts. Ids are
+    stored as strings.
+    '''
+
+    shapeIds = list(gtfsData.shapeDict.keys())
+    shapeList = [gtfsData.shapeDict[shapeId] for shapeId in shapeIds]
+    for shape in shapeList:
+        if shape.latArray is None:
+            shape.buildArrays()
+    shapeOffsets = np.cumsum([0] + [len(shape.latArray) for shape in shapeList])
+
+    stopList = list(gtfsData.stopDict.values())
+
+    serviceList = list(gtfsData.serviceDict.values())
+
+    blockList = list(gtfsData.blockDict.values())
+    tripList = [trip for block in blockList for trip in block.getTripList()]
+    for trip in tripList:
+        if (trip.stopTimeDict is None and trip._stopTimeList is not None):
+            trip.freeze()
+    tripOffsets = np.cumsum([0] + [len(trip.stopSeqArray) for trip in tripList])
+
+    dbSize, dbMtime = getDbFileStat(dbFileLoc)
+    dbHash = getDbFileHash(dbFileLoc)
+
+    stopIdList = []
+    for trip in tripList:
+        if trip._stopTimeList is None:
+            stopIdList.extend(trip.stopIdList)
+        else:
+            stopIdList.extend([st.stopId for st in trip.stopTimeList])
+
+    # written next to fileLoc and renamed into place, so that a reader
+    # never sees a partly written snapshot
+    tempFileLoc = fileLoc + '.tmp'
+    with open(tempFileLoc, 'wb') as f:
+        np.savez(f,
+                 version=np.array(SNAPSHOT_VERSION),
+                 dbSize=np.array(dbSize),
+                 dbMtime=np.array(dbMtime),
+                 dbHash=np.array(dbHash),
+                 serviceIdFilter=np.array(gtfsData.service_id or ''),
+                 timezone=np.array(gtfsData.timezone),
+
+                 shapeIds=toIdArray(shapeIds),
+                 shapeOffsets=shapeOffsets,
+                 shapeLat=concatOrEmpty([s.latArray for s in shapeList], float),
+                 shapeLon=concatOrEmpty([s.lonArray for s in shapeList], float),
+                 shapeSeq=concatOrEmpty([s.seqArray for s in shapeList], int),
+                 shapePost=concatOrEmpty([s.postArray for s in shapeList], float),
+
+                 stopIds=toIdArray([stop.stopId for stop in stopList]),
+                 stopLat=np.array([stop.stopLat for stop in stopList], dtype=float),
+                 stopLon=np.array([stop.stopLon for stop in stopList], dtype=float),
+                 stopNames=np.array([stop.stopName or u'' for stop in stopList],
+                                    dtype=np.unicode_),
+                 stopHasName=np.array([stop.stopName is not None for stop in stopList]),
+
+                 serviceIds=toIdArray([service.serviceId for service in serviceList]),
+                 serviceStart=toIdArray([service.startDate for service in serviceList]),
+                 serviceEnd=toIdArray([service.endDate for service in serviceList]),
+                 serviceDays=np.array([service.dayList for service in serviceList],
+                                      dtype=bool).reshape(-1, 7),
+
+                 blockIds=toIdArray([block.blockId for block in blockList]),
+                 blockServiceIds=toIdArray([block.serviceId for block in blockList]),
+
+                 tripIds=toIdArray([trip.tripId for trip in tripList]),
+                 tripBlockIds=toIdArray([trip.blockId for trip in tripList]),
+                 tripRouteIds=toIdArray([trip.routeId for trip in tripList]),
+                 tripShapeIds=toIdArray([trip.shapeId for trip in tripList]),
+                 tripOffsets=tripOffsets,
+
+                 stopTimeStopIds=toIdArray(stopIdList),
+                 stopTimeSeq=concatOrEmpty([t.stopSeqArray for t in tripList], int),
+                 stopTimeArr=concatOrEmpty([t.arrArray for t in tripList], int),
+                 stopTimeDep=concatOrEmpty([t.depArray for t in tripList], int),
+                 stopTimePost=concatOrEmpty([t.postArray for t in tripList], float))
+    os.rename(tempFileLoc, fileLoc)
+
+
+def checkSnapshot(snapshot, gtfsData, dbFileLoc):
+    '''
+    Return why the snapshot does not fit gtfsData and the db file, or
+    None if it does. The db file is hashed only if its size or
+    modification time differ from when the snapshot was made.
+    '''
+    if ('version' not in snapshot.files or
+        int(snapshot['version']) != SNAPSHOT_VERSION):
+        return 'it has another version'
+    if (snapshot['serviceIdFilter'].tolist() != (gtfsData.service_id or '')):
+        return 'it is for another service id'
+    if ((int(snapshot['dbSize']), float(snapshot['dbMtime'])) !=
+        getDbFileStat(dbFileLoc)):
+        if (snapshot['dbHash'].tolist() != getDbFileHash(dbFileLoc)):
+            return '%s has changed' % dbFileLoc
+    return None
+
+
+def loadSnapshot(gtfsData, fileLoc, dbFileLoc):
+    '''
+    Fill in the shapes, stops, services and blocks of gtfsData from the
+    snapshot at fileLoc. Shape points and stop times are kept as arrays;
+    dict-per-point and StopTime objects are only built where asked for.
+
+    Return False (leaving gtfsData untouched, and logging why) if there is
+    no readable snapshot or it was made from a different db or service id.
+    '''
+
+    if not os.path.exists(fileLoc):
+        gtfsData.logger.info('No snapshot at %s' % fileLoc)
+        return False
+
+    try:
+        snapshot = np.load(fileLoc)
+    except (IOError, ValueError) as e:
+        gtfsData.logger.warning('Rejecting snapshot %s: %s' % (fileLoc, e))
+        return False
+
+    with snapshot:
+        try:
+            reason = checkSnapshot(snapshot, gtfsData, dbFileLoc)
+        except (KeyError, ValueError) as e:
+            reason = 'it is unreadable (%s)' % e
+        if reason is not None:
+            gtfsData.logger.warning('Rejecting snapshot %s: %s' % (fileLoc, reason))
+            return False
+
+        shapeOffsets = snapshot['shapeOffsets']
+        shapeLat = snapshot['shapeLat']
+        shapeLon = snapshot['shapeLon']
+        shapeSeq = snapshot['shapeSeq']
+        shapePost = snapshot['shapePost']
+        for i, shapeId in enumerate(fromIdArray(snapshot['shapeIds'])):
+            i0, i1 = shapeOffsets[i], shapeOffsets[i+1]
+            shape = Shape(shapeId)
+            shape.setArrays(shapeLat[i0:i1], shapeLon[i0:i1],
+                            shapeSeq[i0:i1], shapePost[i0:i1])
+            gtfsData.addShape(shape)
+
+        stopNames = snapshot['stopNames'].tolist()
+        stopHasName = snapshot['stopHasName'].tolist()
+        for i, (stopId, stopLat, stopLon) in enumerate(
+                zip(fromIdArray(snapshot['stopIds']), snapshot['stopLat'].tolist(),
+                    snapshot['stopLon'].tolist())):
+            stopName = stopNames[i] if stopHasName[i] else None
+            gtfsData.addStop(Stop(stopId, stopLat, stopLon, stopName))
+
+        serviceDays = snapshot['serviceDays'].tolist()
+        for i, (serviceId, startDate, endDate) in enumerate(
+                zip(fromIdArray(snapshot['serviceIds']), fromIdArray(snapshot['serviceStart']),
+                    fromIdArray(snapshot['serviceEnd']))):
+            gtfsData.addService(Service(serviceId, startDate, endDate, serviceDays[i]))
+
+        blockDict = {}
+        blockIds = fromIdArray(snapshot['blockIds'])
+        for blockId, serviceId in zip(blockIds,
+                                      fromIdArray(snapshot['blockServiceIds'])):
+            blockDict[blockId] = Block(blockId, serviceId)
+
+        tripOffsets = snapshot['tripOffsets']
+        stopTimeStopIds = fromIdArray(snapshot['stopTimeStopIds'])
+        stopTimeSeq = snapshot['stopTimeSeq']
+        stopTimeArr = snapshot['stopTimeArr']
+        stopTimeDep = snapshot['stopTimeDep']
+        stopTimePost = snapshot['stopTimePost']
+        for i, (tripId, blockId, routeId, shapeId) in enumerate(
+                zip(fromIdArray(snapshot['tripIds']), fromIdArray(snapshot['tripBlockIds']),
+                    fromIdArray(snapshot['tripRouteIds']), fromIdArray(snapshot['tripShapeIds']))):
+            i0, i1 = tripOffsets[i], tripOffsets[i+1]
+            trip = Trip(tripId, blockId, routeId, shapeId)
+            trip.setStopTimeArrays(stopTimeStopIds[i0:i1], stopTimeSeq[i0:i1],
+                                   stopTimeArr[i0:i1], stopTimeDep[i0:i1],
+                                   stopTimePost[i0:i1])
+            blockDict[blockId].addTrip(trip)
+
+        for blockId in blockIds:
+            gtfsData.addBlock(blockDict[blockId])
+
+        gtfsData.timezone = snapshot['timezone'].tolist()
+
+    return True
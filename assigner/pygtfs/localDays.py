@@ -0,0 +1,127 @@
+'''
+Created on Oct 18, 2026
+'''
+from datetime import datetime, timedelta
+import calendar
+import pytz
+import numpy as np
+
+class LocalDays(object):
+    '''
+    The days of a time zone, as UTC timestamps in millis. A day may be
+    taken to start at some hour other than midnight (e.g. the changeover
+    between service days), in which case times before that hour belong
+    to the previous day.
+
+    The bounds of each day are worked out once, with the time zone's DST
+    transitions, and kept. The day of the last lookup is cached, so that
+    looking up a time on the same day is just two comparisons.
+    '''
+
+
+    def __init__(self, timezone, hour=0):
+        '''
+        Constructor
+
+        timezone -- name of the time zone (as in the GTFS agency table).
+        hour -- local hour at which a day starts.
+        '''
+        self.tz = pytz.timezone(timezone)
+        self.hour = hour
+
+        # date ordinal -> (first millis of the day, day start)
+        self.dayDict = {}
+
+        # (first millis, first millis of next day, date ordinal, day start)
+        # of the last lookup
+        self.dayCache = None
+
+        # day bounds and starts for a contiguous range of date ordinals
+        # starting at firstOrd, for the vectorized lookups
+        self.firstOrd = None
+        self.boundArray = None
+        self.dayStartArray = None
+
+
+    def getMillis(self, localTime):
+        return calendar.timegm(localTime.utctimetuple())*1000
+
+
+    def getDateOrdinalSlow(self, timeMillis):
+        localTime = datetime.utcfromtimestamp(timeMillis//1000).replace(
+            tzinfo=pytz.utc).astimezone(self.tz)
+        return (localTime - timedelta(hours=self.hour)).toordinal()
+
+
+    def getDay(self, dateOrd):
+        '''
+        Return (first millis of the day, day start) for the given date
+        ordinal. The day start is the given hour on that date, localized as
+        standard time if it is ambiguous; the day itself begins at the first
+        instant whose local time is on or after that hour.
+        '''
+        if dateOrd not in self.dayDict:
+            naiveStart = datetime.fromordinal(dateOrd) + timedelta(hours=self.hour)
+            dayStart = self.getMillis(self.tz.localize(naiveStart))
+
+            # If the hour happens twice, the day begins at the first one.
+            firstMillis = dayStart
+            dstStart = self.getMillis(self.tz.localize(naiveStart, is_dst=True))
+            if (dstStart < dayStart and self.getDateOrdinalSlow(dstStart) == dateOrd):
+                firstMillis = dstStart
+
+            self.dayDict[dateOrd] = (firstMillis, dayStart)
+
+        return self.dayDict[dateOrd]
+
+
+    def lookup(self, timeMillis):
+        if self.dayCache is not None:
+            dayFirst, nextDayFirst, dateOrd, dayStart = self.dayCache
+            if (dayFirst <= timeMillis < nextDayFirst):
+                return dateOrd, dayStart
+
+        dateOrd = self.getDateOrdinalSlow(timeMillis)
+        dayFirst, dayStart = self.getDay(dateOrd)
+        nextDayFirst = self.getDay(dateOrd + 1)[0]
+        self.dayCache = (dayFirst, nextDayFirst, dateOrd, dayStart)
+
+        return dateOrd, dayStart
+
+
+    def getDayStart(self, timeMillis):
+        '''
+        Return the start (in millis) of the day containing timeMillis.
+        '''
+        return self.lookup(timeMillis)[1]
+
+
+    def getDateOrdinal(self, timeMillis):
+        '''
+        Return the date ordinal of the day containing timeMillis.
+        '''
+        return self.lookup(timeMillis)[0]
+
+
+    def getDayStarts(self, timeArray):
+        '''
+        Vectorized getDayStart for an array of times in millis.
+        '''
+        timeArray = np.asarray(timeArray)
+        if (len(timeArray) == 0):
+            return np.zeros(0, dtype=np.int64)
+
+        firstOrd = self.getDateOrdinalSlow(int(timeArray.min()))
+        lastOrd = self.getDateOrdinalSlow(int(timeArray.max()))
+        if (self.firstOrd is None or firstOrd < self.firstOrd or
+            lastOrd >= self.firstOrd + len(self.dayStartArray)):
+            if self.firstOrd is not None:
+                firstOrd = min(firstOrd, self.firstOrd)
+                lastOrd = max(lastOrd, self.firstOrd + len(self.dayStartArray) - 1)
+            days = [self.getDay(dateOrd) for dateOrd in range(firstOrd, lastOrd + 1)]
+            self.firstOrd = firstOrd
+            self.boundArray = np.array([day[0] for day in days], dtype=np.int64)
+            self.dayStartArray = np.array([day[1] for day in days], dtype=np.int64)
+
+        i = np.searchsorted(self.boundArray, timeArray, 'right') - 1
+        return self.dayStartArray[i]
@@ -52,6 +52,8 @@ class Location(object):
     '''
     classdocs
     '''
+    
+    __slots__ = ('deviceId', 'lat', 'lon', 'ts', 'speed', 'bearing', 'accuracy')
 
     def __init__(self):
         '''
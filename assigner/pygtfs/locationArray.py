@@ -0,0 +1,157 @@
+'''
+Created on Oct 18, 2026
+'''
+import numpy as np
+
+
+def createLocationArrayFromList(locList):
+    '''
+    Return a LocationArray holding the given Location or rawLocation
+    objects, in the same order.
+    '''
+    def getSpeed(loc):
+        # rawLocation calls it spd
+        if hasattr(loc, 'speed'):
+            return loc.speed
+        return loc.spd
+
+    return LocationArray([loc.deviceId for loc in locList],
+                         [loc.ts for loc in locList],
+                         [loc.lat for loc in locList],
+                         [loc.lon for loc in locList],
+                         [getSpeed(loc) for loc in locList],
+                         [loc.bearing for loc in locList],
+                         [loc.accuracy for loc in locList])
+
+
+def toFloatArray(values, n):
+    # missing values (None) are stored as NaN
+    if values is None:
+        return np.repeat(np.nan, n)
+    return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+
+class LocationArray(object):
+    '''
+    Struct-of-arrays store for many locations: one NumPy array per field
+    instead of one object per location. Indexing gives a LocationView,
+    which has the attributes of a Location (and of a rawLocation), so
+    code written against lists of locations can use it unchanged. Slicing
+    gives another LocationArray sharing the same arrays.
+    '''
+
+
+    def __init__(self, deviceIds, ts, lat, lon, speed=None, bearing=None,
+                 accuracy=None):
+        '''
+        Constructor
+
+        deviceIds -- sequence of device ids, or a single id for all locations.
+        ts -- timestamps in millis.
+        lat, lon -- degrees (None for missing).
+        speed, bearing, accuracy -- optional, None for missing.
+        '''
+        self.ts = np.asarray(ts, dtype=np.int64)
+        n = len(self.ts)
+
+        if isinstance(deviceIds, basestring) or not hasattr(deviceIds, '__len__'):
+            deviceIds = [deviceIds]*n
+        self.deviceIds = np.empty(n, dtype=object)
+        self.deviceIds[:] = deviceIds
+
+        self.lat = toFloatArray(lat, n)
+        self.lon = toFloatArray(lon, n)
+        self.speed = toFloatArray(speed, n)
+        self.bearing = toFloatArray(bearing, n)
+        self.accuracy = toFloatArray(accuracy, n)
+
+
+    def __len__(self):
+        return len(self.ts)
+
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            sliced = LocationArray.__new__(LocationArray)
+            for name in ('deviceIds', 'ts', 'lat', 'lon', 'speed', 'bearing',
+                         'accuracy'):
+                setattr(sliced, name, getattr(self, name)[key])
+            return sliced
+
+        if (key < 0):
+            key += len(self.ts)
+        if (key < 0 or key >= len(self.ts)):
+            raise IndexError('LocationArray index out of range')
+
+        return LocationView(self, key)
+
+
+    def __iter__(self):
+        for i in range(len(self.ts)):
+            yield LocationView(self, i)
+
+
+    def nbytes(self):
+        '''
+        Return the number of bytes used by the arrays (device id strings
+        themselves not included).
+        '''
+        return sum(getattr(self, name).nbytes
+                   for name in ('deviceIds', 'ts', 'lat', 'lon', 'speed',
+                                'bearing', 'accuracy'))
+
+
+def getFloatOrNone(array, i):
+    value = array[i]
+    if np.isnan(value):
+        return None
+    return float(value)
+
+
+class LocationView(object):
+    '''
+    One location of a LocationArray, read through to the arrays.
+    '''
+
+    __slots__ = ('locArray', 'index')
+
+    def __init__(self, locArray, index):
+        self.locArray = locArray
+        self.index = index
+
+    @property
+    def deviceId(self):
+        return self.locArray.deviceIds[self.index]
+
+    @property
+    def ts(self):
+        return int(self.locArray.ts[self.index])
+
+    @property
+    def lat(self):
+        return getFloatOrNone(self.locArray.lat, self.index)
+
+    @property
+    def lon(self):
+        return getFloatOrNone(self.locArray.lon, self.index)
+
+    @property
+    def speed(self):
+        return getFloatOrNone(self.locArray.speed, self.index)
+
+    # rawLocation name for speed
+    spd = speed
+
+    @property
+    def bearing(self):
+        return getFloatOrNone(self.locArray.bearing, self.index)
+
+    @property
+    def accuracy(self):
+        return getFloatOrNone(self.locArray.accuracy, self.index)
+
+    def hasLatAndLon(self):
+        return self.lat is not None and self.lon is not None
+
+    def __repr__(self):
+        return "LocationView(%s, %d)" % (self.deviceId, self.ts)
@@ -4,30 +4,62 @@ Created on Sep 8, 2013
 @author: jacob
 '''
 import time
+import numpy as np
 
 class LocationBucket(object):
     '''
-    classdocs
+    Recent locations of a device, in time order. The locations are kept in
+    an array (with their timestamps in a parallel array) that is compacted
+    as it fills, and locations older than retainMillis (before the latest
+    one, or the bucket time if later) are dropped as new ones come in, as
+    are the oldest ones past maxLocations, so the bucket stays the same
+    size however long the device runs.
     '''
 
 
-    def __init__(self, deviceId):
+    def __init__(self, deviceId, retainMillis=30*60*1000, maxLocations=2048):
         '''
         Constructor
+
+        retainMillis -- how long to keep locations for; longer than the
+                        ages getRecent is called with.
+        maxLocations -- most locations to keep (the default holds 30
+                        minutes at one location a second).
         '''
         self.deviceId = deviceId
-        self.locationList = []
         self.time = 0
-        
-    
+        self.retainMillis = retainMillis
+        self.maxLocations = maxLocations
+
+        # The locations are in [start, end) of the arrays, which have room
+        # for twice maxLocations so they only need compacting once in a
+        # while.
+        self.tsArray = np.zeros(2*maxLocations, dtype=np.int64)
+        self.locArray = np.empty(2*maxLocations, dtype=object)
+        self.start = 0
+        self.end = 0
+
+        # timestamps in the bucket
+        self.tsSet = set()
+
+
+    @property
+    def locationList(self):
+        # (a copy, see getRecent)
+        return self.locArray[self.start:self.end].copy()
+
+
     def addLocation(self, loc):
         try:
             if loc.hasLatAndLon():
-                for oldLoc in self.locationList:
-                    if oldLoc.ts == loc.ts:
-                        return False
-                self.locationList.append(loc)
-                self.locationList.sort(key=lambda loc: loc.ts)
+                if loc.ts in self.tsSet:
+                    return False
+                if (self.end > self.start and
+                    loc.ts < max(self.time, self.tsArray[self.end-1]) - self.retainMillis):
+                    # would be dropped straight away
+                    return False
+                self.insertLocation(loc)
+                self.evict()
 #                print "GOOD LOC"
 #                print loc
             else:
@@ -37,27 +69,74 @@ class LocationBucket(object):
         except Exception as e:
             print e
             return False
-        
-        
+
+
+    def insertLocation(self, loc):
+        if (self.end == len(self.tsArray)):
+            self.compact()
+
+        # Locations mostly come in order, so this is usually an append.
+        i = self.end
+        if (self.end > self.start and loc.ts < self.tsArray[self.end-1]):
+            i = self.start + np.searchsorted(self.tsArray[self.start:self.end],
+                                             loc.ts, side='right')
+            self.tsArray[i+1:self.end+1] = self.tsArray[i:self.end]
+            self.locArray[i+1:self.end+1] = self.locArray[i:self.end]
+
+        self.tsArray[i] = loc.ts
+        self.locArray[i] = loc
+        self.end += 1
+        self.tsSet.add(loc.ts)
+
+
+    def compact(self):
+        # move the locations to the start of the arrays
+        n = self.end - self.start
+        self.tsArray[:n] = self.tsArray[self.start:self.end]
+        self.locArray[:n] = self.locArray[self.start:self.end]
+        self.locArray[n:] = None
+        self.start = 0
+        self.end = n
+
+
+    def evict(self):
+        tOld = max(self.time, self.tsArray[self.end-1]) - self.retainMillis
+        nOld = np.searchsorted(self.tsArray[self.start:self.end], tOld, side='left')
+        nOld = max(nOld, self.end - self.start - self.maxLocations)
+        self.dropOldest(nOld)
+
+
+    def dropOldest(self, n):
+        for i in range(self.start, self.start + n):
+            self.tsSet.discard(self.tsArray[i])
+            self.locArray[i] = None
+        self.start += n
+
+
     def clearOld(self, ageMillis):
         tNow = self.time
         tOld = tNow - ageMillis
-        
-        self.locationList = [loc for loc in self.locationList if loc.ts >= tOld]
-        self.locationList.sort(key=lambda loc: loc.ts)
-        
-        
+
+        self.dropOldest(np.searchsorted(self.tsArray[self.start:self.end], tOld,
+                                        side='left'))
+
+
     def getRecent(self, ageMillis):
+        '''
+        Return the locations from the last ageMillis (before the bucket
+        time), oldest first, as an array of their own: adding locations
+        moves those in the bucket's array around (see insertLocation and
+        compact), so a view of it would not stay valid.
+        '''
         tNow = self.time
         tOld = tNow - ageMillis
 
 #        print "location list for device id %s is:" % (self.deviceId)
 #        print self.locationList
-        
-        locList = [loc for loc in self.locationList if loc.ts >= tOld]
-        locList.sort(key=lambda loc: loc.ts)
-        return locList
-        
-        
+
+        i = np.searchsorted(self.tsArray[self.start:self.end], tOld, side='left')
+        return self.locArray[self.start+i:self.end].copy()
+
+
     def checkAgainstTrip(self, trip):
         pass
@@ -0,0 +1,73 @@
+'''
+Created on Oct 18, 2026
+'''
+from pygtfs.util import kmPerDeg, kmBetweenLatLonArrays
+import math
+import numpy as np
+
+class PointGrid(object):
+    '''
+    Uniform lat/lon grid over a set of points. Each cell holds the indices
+    of the points in it, so that finding the points near a location only
+    needs the cells around it.
+    '''
+
+
+    def __init__(self, latArray, lonArray, cellKm):
+        '''
+        Constructor
+
+        latArray, lonArray -- the points.
+        cellKm -- approximate size of a grid cell, in km.
+        '''
+        self.latArray = np.asarray(latArray, dtype=float)
+        self.lonArray = np.asarray(lonArray, dtype=float)
+        self.cellKm = cellKm
+
+        refLat = 0.5*(self.latArray.min() + self.latArray.max())
+        self.dLat = cellKm/kmPerDeg
+        self.dLon = cellKm/(kmPerDeg*math.cos(refLat*math.pi/180.))
+        self.lat0 = self.latArray.min()
+        self.lon0 = self.lonArray.min()
+
+        rows = np.floor((self.latArray - self.lat0)/self.dLat).astype(int)
+        cols = np.floor((self.lonArray - self.lon0)/self.dLon).astype(int)
+
+        cellLists = {}
+        for i in range(len(self.latArray)):
+            cellLists.setdefault((rows[i], cols[i]), []).append(i)
+
+        self.cellDict = {}
+        for cell in cellLists:
+            self.cellDict[cell] = np.array(cellLists[cell], dtype=int)
+
+
+    def getPointsWithin(self, lat, lon, radiusKm):
+        '''
+        Return the sorted indices of the points within radiusKm of
+        (lat, lon).
+        '''
+        r = int(math.floor((lat - self.lat0)/self.dLat))
+        c = int(math.floor((lon - self.lon0)/self.dLon))
+
+        # The cells are cellKm wide at refLat only, and narrower (in km)
+        # nearer the poles, so the columns to search are counted at the
+        # highest latitude the circle reaches.
+        radiusDeg = radiusKm/kmPerDeg
+        maxLat = min(abs(lat) + radiusDeg, 89.)
+        rowRing = int(math.ceil(radiusKm/self.cellKm))
+        colRing = int(math.ceil(radiusDeg/(self.dLon*math.cos(maxLat*math.pi/180.))))
+
+        pointLists = []
+        for rr in range(r - rowRing, r + rowRing + 1):
+            for cc in range(c - colRing, c + colRing + 1):
+                if (rr, cc) in self.cellDict:
+                    pointLists.append(self.cellDict[(rr, cc)])
+
+        if len(pointLists) == 0:
+            return np.zeros(0, dtype=int)
+
+        indices = np.sort(np.concatenate(pointLists))
+        distKm = kmBetweenLatLonArrays(lat, lon, self.latArray[indices],
+                                       self.lonArray[indices])
+        return indices[distKm <= radiusKm]
@@ -35,6 +35,8 @@ class ProjectedLocation(Location):
     '''
     classdocs
     '''
+    
+    __slots__ = ('postKm', 'perpKm', 'tripId', 'routeId')
 
 
     def __init__(self):
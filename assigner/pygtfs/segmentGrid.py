@@ -0,0 +1,112 @@
+'''
+Created on Oct 18, 2026
+'''
+from pygtfs.util import kmPerDeg
+import math
+import numpy as np
+
+class SegmentGrid(object):
+    '''
+    Uniform lat/lon grid over the segments of a shape. Each cell holds the
+    indices of the segments whose bounding box overlaps it, so that a point
+    only needs to be tested against the segments in the cells around it.
+    '''
+
+
+    def __init__(self, latArray, lonArray, cellKm=0.25):
+        '''
+        Constructor
+
+        latArray, lonArray -- shape points; segment i joins points i and i+1.
+        cellKm -- approximate size of a grid cell, in km.
+        '''
+        self.cellKm = cellKm
+
+        refLat = 0.5*(latArray.min() + latArray.max())
+        self.dLat = cellKm/kmPerDeg
+        self.dLon = cellKm/(kmPerDeg*math.cos(refLat*math.pi/180.))
+        self.lat0 = latArray.min()
+        self.lon0 = lonArray.min()
+
+        rows = np.floor((latArray - self.lat0)/self.dLat).astype(int)
+        cols = np.floor((lonArray - self.lon0)/self.dLon).astype(int)
+
+        # the cell range of each segment's bounding box
+        r0 = np.minimum(rows[:-1], rows[1:])
+        c0 = np.minimum(cols[:-1], cols[1:])
+        nCols = np.abs(cols[1:] - cols[:-1]) + 1
+        nCells = (np.abs(rows[1:] - rows[:-1]) + 1)*nCols
+
+        # one entry per (segment, cell) pair, the cells of each segment
+        # counted row by row
+        segArray = np.repeat(np.arange(len(nCells)), nCells)
+        k = np.arange(len(segArray)) - np.repeat(np.cumsum(nCells) - nCells, nCells)
+        nColsArray = np.repeat(nCols, nCells)
+        cellRows = np.repeat(r0, nCells) + k//nColsArray
+        cellCols = np.repeat(c0, nCells) + k%nColsArray
+
+        # grouped by cell, segments in order within each cell
+        order = np.lexsort((segArray, cellCols, cellRows))
+        segArray = segArray[order]
+        cellRows = cellRows[order]
+        cellCols = cellCols[order]
+        newCell = (cellRows[1:] != cellRows[:-1]) | (cellCols[1:] != cellCols[:-1])
+        starts = np.flatnonzero(np.concatenate(([len(segArray) > 0], newCell)))
+        ends = np.append(starts[1:], len(segArray))
+
+        self.cellDict = {}
+        for i, j in zip(starts.tolist(), ends.tolist()):
+            self.cellDict[(int(cellRows[i]), int(cellCols[i]))] = segArray[i:j]
+
+        # neighbourhoods already looked up, keyed by (row, col, ring)
+        self.nearDict = {}
+
+
+    def getSegmentsNear(self, lat, lon, ring):
+        '''
+        Return the sorted indices of all segments in the cells within ring
+        cells of the cell containing (lat, lon). Any segment passing within
+        ring*cellKm of the point is included.
+        '''
+        r = int(math.floor((lat - self.lat0)/self.dLat))
+        c = int(math.floor((lon - self.lon0)/self.dLon))
+
+        return self.getSegmentsNearCell(r, c, ring)
+
+
+    def getCells(self, latArray, lonArray):
+        '''
+        Return arrays (rows, cols) of the cells containing the points.
+        '''
+        rows = np.floor((np.asarray(latArray) - self.lat0)/self.dLat).astype(int)
+        cols = np.floor((np.asarray(lonArray) - self.lon0)/self.dLon).astype(int)
+        return rows, cols
+
+
+    def getSegmentsNearCell(self, r, c, ring):
+        '''
+        getSegmentsNear for the points in cell (r, c).
+        '''
+        key = (r, c, ring)
+        if key in self.nearDict:
+            return self.nearDict[key]
+
+        segIndices = self.collectSegments(r, c, ring)
+        if len(segIndices) > 0:
+            # (points far from the shape are not worth remembering)
+            self.nearDict[key] = segIndices
+
+        return segIndices
+
+
+    def collectSegments(self, r, c, ring):
+        segLists = []
+        for rr in range(r - ring, r + ring + 1):
+            for cc in range(c - ring, c + ring + 1):
+                if (rr, cc) in self.cellDict:
+                    segLists.append(self.cellDict[(rr, cc)])
+
+        if len(segLists) == 0:
+            return np.zeros(0, dtype=int)
+
+        return np.unique(np.concatenate(segLists))
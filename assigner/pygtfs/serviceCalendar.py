@@ -0,0 +1,207 @@
+'''
+Created on Oct 18, 2026
+'''
+from datetime import datetime
+import numpy as np
+
+# date(1970, 1, 1).toordinal(), to convert datetime64 dates
+EPOCH_ORDINAL = 719163
+
+
+def toDateOrdinals(dates):
+    '''
+    Return the date ordinals of dates, which may be a date, datetime,
+    date ordinal or datetime64, or an array or sequence of them.
+    '''
+    dates = np.asarray(dates)
+    if np.issubdtype(dates.dtype, np.datetime64):
+        return dates.astype('datetime64[D]').astype(np.int64) + EPOCH_ORDINAL
+    if (dates.dtype == object):
+        return np.array([date.toordinal() for date in dates.flat],
+                        dtype=np.int64).reshape(dates.shape)
+    return dates.astype(np.int64)
+
+
+def getDateOrdinal(dateString):
+    # dates are in YYYYMMDD string format
+    return datetime.strptime(dateString, "%Y%m%d").toordinal()
+
+
+def readServiceCalendar(connList, exclude0000=True):
+    '''
+    Read the calendar and calendar_dates tables of one or more GTFS feeds
+    (sqlite3 connections) into a ServiceCalendar. The exceptions of a feed
+    apply to its own calendar rows only; calendar rows repeated across
+    feeds are merged only if they have the same exceptions too.
+    '''
+    entryList = []
+    # (entry, frozenset of its exceptions) -> index in entryList
+    entryIndexDict = {}
+    exceptionList = []
+
+    for conn in connList:
+        # the feed's entries, each with the list of its exceptions as
+        # (date ordinal, isAdded)
+        feedEntryList = []
+        feedExceptionLists = []
+        feedEntryIndexDict = {}
+        # service id -> indices in feedEntryList
+        feedEntryDict = {}
+
+        def addFeedEntry(entry):
+            if entry not in feedEntryIndexDict:
+                feedEntryIndexDict[entry] = len(feedEntryList)
+                feedEntryList.append(entry)
+                feedExceptionLists.append([])
+            return feedEntryIndexDict[entry]
+
+        sqlQuery = "select service_id, start_date, end_date, monday, tuesday," \
+            + " wednesday, thursday, friday, saturday, sunday from calendar"
+        for row in conn.execute(sqlQuery):
+            serviceId = row[0]
+            if (exclude0000 and serviceId == '0000'):
+                continue
+            entry = (serviceId, row[1], row[2],
+                     tuple(str(x) == '1' for x in row[3:10]))
+            feedEntryDict.setdefault(serviceId, []).append(addFeedEntry(entry))
+
+        hasCalendarDates = conn.execute("select name from sqlite_master"
+            + " where type = 'table' and name = 'calendar_dates'").fetchone()
+        if hasCalendarDates is not None:
+            sqlQuery = "select service_id, date, exception_type from calendar_dates"
+            for serviceId, dateString, exceptionType in conn.execute(sqlQuery):
+                if (exclude0000 and serviceId == '0000'):
+                    continue
+                isAdded = (str(exceptionType) == '1')
+                if (serviceId not in feedEntryDict and isAdded):
+                    # a service given only by its exceptions
+                    entry = (serviceId, None, None, (False,)*7)
+                    feedEntryDict[serviceId] = [addFeedEntry(entry)]
+                for feedIndex in feedEntryDict.get(serviceId, []):
+                    feedExceptionLists[feedIndex].append(
+                        (getDateOrdinal(dateString), isAdded))
+
+        for entry, feedExceptionList in zip(feedEntryList, feedExceptionLists):
+            key = (entry, frozenset(feedExceptionList))
+            if key in entryIndexDict:
+                continue
+            entryIndexDict[key] = len(entryList)
+            for dateOrd, isAdded in feedExceptionList:
+                exceptionList.append((len(entryList), dateOrd, isAdded))
+            entryList.append(entry)
+
+    return ServiceCalendar(entryList, exceptionList)
+
+
+class ServiceCalendar(object):
+    '''
+    Compiled service calendar: a dense boolean matrix with a row per date
+    and a column per calendar entry (a calendar row: service id, start and
+    end dates, days of the week), true where the entry runs on the date.
+    Entries run from their start date to their end date inclusive, with
+    the calendar_dates exceptions applied. Looking up the services of any
+    number of dates is then one indexing operation.
+    '''
+
+
+    def __init__(self, entryList, exceptionList):
+        '''
+        Constructor
+
+        entryList -- list of (service id, start date, end date, tuple of
+                     seven booleans, Monday first), dates as YYYYMMDD
+                     strings or None for a service with no regular days.
+        exceptionList -- list of (index in entryList, date ordinal, True if
+                         service is added on that date, False if removed).
+        '''
+        self.entryList = entryList
+        self.serviceIdArray = np.array([entry[0] for entry in entryList],
+                                       dtype=object)
+
+        startOrds = np.array([getDateOrdinal(entry[1]) if entry[1] else 0
+                              for entry in entryList], dtype=np.int64)
+        endOrds = np.array([getDateOrdinal(entry[2]) if entry[2] else -1
+                            for entry in entryList], dtype=np.int64)
+        dayMatrix = np.array([entry[3] for entry in entryList],
+                             dtype=bool).reshape(-1, 7)
+
+        hasDates = (startOrds <= endOrds)
+        dateOrdList = (list(startOrds[hasDates]) + list(endOrds[hasDates]) +
+                       [exception[1] for exception in exceptionList])
+        if (len(dateOrdList) == 0):
+            self.firstOrd = 0
+            self.activeMatrix = np.zeros((0, len(entryList)), dtype=bool)
+            return
+
+        self.firstOrd = min(dateOrdList)
+        dateOrds = np.arange(self.firstOrd, max(dateOrdList) + 1)
+
+        # date ordinal 1 (Jan 1 of year 1) is a Monday
+        self.activeMatrix = (dayMatrix.T[(dateOrds - 1) % 7] &
+                             (dateOrds[:, np.newaxis] >= startOrds) &
+                             (dateOrds[:, np.newaxis] <= endOrds))
+
+        for entryIndex, dateOrd, isAdded in exceptionList:
+            self.activeMatrix[dateOrd - self.firstOrd, entryIndex] = isAdded
+
+
+    def getActive(self, dates):
+        '''
+        Return a boolean array, true where an entry runs on a date: of
+        shape (number of entries,) for a single date, or with a row per
+        date for an array of dates. Dates outside the calendar have no
+        service.
+        '''
+        rows = toDateOrdinals(dates) - self.firstOrd
+        inRange = (rows >= 0) & (rows < len(self.activeMatrix))
+        if (len(self.activeMatrix) == 0):
+            return np.zeros(rows.shape + (len(self.entryList),), dtype=bool)
+        active = self.activeMatrix[np.clip(rows, 0, len(self.activeMatrix) - 1)]
+        return active & inRange[..., np.newaxis]
+
+
+    def getServiceIdsForDate(self, date):
+        '''
+        Return the list of service ids running on the given date.
+        '''
+        serviceIdList = []
+        for serviceId in self.serviceIdArray[self.getActive(date)]:
+            if serviceId not in serviceIdList:
+                serviceIdList.append(serviceId)
+        return serviceIdList
+
+
+    def getServiceDateDict(self, serviceIds=None):
+        '''
+        Return a dictionary mapping each date with service (as a date
+        ordinal) to the frozenset of service ids running on it, counting
+        only the services in serviceIds if given.
+        '''
+        columns = np.ones(len(self.entryList), dtype=bool)
+        if serviceIds is not None:
+            columns = np.array([serviceId in serviceIds
+                                for serviceId in self.serviceIdArray], dtype=bool)
+        serviceIdArray = self.serviceIdArray[columns]
+        activeMatrix = self.activeMatrix[:, columns]
+
+        serviceDateDict = {}
+        for row in np.flatnonzero(activeMatrix.any(axis=1)):
+            serviceDateDict[int(self.firstOrd + row)] = \
+                frozenset(serviceIdArray[activeMatrix[row]])
+        return serviceDateDict
+
+
+    def getSingleEntries(self, dates):
+        '''
+        Return, for each of the dates, the index of the one entry running on
+        that date, or -1 if there are none or several.
+        '''
+        active = self.getActive(dates)
+        if (len(self.entryList) == 0):
+            return np.full(active.shape[:-1], -1, dtype=np.int64)
+        return np.where(active.sum(axis=-1) == 1, active.argmax(axis=-1), -1)
+
+
+    def describeEntry(self, entryIndex):
+        serviceId, startDate, endDate, dayTuple = self.entryList[entryIndex]
+        return "%s (%s - %s)" % (serviceId, startDate, endDate)
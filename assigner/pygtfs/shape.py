@@ -4,6 +4,9 @@ Created on Sep 8, 2013
 @author: jacob
 '''
 from pygtfs.util import kmBetweenLatLonPair
+from pygtfs.segmentGrid import SegmentGrid
+import math
+import numpy as np
 
 class Shape(object):
     '''
@@ -16,13 +19,40 @@ class Shape(object):
         Constructor
         '''
         self.shapeId = shapeId
-        self.pointList = []
+        # list of point dicts; None while the shape only has arrays (see
+        # setArrays), in which case it is built when first needed.
+        self._pointList = []
+
+        # Contiguous copies of the point list, used for vectorized
+        # projection. These are (re)built by buildArrays.
+        self.latArray = None
+        self.lonArray = None
+        self.seqArray = None
+        self.postArray = None
+        self.segDLat = None
+        self.segDLon = None
+        self.segPost = None
+
+        # Optional spatial index over the segments (see buildIndex), and
+        # the neighbourhoods (in grid cells) searched before a full scan.
+        self.segmentGrid = None
+        self.searchRings = (1, 2, 4)
         
         
     def __eq__(self, other):
         return self.shapeId == other.shapeId
     
     
+    @property
+    def pointList(self):
+        if self._pointList is None:
+            self._pointList = [{'lat' : lat, 'lon' : lon, 'seq' : seq, 'post' : post}
+                               for lat, lon, seq, post in
+                               zip(self.latArray.tolist(), self.lonArray.tolist(),
+                                   self.seqArray.tolist(), self.postArray.tolist())]
+        return self._pointList
+    
+    
     def addPoint(self, lat, lon, seq):
         post = 0.0
         if (len(self.pointList) > 0):
@@ -33,4 +63,297 @@ class Shape(object):
             
         point = {'lat' : lat, 'lon' : lon, 
                  'seq' : seq, 'post' : post}
-        self.pointList.append(point)
\ No newline at end of file
+        self.pointList.append(point)
+
+        # arrays and index are stale now
+        self.latArray = None
+        self.segmentGrid = None
+
+
+    def buildArrays(self):
+        '''
+        Build the point arrays (lat, lon, cumulative post) and the segment
+        arrays (lat/lon vectors in degrees, length in km) from pointList.
+        '''
+        self.latArray = np.array([pt['lat'] for pt in self.pointList], dtype=float)
+        self.lonArray = np.array([pt['lon'] for pt in self.pointList], dtype=float)
+        self.seqArray = np.array([pt['seq'] for pt in self.pointList], dtype=int)
+        self.postArray = np.array([pt['post'] for pt in self.pointList], dtype=float)
+
+        self.buildSegmentArrays()
+
+
+    def buildSegmentArrays(self):
+        self.segDLat = np.diff(self.latArray)
+        self.segDLon = np.diff(self.lonArray)
+        self.segPost = np.diff(self.postArray)
+
+
+    def setArrays(self, latArray, lonArray, seqArray, postArray):
+        '''
+        Set the points of the shape from arrays of latitude, longitude,
+        sequence and cumulative post (e.g. from a snapshot), replacing any
+        existing points. pointList is only built if it is asked for.
+        '''
+        self.latArray = np.asarray(latArray, dtype=float)
+        self.lonArray = np.asarray(lonArray, dtype=float)
+        self.seqArray = np.asarray(seqArray, dtype=int)
+        self.postArray = np.asarray(postArray, dtype=float)
+        self._pointList = None
+
+        self.buildSegmentArrays()
+        self.segmentGrid = None
+
+
+    def buildIndex(self, cellKm=0.25):
+        '''
+        Build the spatial segment index used to limit projections to the
+        segments near a point.
+        '''
+        if self.latArray is None:
+            self.buildArrays()
+
+        self.segmentGrid = SegmentGrid(self.latArray, self.lonArray, cellKm)
+
+
+    def getSegmentsNear(self, lat, lon):
+        '''
+        Yield (segIndices, reachDeg) for growing neighbourhoods of the point,
+        where every segment passing within reachDeg (in degrees of latitude)
+        of the point is among segIndices. Nothing is yielded if there is no
+        index; callers should then fall back to a full scan.
+        '''
+        if self.segmentGrid is None:
+            return
+
+        for ring in self.searchRings:
+            segIndices = self.segmentGrid.getSegmentsNear(lat, lon, ring)
+            if len(segIndices) > 0:
+                # allow for the cell width varying slightly with latitude
+                yield segIndices, 0.9*ring*self.segmentGrid.dLat
+
+
+    def projectToSegments(self, lat, lon, segIndices=None):
+        '''
+        Project a point onto each of the given segments (segment i joins
+        points i and i+1; all segments if segIndices is None).
+
+        Return arrays (xproj, yproj, postKm) of the projected points, where
+        xproj and yproj are offsets from the given point in degrees of
+        latitude, together with the longitude conversion factor used.
+        '''
+
+        if self.latArray is None:
+            self.buildArrays()
+
+        # lat, lon constitute the origin of our local coordinate system.
+        # Latitudes represent y-distances, longitudes x-distances (need to
+        # correct for the local latitude, though). All segments are
+        # projected at once.
+
+        # Without worrying about ellipsoidalness, this gives the relationship
+        # between the length of a point of latitude and the length of a point
+        # of longitude (to within ~0.5% for ~spherical Earth).
+        convFactor = math.cos(lat*math.pi/180.)
+
+        if segIndices is None:
+            y1 = self.latArray[:-1] - lat
+            x1 = (self.lonArray[:-1] - lon)*convFactor
+            dy = self.segDLat
+            dx = self.segDLon*convFactor
+            post1 = self.postArray[:-1]
+            segPost = self.segPost
+        else:
+            y1 = self.latArray[segIndices] - lat
+            x1 = (self.lonArray[segIndices] - lon)*convFactor
+            dy = self.segDLat[segIndices]
+            dx = self.segDLon[segIndices]*convFactor
+            post1 = self.postArray[segIndices]
+            segPost = self.segPost[segIndices]
+
+        # fraction along each segment of the closest point to the origin
+        # (zero-length segments give frac = 0, i.e. their first point)
+        segLenSq = dx*dx + dy*dy
+        segLenSq[segLenSq == 0.] = 1.
+        frac = -(x1*dx + y1*dy)/segLenSq
+        np.clip(frac, 0., 1., out=frac)
+
+        xproj = x1 + frac*dx
+        yproj = y1 + frac*dy
+        postKm = post1 + frac*segPost
+
+        return xproj, yproj, postKm, convFactor
+
+
+    def projectPoint(self, lat, lon):
+        '''
+        Return (latProj, lonProj, postKm) of the point on the shape closest
+        to the given latitude and longitude.
+        '''
+
+        if self.latArray is None:
+            self.buildArrays()
+
+        if (len(self.latArray) == 1):
+            return self.latArray[0], self.lonArray[0], self.postArray[0]
+
+        for segIndices, reachDeg in self.getSegmentsNear(lat, lon):
+            xproj, yproj, postKm, convFactor = \
+                self.projectToSegments(lat, lon, segIndices)
+            perpSq = xproj*xproj + yproj*yproj
+            i = np.argmin(perpSq)
+            if (perpSq[i] <= reachDeg*reachDeg):
+                # nothing outside the searched cells can be closer
+                break
+        else:
+            # no index, or far off-route: test every segment
+            xproj, yproj, postKm, convFactor = self.projectToSegments(lat, lon)
+            i = np.argmin(xproj*xproj + yproj*yproj)
+
+        latProj = float(yproj[i] + lat)
+        lonProj = float(xproj[i]/convFactor + lon)
+
+        return latProj, lonProj, float(postKm[i])
+
+
+    def projectPointWithTarget(self, lat, lon, postTarget, postTol):
+        '''
+        Like projectPoint, but only segments whose projected postmile is
+        within postTol of postTarget may win (the first segment is always
+        allowed, as a default).
+        '''
+
+        if self.latArray is None:
+            self.buildArrays()
+
+        nSeg = len(self.latArray) - 1
+        if (nSeg == 0):
+            return self.latArray[0], self.lonArray[0], self.postArray[0]
+
+        # Posts are cumulative, so the segments that can project to within
+        # postTol of postTarget form a window, found by bisection (widened
+        # by a segment on each side to be safe against rounding).
+        i0 = max(np.searchsorted(self.postArray, postTarget - postTol) - 2, 0)
+        i1 = min(np.searchsorted(self.postArray, postTarget + postTol, 'right') + 1,
+                 nSeg)
+        segIndices = np.r_[0, i0:i1]
+
+        xproj, yproj, postKm, convFactor = \
+            self.projectToSegments(lat, lon, segIndices)
+        perpSq = xproj*xproj + yproj*yproj
+        perpSq[np.fabs(postKm - postTarget) >= postTol] = np.inf
+        perpSq[0] = xproj[0]*xproj[0] + yproj[0]*yproj[0]
+        i = np.argmin(perpSq)
+
+        latProj = float(yproj[i] + lat)
+        lonProj = float(xproj[i]/convFactor + lon)
+
+        return latProj, lonProj, float(postKm[i])
+
+
+    def projectPoints(self, lats, lons, maxCells=1000000):
+        '''
+        Vectorized projectPoint for arrays of latitudes and longitudes. As
+        in projectPoint, the points are first tested only against the
+        segments in the grid cells around them (all the points of a cell at
+        once), widening the search as needed; points with no index, or far
+        off-route, are tested against every segment, in chunks of at most
+        maxCells point-segment pairs.
+
+        Return arrays (latProj, lonProj, postKm).
+        '''
+
+        if self.latArray is None:
+            self.buildArrays()
+
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        nPts = len(lats)
+        nSeg = len(self.latArray) - 1
+
+        if (nSeg == 0):
+            return (np.repeat(self.latArray[0], nPts),
+                    np.repeat(self.lonArray[0], nPts),
+                    np.repeat(self.postArray[0], nPts))
+
+        latProj = np.empty(nPts)
+        lonProj = np.empty(nPts)
+        postKm = np.empty(nPts)
+
+        # indices of the points not projected yet
+        todo = np.arange(nPts)
+
+        if (self.segmentGrid is not None and nPts > 0):
+            rows, cols = self.segmentGrid.getCells(lats, lons)
+            for ring in self.searchRings:
+                cellDict = {}
+                for j in todo.tolist():
+                    cellDict.setdefault((rows[j], cols[j]), []).append(j)
+
+                # allow for the cell width varying slightly with latitude
+                reachDeg = 0.9*ring*self.segmentGrid.dLat
+                todoList = []
+                for (r, c), jList in cellDict.items():
+                    segIndices = self.segmentGrid.getSegmentsNearCell(r, c, ring)
+                    if (len(segIndices) == 0):
+                        todoList.extend(jList)
+                        continue
+                    sel = np.array(jList, dtype=int)
+                    lat, lon, post, perpSq = \
+                        self.projectPointsToSegments(lats[sel], lons[sel], segIndices)
+                    # nothing outside the searched cells can be closer
+                    found = (perpSq <= reachDeg*reachDeg)
+                    latProj[sel[found]] = lat[found]
+                    lonProj[sel[found]] = lon[found]
+                    postKm[sel[found]] = post[found]
+                    todoList.extend(sel[~found].tolist())
+                todo = np.array(sorted(todoList), dtype=int)
+
+        # no index, or far off-route: test every segment
+        chunk = max(1, maxCells//nSeg)
+        for j0 in range(0, len(todo), chunk):
+            sel = todo[j0:j0+chunk]
+            latProj[sel], lonProj[sel], postKm[sel], perpSq = \
+                self.projectPointsToSegments(lats[sel], lons[sel])
+
+        return latProj, lonProj, postKm
+
+
+    def projectPointsToSegments(self, lats, lons, segIndices=None):
+        '''
+        Project each point onto the closest of the given segments (all
+        segments if segIndices is None).
+
+        Return arrays (latProj, lonProj, postKm, perpSq), perpSq being the
+        squared distance to the projection in degrees of latitude.
+        '''
+        # one row per point, one column per segment
+        lat = lats[:, np.newaxis]
+        lon = lons[:, np.newaxis]
+        convFactor = np.cos(lat*math.pi/180.)
+
+        if segIndices is None:
+            segIndices = np.arange(len(self.latArray) - 1)
+
+        y1 = self.latArray[segIndices] - lat
+        x1 = (self.lonArray[segIndices] - lon)*convFactor
+        dy = self.segDLat[segIndices]
+        dx = self.segDLon[segIndices]*convFactor
+
+        segLenSq = dx*dx + dy*dy
+        segLenSq[segLenSq == 0.] = 1.
+        frac = -(x1*dx + y1*dy)/segLenSq
+        np.clip(frac, 0., 1., out=frac)
+
+        xproj = x1 + frac*dx
+        yproj = y1 + frac*dy
+        perpSq = xproj*xproj + yproj*yproj
+
+        i = np.argmin(perpSq, axis=1)
+        rows = np.arange(len(i))
+        seg = segIndices[i]
+
+        return (yproj[rows, i] + lats,
+                xproj[rows, i]/convFactor[:, 0] + lons,
+                self.postArray[seg] + frac[rows, i]*self.segPost[seg],
+                perpSq[rows, i])
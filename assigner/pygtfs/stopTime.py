@@ -5,6 +5,9 @@ Created on Sep 2, 2013
 '''
 
 class StopTime(object):
+    
+    __slots__ = ('tripId', 'stopId', 'stopSequence', 'arrTimeMillis',
+                 'depTimeMillis', 'postKm')
 
     def __init__(self, tripId, stopId, stopSequence, arrTimeMillis, depTimeMillis, postKm):
         '''
@@ -37,3 +40,12 @@ class StopTime(object):
 
     def __repr__(self):
         return "StopTime(stop_id = %s, trip_id = %s)" % (self.stopId, self.tripId)
+    
+    
+    # to handle pickling (__slots__ has no __dict__ to save)
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+    
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
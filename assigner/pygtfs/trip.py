@@ -3,6 +3,9 @@ Created on Sep 2, 2013
 
 @author: jacob
 '''
+import bisect
+import numpy as np
+from pygtfs.stopTime import StopTime
 
 class Trip(object):
 
@@ -11,7 +14,22 @@ class Trip(object):
         self.blockId = blockId
         self.routeId = routeId
         self.shapeId = shapeId
-        self.stopTimeList = []
+        # None while the trip only has stop time arrays (see
+        # setStopTimeArrays), in which case it is built when first needed.
+        self._stopTimeList = []
+        self.stopIdList = None
+        
+        # (tripId, stopId) pairs already in stopTimeList
+        self.stopTimeKeys = set()
+        
+        # Array form of the stop times, built by freeze() and invalidated
+        # when stop times are added.
+        self.stopTimeDict = None
+        self.stopSeqArray = None
+        self.arrArray = None
+        self.depArray = None
+        self.postArray = None
+        self.postMinList = None
     
     
     def __eq__(self, other):
@@ -33,43 +51,134 @@ class Trip(object):
         return "Trip(%s)" % (self.tripId)
     
     
+    @property
+    def stopTimeList(self):
+        if self._stopTimeList is None:
+            self._stopTimeList = [StopTime(self.tripId, stopId, stopSeq,
+                                           arrTime, depTime, postKm)
+                                  for stopId, stopSeq, arrTime, depTime, postKm in
+                                  zip(self.stopIdList, self.stopSeqArray.tolist(),
+                                      self.arrArray.tolist(), self.depArray.tolist(),
+                                      self.postArray.tolist())]
+            self.stopTimeKeys = set((self.tripId, stopId) for stopId in self.stopIdList)
+        return self._stopTimeList
+    
+    
     def addStopTime(self, stopTime):
-        if (stopTime not in self.stopTimeList):
-            self.stopTimeList.append(stopTime)
-            self.stopTimeList.sort()
+        key = (stopTime.tripId, stopTime.stopId)
+        if (key not in self.stopTimeKeys):
+            self.stopTimeKeys.add(key)
+            bisect.insort(self.stopTimeList, stopTime)
+            self.stopTimeDict = None
+            
+    
+    def addStopTimes(self, stopTimeList):
+        '''
+        Add many stop times at once, sorting only once, and freeze the trip.
+        '''
+        for stopTime in stopTimeList:
+            key = (stopTime.tripId, stopTime.stopId)
+            if (key not in self.stopTimeKeys):
+                self.stopTimeKeys.add(key)
+                self.stopTimeList.append(stopTime)
+        
+        self.stopTimeList.sort()
+        self.freeze()
+        
+        
+    def freeze(self):
+        '''
+        Build the array form of the stop times: stop sequences, arrival
+        and departure millis and postKm, in stop sequence order, plus a
+        dictionary from stop sequence to stop time.
+        '''
+        self.stopSeqArray = np.array([st.stopSequence for st in self.stopTimeList])
+        self.arrArray = np.array([st.arrTimeMillis for st in self.stopTimeList])
+        self.depArray = np.array([st.depTimeMillis for st in self.stopTimeList])
+        self.postArray = np.array([st.postKm for st in self.stopTimeList], dtype=float)
+        
+        # Smallest postKm at or after each stop. This is sorted even if the
+        # postKms of the stops aren't, and the last stop with postKm below
+        # some value is the last stop where this minimum is below it.
+        self.postMinList = list(np.minimum.accumulate(self.postArray[::-1])[::-1])
+        
+        self.stopTimeDict = {}
+        for stopTime in self.stopTimeList:
+            if (stopTime.stopSequence not in self.stopTimeDict):
+                self.stopTimeDict[stopTime.stopSequence] = stopTime
+    
+    
+    def setStopTimeArrays(self, stopIdList, stopSeqArray, arrArray, depArray,
+                          postArray):
+        '''
+        Set the stop times of the trip from a list of stop ids and arrays
+        of stop sequences, arrival and departure millis and postKm, in stop
+        sequence order (e.g. from a snapshot). StopTime objects are only
+        created if stopTimeList is asked for.
+        '''
+        self.stopIdList = list(stopIdList)
+        self.stopSeqArray = np.asarray(stopSeqArray)
+        self.arrArray = np.asarray(arrArray)
+        self.depArray = np.asarray(depArray)
+        self.postArray = np.asarray(postArray, dtype=float)
+        self.postMinList = list(np.minimum.accumulate(self.postArray[::-1])[::-1])
+        
+        self._stopTimeList = None
+        self.stopTimeDict = None
             
     
     def getFirstDepartureMillis(self):
+        if self._stopTimeList is None:
+            return int(self.depArray[0])
         return self.stopTimeList[0].depTimeMillis
     
     
     def getLastArrivalMillis(self):
+        if self._stopTimeList is None:
+            return int(self.arrArray[-1])
         return self.stopTimeList[-1].arrTimeMillis
     
     
+    def getStopIds(self):
+        if self._stopTimeList is None:
+            return list(self.stopIdList)
+        return [st.stopId for st in self.stopTimeList]
+    
+    
     def getLastStopId(self):
+        if self._stopTimeList is None:
+            return self.stopIdList[-1]
         return self.stopTimeList[-1].stopId
     
     
     def getLastStopSequence(self):
+        if self._stopTimeList is None:
+            return int(self.stopSeqArray[-1])
         return self.stopTimeList[-1].stopSequence
     
     
     def getStopSequencesForPost(self, postKm, thresh):
+        # arrStop is the last stop before postKm + thresh, depStop the last
+        # stop before postKm - thresh (-1 if there are none).
+        if (self.stopTimeDict is None and self._stopTimeList is not None):
+            self.freeze()
+        
         arrStop = -1
         depStop = -1
-        for stopTime in self.stopTimeList:
-            if (stopTime.postKm < postKm + thresh):
-                arrStop = stopTime.stopSequence
         
-        for stopTime in self.stopTimeList:
-            if (stopTime.postKm < postKm - thresh):
-                depStop = stopTime.stopSequence
+        i = bisect.bisect_left(self.postMinList, postKm + thresh) - 1
+        if (i >= 0):
+            arrStop = int(self.stopSeqArray[i])
+        
+        i = bisect.bisect_left(self.postMinList, postKm - thresh) - 1
+        if (i >= 0):
+            depStop = int(self.stopSeqArray[i])
             
         return arrStop, depStop
     
     
     def getStopTimeForStopSequence(self, stopSeq):
-        for stopTime in self.stopTimeList:
-            if stopSeq == stopTime.stopSequence:
-                return stopTime
+        if self.stopTimeDict is None:
+            self.freeze()
+        
+        return self.stopTimeDict.get(stopSeq)
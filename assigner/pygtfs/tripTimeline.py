@@ -0,0 +1,191 @@
+'''
+Created on Oct 18, 2026
+'''
+import bisect
+import numpy as np
+
+class TripTimeline(object):
+    '''
+    Scheduled position of a trip as a function of time: arrays of the
+    arrival and departure times of its stops, with their postKm and
+    lat/lon, plus the first stop of the next trip in the block for the
+    layover. A vehicle waits at each stop from arrival to departure, and
+    moves linearly (in postKm and in lat/lon) from one stop to the next.
+    After the last stop it heads for the start of the next trip, postKm
+    counting on past the end of the shape.
+
+    Positions for any number of times are found by binary search over the
+    departure times, instead of a scan over the stop times for each; the
+    single time versions (getPostAtTime, getLatLonAtTime) do the same on
+    lists, which is quicker for one time.
+    '''
+
+
+    def __init__(self, trip, nextTrip, shapeTotalPost, stopLatLonDict):
+        '''
+        Constructor
+
+        trip, nextTrip -- the trip, frozen (see Trip.freeze), and the next
+                          trip in its block, or None.
+        shapeTotalPost -- length of the shape of the trip, in km.
+        stopLatLonDict -- dictionary from stop id to (lat, lon), for the
+                          stops of both trips.
+        '''
+        self.tripId = trip.tripId
+        self.arrArray = np.asarray(trip.arrArray, dtype=np.int64)
+        self.depArray = np.asarray(trip.depArray, dtype=np.int64)
+        self.postArray = np.asarray(trip.postArray, dtype=float)
+
+        stopIdList = trip.getStopIds()
+        self.latArray = np.array([stopLatLonDict[stopId][0]
+                                  for stopId in stopIdList], dtype=float)
+        self.lonArray = np.array([stopLatLonDict[stopId][1]
+                                  for stopId in stopIdList], dtype=float)
+
+        # list forms, for the single time versions
+        self.arrList = self.arrArray.tolist()
+        self.depList = self.depArray.tolist()
+        self.postList = self.postArray.tolist()
+        self.latList = self.latArray.tolist()
+        self.lonList = self.lonArray.tolist()
+
+        self.hasNext = (nextTrip is not None)
+        if self.hasNext:
+            nextStopId = nextTrip.getStopIds()[0]
+            self.nextArr = int(nextTrip.arrArray[0])
+            self.nextPost = float(nextTrip.postArray[0]) + shapeTotalPost
+            self.nextLat, self.nextLon = stopLatLonDict[nextStopId]
+
+
+    def locate(self, relArray):
+        '''
+        Place times (millis since daystart) on the timeline. Return
+        (iPrev, iNext, pct, isLayover, isValid) arrays: the position is
+        pct of the way from stop iPrev to stop iNext, where iNext is the
+        first stop of the next trip where isLayover is true, and there is
+        no position where isValid is false.
+
+        As in the linear scan this replaces (TripDistances.getPostmileAtTime),
+        times before the first arrival are placed on the layover too (with
+        pct below zero), or nowhere if there is no next trip.
+        '''
+        relArray = np.asarray(relArray, dtype=np.int64)
+        nStops = len(self.depArray)
+
+        # The first stop not departed from by then: waiting at it if it has
+        # been arrived at, otherwise between it and the one before.
+        i = np.searchsorted(self.depArray, relArray, side='left')
+        iStop = np.minimum(i, nStops - 1)
+        atStop = (i < nStops) & (self.arrArray[iStop] <= relArray)
+        between = (i > 0) & (i < nStops) & ~atStop
+        isLayover = ~atStop & ~between
+
+        iPrev = np.where(between, i - 1, iStop)
+        iNext = iStop.copy()
+        pct = np.zeros(len(relArray))
+
+        iBetween = i[between]
+        pct[between] = ((relArray[between] - self.depArray[iBetween - 1]) /
+                        (self.arrArray[iBetween] - self.depArray[iBetween - 1]).astype(float))
+
+        if self.hasNext:
+            iPrev[isLayover] = nStops - 1
+            layoverMillis = float(self.nextArr - self.depArray[-1])
+            if (layoverMillis != 0):
+                pct[isLayover] = (relArray[isLayover] - self.depArray[-1])/layoverMillis
+            isValid = np.ones(len(relArray), dtype=bool)
+        else:
+            isValid = ~isLayover
+
+        return iPrev, iNext, pct, isLayover, isValid
+
+
+    def interpolate(self, located, valueArray, nextValue):
+        iPrev, iNext, pct, isLayover, isValid = located
+
+        prevValues = valueArray[iPrev]
+        nextValues = valueArray[iNext]
+        if self.hasNext:
+            nextValues[isLayover] = nextValue
+
+        values = prevValues + pct*(nextValues - prevValues)
+        values[~isValid] = np.nan
+        return values
+
+
+    def getPostsAtTimes(self, relArray):
+        '''
+        Return the scheduled postKm at the given times (millis since
+        daystart), NaN where there is none.
+        '''
+        located = self.locate(relArray)
+        return self.interpolate(located, self.postArray,
+                                self.nextPost if self.hasNext else None)
+
+
+    def getLatLonsAtTimes(self, relArray):
+        '''
+        Return arrays of the scheduled lat and lon at the given times
+        (millis since daystart), NaN where there is none.
+        '''
+        located = self.locate(relArray)
+        return (self.interpolate(located, self.latArray,
+                                 self.nextLat if self.hasNext else None),
+                self.interpolate(located, self.lonArray,
+                                 self.nextLon if self.hasNext else None))
+
+
+    def locateOne(self, relMillis):
+        '''
+        Single time version of locate: return (iPrev, iNext, pct), iNext
+        being None for the first stop of the next trip, or None if there
+        is no position.
+        '''
+        nStops = len(self.depList)
+        i = bisect.bisect_left(self.depList, relMillis)
+        if (i < nStops and self.arrList[i] <= relMillis):
+            return i, i, 0.0
+        if (i > 0 and i < nStops):
+            return i-1, i, ((relMillis - self.depList[i-1]) /
+                            float(self.arrList[i] - self.depList[i-1]))
+        if not self.hasNext:
+            return None
+        layoverMillis = float(self.nextArr - self.depList[-1])
+        if (layoverMillis != 0):
+            return nStops-1, None, (relMillis - self.depList[-1])/layoverMillis
+        return nStops-1, None, 0.0
+
+
+    def interpolateOne(self, located, valueList, nextValue):
+        iPrev, iNext, pct = located
+        if (iPrev == iNext):
+            return valueList[iPrev]
+        if iNext is None:
+            return valueList[iPrev] + pct*(nextValue - valueList[iPrev])
+        return valueList[iPrev] + pct*(valueList[iNext] - valueList[iPrev])
+
+
+    def getPostAtTime(self, relMillis):
+        '''
+        Return the scheduled postKm at the given time (millis since
+        daystart), or None.
+        '''
+        located = self.locateOne(relMillis)
+        if located is None:
+            return None
+        return self.interpolateOne(located, self.postList,
+                                   self.nextPost if self.hasNext else None)
+
+
+    def getLatLonAtTime(self, relMillis):
+        '''
+        Return the scheduled (lat, lon) at the given time (millis since
+        daystart), or None.
+        '''
+        located = self.locateOne(relMillis)
+        if located is None:
+            return None
+        return (self.interpolateOne(located, self.latList,
+                                    self.nextLat if self.hasNext else None),
+                self.interpolateOne(located, self.lonList,
+                                    self.nextLon if self.hasNext else None))
@@ -4,6 +4,7 @@ Created on Sep 8, 2013
 @author: jacob
 '''
 import math
+import numpy as np
 
 kmPerDeg = 111.
 
@@ -20,4 +21,18 @@ def kmBetweenLatLonPair(lat1, lon1, lat2, lon2):
     return d
 
 def degToRad(deg):
-    return deg * (math.pi/180.0)
\ No newline at end of file
+    return deg * (math.pi/180.0)
+
+
+def kmBetweenLatLonArrays(lat1, lon1, lat2, lon2):
+    """Vectorized version of kmBetweenLatLonPair, for numpy arrays."""
+    R = 6371 # Radius of the earth in km
+    dLat = np.deg2rad(lat2-lat1)
+    dLon = np.deg2rad(lon2-lon1)
+    a = np.sin(dLat/2) * np.sin(dLat/2) + \
+        np.cos(np.deg2rad(lat1)) * np.cos(np.deg2rad(lat2)) * \
+        np.sin(dLon/2) * np.sin(dLon/2)
+
+    c = 2.0 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+    d = R * c # Distance in km
+    return d
@@ -0,0 +1,106 @@
+import os
+import sys
+import math
+import random
+import sqlite3
+import pytest
+
+# add the assigner and predictor dirs to python search path
+path, filename = os.path.split(__file__)
+sys.path.append(os.path.abspath(os.path.join(path,"../")))
+sys.path.append(os.path.abspath(os.path.join(path,"../predictor")))
+
+from pygtfs.gtfsData import GtfsData
+
+
+def hms(secs):
+    return "%02d:%02d:%02d" % (secs//3600, (secs//60) % 60, secs % 60)
+
+
+def writeGtfsDb(dbFileLoc, nRoutes=3, nBlocks=2):
+    '''
+    Write a small GTFS feed: nRoutes straight-ish routes out of a common
+    centre, each run back and forth by nBlocks blocks every day from
+    Oct 2013 to Apr 2014 (spanning both DST changes of Europe/Madrid).
+    '''
+    rng = random.Random(1)
+    conn = sqlite3.connect(dbFileLoc)
+    conn.executescript("""
+    create table agency(agency_id text, agency_name text, agency_timezone text);
+    create table calendar(service_id text, monday text, tuesday text, wednesday text,
+        thursday text, friday text, saturday text, sunday text, start_date text,
+        end_date text);
+    create table calendar_dates(service_id text, date text, exception_type text);
+    create table routes(route_id text, route_short_name text);
+    create table trips(route_id text, service_id text, trip_id text, shape_id text,
+        block_id text, direction_id text);
+    create table stop_times(trip_id text, arrival_time text, departure_time text,
+        stop_id text, stop_sequence integer);
+    create table stops(stop_id text, stop_name text, stop_lat real, stop_lon real);
+    create table shapes(shape_id text, shape_pt_lat real, shape_pt_lon real,
+        shape_pt_sequence integer);
+    """)
+    conn.execute("insert into agency values ('1', 'test', 'Europe/Madrid')")
+    conn.execute("insert into calendar values ('D', '1', '1', '1', '1', '1', '1', '1',"
+                 + " '20131001', '20140430')")
+
+    stopLists = {}
+    for r in range(nRoutes):
+        conn.execute("insert into routes values (?, ?)", ('R%d' % r, str(r)))
+        angle = r*math.pi/nRoutes
+        lat, lon = 43.3172 - 0.01*math.sin(angle), -1.96143 - 0.013*math.cos(angle)
+        pointList = []
+        for i in range(100):
+            lat += 0.0002*math.sin(angle) + rng.uniform(-5e-5, 5e-5)
+            lon += 0.00027*math.cos(angle) + rng.uniform(-5e-5, 5e-5)
+            pointList.append((lat, lon))
+
+        stopIds = []
+        for i in range(0, 100, 9):
+            stopId = '%d_%d' % (r, i)
+            conn.execute("insert into stops values (?, ?, ?, ?)",
+                         (stopId, stopId, pointList[i][0] + 1e-5, pointList[i][1] - 1e-5))
+            stopIds.append(stopId)
+
+        for d, points in enumerate([pointList, pointList[::-1]]):
+            shapeId = 'SH%d_%d' % (r, d)
+            for i, (lat, lon) in enumerate(points):
+                conn.execute("insert into shapes values (?, ?, ?, ?)",
+                             (shapeId, lat, lon, i + 1))
+            stopLists[shapeId] = stopIds if d == 0 else stopIds[::-1]
+
+    tripN = 0
+    for r in range(nRoutes):
+        for b in range(nBlocks):
+            blockId = 'B%d_%d' % (r, b)
+            t = 6*3600 + b*1500 + r*240
+            d = 0
+            while t < 12*3600:
+                tripN += 1
+                tripId = 'T%04d' % tripN
+                shapeId = 'SH%d_%d' % (r, d)
+                conn.execute("insert into trips values (?, ?, ?, ?, ?, ?)",
+                             ('R%d' % r, 'D', tripId, shapeId, blockId, str(d)))
+                stopIds = stopLists[shapeId]
+                for k, stopId in enumerate(stopIds):
+                    dwell = 30 if 0 < k < len(stopIds) - 1 else 0
+                    conn.execute("insert into stop_times values (?, ?, ?, ?, ?)",
+                                 (tripId, hms(t), hms(t + dwell), stopId, k + 1))
+                    t += dwell + 100
+                # (a layover of 0 to 8 minutes after the last stop)
+                t += 240*(tripN % 3) - 100
+                d = 1 - d
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture(scope="session")
+def gtfsDbFileLoc(tmpdir_factory):
+    dbFileLoc = str(tmpdir_factory.mktemp("gtfs").join("test_131001.db"))
+    writeGtfsDb(dbFileLoc)
+    return dbFileLoc
+
+
+@pytest.fixture(scope="session")
+def gtfsData(gtfsDbFileLoc):
+    return GtfsData('test', gtfsDbFileLoc)
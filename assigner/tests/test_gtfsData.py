@@ -0,0 +1,17 @@
+from pygtfs.gtfsData import GtfsData
+
+
+def test_unloadService_drops_stitched_shapes(gtfsDbFileLoc):
+    gtfsData = GtfsData('test', gtfsDbFileLoc, lazy=True)
+    gtfsData.loadService('D')
+    assert len(gtfsData.shapeDict) > 0
+
+    shape0 = gtfsData.getShapeFromShapeId('SH0_0')
+    shape1 = gtfsData.getShapeFromShapeId('SH0_1')
+    stitched = gtfsData.getStitchedShape(shape0, shape1)
+    assert gtfsData.getStitchedShape(shape0, shape1) is stitched
+
+    gtfsData.unloadService('D')
+    assert len(gtfsData.blockDict) == 0
+    assert len(gtfsData.shapeDict) == 0 and len(gtfsData.stopDict) == 0
+    assert len(gtfsData.stitchedShapeDict) == 0
@@ -0,0 +1,61 @@
+import calendar
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytz
+
+from pygtfs.localDays import LocalDays
+
+
+def getReferenceDay(tz, hour, timeMillis):
+    # the day of a time, worked out from its local time (date ordinal and
+    # the hour on that date, standard time if ambiguous)
+    localTime = datetime.utcfromtimestamp(timeMillis//1000).replace(
+        tzinfo=pytz.utc).astimezone(tz)
+    date = (localTime.replace(tzinfo=None) - timedelta(hours=hour)).date()
+    dayStart = tz.localize(datetime(date.year, date.month, date.day) +
+                           timedelta(hours=hour))
+    return date.toordinal(), calendar.timegm(dayStart.utctimetuple())*1000
+
+
+def getTimesAround(tz, localTime):
+    # every minute of the six hours around the given (naive) local time
+    center = calendar.timegm(tz.localize(localTime).utctimetuple())*1000
+    return range(center - 3*3600*1000, center + 3*3600*1000, 60*1000)
+
+
+def checkDays(timezone, hour, dstChanges):
+    tz = pytz.timezone(timezone)
+    localDays = LocalDays(timezone, hour)
+    for localTime in dstChanges:
+        timeList = getTimesAround(tz, localTime)
+        dayStartList = []
+        for timeMillis in timeList:
+            dateOrd, dayStart = getReferenceDay(tz, hour, timeMillis)
+            assert localDays.getDateOrdinal(timeMillis) == dateOrd
+            assert localDays.getDayStart(timeMillis) == dayStart
+            dayStartList.append(dayStart)
+        assert localDays.getDayStarts(timeList).tolist() == dayStartList
+
+    # (in reverse too, for the cached day)
+    for timeMillis in reversed(timeList):
+        assert localDays.getDayStart(timeMillis) == getReferenceDay(tz, hour, timeMillis)[1]
+
+
+def test_madrid():
+    # 02:00 -> 03:00 on 2014-03-30, 03:00 -> 02:00 on 2013-10-27
+    dstChanges = [datetime(2013, 10, 27, 2, 30), datetime(2014, 3, 30, 2, 30)]
+    for hour in [0, 2, 4]:
+        checkDays('Europe/Madrid', hour, dstChanges)
+
+
+def test_havana():
+    # Cuba changes at midnight: 00:00 -> 01:00 on 2014-03-09, and
+    # 01:00 -> 00:00 on 2013-11-03
+    dstChanges = [datetime(2013, 11, 3, 0, 30), datetime(2014, 3, 9, 0, 30)]
+    for hour in [0, 4]:
+        checkDays('America/Havana', hour, dstChanges)
+
+
+def test_getDayStarts_empty():
+    assert len(LocalDays('Europe/Madrid').getDayStarts(np.zeros(0))) == 0
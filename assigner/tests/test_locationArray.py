@@ -0,0 +1,58 @@
+import random
+
+from rawLocation import rawLocation
+from pygtfs.locationArray import LocationArray, createLocationArrayFromList
+from tripDistances import TripDistances
+
+
+def getRawLocations(n=50):
+    rng = random.Random(5)
+    locList = []
+    for i in range(n):
+        lat = 43.31 + rng.uniform(-0.005, 0.005)
+        lon = -1.97 + rng.uniform(-0.005, 0.005)
+        spd = rng.uniform(0., 15.) if i % 3 else None
+        locList.append(rawLocation('dev%d' % (i % 2), 1383627600000 + i*15000,
+                                   lat, lon, spd, None, 10.0))
+    return locList
+
+
+def test_views_match_locations():
+    locList = getRawLocations()
+    locArray = createLocationArrayFromList(locList)
+    assert len(locArray) == len(locList)
+
+    for loc, view in zip(locList, locArray):
+        assert (view.deviceId, view.ts, view.lat, view.lon) == \
+            (loc.deviceId, loc.ts, loc.lat, loc.lon)
+        assert (view.spd, view.speed) == (loc.spd, loc.spd)
+        assert view.bearing is None and view.accuracy == 10.0
+        assert view.hasLatAndLon()
+
+    assert locArray[-1].ts == locList[-1].ts
+    sliced = locArray[10:20]
+    assert [view.ts for view in sliced] == [loc.ts for loc in locList[10:20]]
+    # (slices share the arrays)
+    assert sliced.lat.base is locArray.lat
+
+    noLatLon = LocationArray('dev', [1, 2], [None, 43.3], [-1.9, None])
+    assert not noLatLon[0].hasLatAndLon() and not noLatLon[1].hasLatAndLon()
+
+
+def test_views_score_like_locations(gtfsData):
+    # TripDistances only needs the attributes of the locations
+    locList = getRawLocations()
+    ts = locList[-1].ts
+
+    scoreLists = []
+    for locs in (locList, createLocationArrayFromList(locList)):
+        tripDistances = TripDistances(gtfsData, 'test')
+        for loc in locs:
+            tripDistances.addLocation(loc)
+        tripDistances.updateTime(ts)
+        blockList = gtfsData.getTodayBlocks(ts)
+        scoreLists.append([tripDistances.scoreBucketAgainstBlocks(deviceId, blockList)
+                           for deviceId in ('dev0', 'dev1')])
+
+    assert len(scoreLists[0][0]) > 0
+    assert scoreLists[0] == scoreLists[1]
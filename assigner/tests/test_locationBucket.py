@@ -0,0 +1,76 @@
+import os
+import sys
+import random
+
+# add the assigner and predictor dirs to python search path
+path, filename = os.path.split(__file__)
+sys.path.append(os.path.abspath(os.path.join(path,"../")))
+sys.path.append(os.path.abspath(os.path.join(path,"../predictor")))
+
+from pygtfs.locationBucket import LocationBucket
+from rawLocation import rawLocation
+
+
+class ListBucket(object):
+    # LocationBucket as a sorted list, to check the array version against
+    def __init__(self, retainMillis, maxLocations):
+        self.time = 0
+        self.retainMillis = retainMillis
+        self.maxLocations = maxLocations
+        self.locList = []
+
+    def addLocation(self, loc):
+        if loc.ts in [l.ts for l in self.locList]:
+            return
+        if (len(self.locList) > 0 and
+            loc.ts < max(self.time, self.locList[-1].ts) - self.retainMillis):
+            return
+        self.locList.append(loc)
+        self.locList.sort(key=lambda l: l.ts)
+        tOld = max(self.time, self.locList[-1].ts) - self.retainMillis
+        self.locList = [l for l in self.locList if l.ts >= tOld]
+        self.locList = self.locList[-self.maxLocations:]
+
+    def getRecent(self, ageMillis):
+        return [l for l in self.locList if l.ts >= self.time - ageMillis]
+
+
+def makeLoc(ts):
+    return rawLocation('dev', ts, 43.3, -1.96)
+
+
+def test_out_of_order_add_then_compact():
+    bucket = LocationBucket('dev', retainMillis=60*1000, maxLocations=4)
+    for ts in [1000, 2000, 3000]:
+        bucket.addLocation(makeLoc(ts))
+    bucket.time = 3000
+    recent = bucket.getRecent(10*1000)
+    recentTs = [loc.ts for loc in recent]
+
+    # an out-of-order location shifts the later ones up, and the adds
+    # after it fill the arrays (of 2*maxLocations) and compact them
+    bucket.addLocation(makeLoc(1500))
+    for ts in range(4000, 12000, 1000):
+        bucket.addLocation(makeLoc(ts))
+
+    assert [loc.ts for loc in recent] == recentTs
+    assert [loc.ts for loc in bucket.locationList] == [8000, 9000, 10000, 11000]
+    assert bucket.tsSet == set([8000, 9000, 10000, 11000])
+
+
+def test_matches_list_bucket():
+    random.seed(5)
+    bucket = LocationBucket('dev', retainMillis=120*1000, maxLocations=64)
+    listBucket = ListBucket(retainMillis=120*1000, maxLocations=64)
+    for i in range(3000):
+        ts = 1000*i + random.randint(-20000, 20000)
+        if (i % 50 == 0):
+            # a clock jump
+            bucket.time = listBucket.time = ts + 60*1000
+        bucket.addLocation(makeLoc(ts))
+        listBucket.addLocation(makeLoc(ts))
+
+        assert ([loc.ts for loc in bucket.locationList] ==
+                [loc.ts for loc in listBucket.locList])
+        assert ([loc.ts for loc in bucket.getRecent(30*1000)] ==
+                [loc.ts for loc in listBucket.getRecent(30*1000)])
@@ -0,0 +1,39 @@
+import random
+import numpy as np
+
+from pygtfs.pointGrid import PointGrid
+from pygtfs.util import kmBetweenLatLonArrays
+
+
+def scanPointsWithin(latArray, lonArray, lat, lon, radiusKm):
+    distKm = kmBetweenLatLonArrays(lat, lon, np.asarray(latArray),
+                                   np.asarray(lonArray))
+    return np.flatnonzero(distKm <= radiusKm).tolist()
+
+
+def test_point_off_refLat_just_inside_radius():
+    # points at 20 and 61 degrees north put refLat near 40, where a cell
+    # is cellKm wide; at 60 it is only about 6.5 km wide
+    dLon = PointGrid([20., 61.], [0., 0.], 10.).dLon
+
+    # a point 9.9 km due east of a query at the east edge of its cell
+    lat, lon = 60., 0.99*dLon
+    latList = [20., 61., lat]
+    lonList = [0., 0., lon + 0.178]
+    grid = PointGrid(latList, lonList, 10.)
+    assert grid.dLon == dLon
+    assert scanPointsWithin(latList, lonList, lat, lon, 10.) == [2]
+    assert grid.getPointsWithin(lat, lon, 10.).tolist() == [2]
+
+
+def test_matches_scan():
+    rng = random.Random(6)
+    latList = [rng.uniform(30., 60.) for i in range(2000)]
+    lonList = [rng.uniform(-3., 3.) for i in range(2000)]
+    grid = PointGrid(latList, lonList, 10.)
+    for k in range(300):
+        lat = rng.uniform(25., 65.)
+        lon = rng.uniform(-4., 4.)
+        radiusKm = rng.choice([2., 10., 25.])
+        assert grid.getPointsWithin(lat, lon, radiusKm).tolist() == \
+            scanPointsWithin(latList, lonList, lat, lon, radiusKm)
@@ -0,0 +1,40 @@
+import sqlite3
+from datetime import date
+
+from pygtfs.serviceCalendar import readServiceCalendar
+
+
+def createFeed(exceptionRows):
+    conn = sqlite3.connect(':memory:')
+    conn.executescript("""
+    create table calendar(service_id text, monday text, tuesday text, wednesday text,
+        thursday text, friday text, saturday text, sunday text, start_date text,
+        end_date text);
+    create table calendar_dates(service_id text, date text, exception_type text);
+    insert into calendar values ('W', '1', '1', '1', '1', '1', '0', '0', '20131101',
+        '20140131');
+    """)
+    conn.executemany("insert into calendar_dates values (?, ?, ?)", exceptionRows)
+    return conn
+
+
+def test_exceptions_stay_with_their_feed():
+    # the same calendar row in both feeds, but only the first has the
+    # holiday off (and an extra day)
+    holidayFeed = createFeed([('W', '20131225', '2'), ('W', '20131130', '1')])
+    calendar = readServiceCalendar([holidayFeed, createFeed([])])
+    assert len(calendar.entryList) == 2
+
+    assert calendar.getActive(date(2013, 12, 25)).tolist() == [False, True]
+    assert calendar.getActive(date(2013, 11, 30)).tolist() == [True, False]
+    assert calendar.getActive(date(2013, 12, 24)).tolist() == [True, True]
+    assert calendar.getServiceIdsForDate(date(2013, 12, 25)) == ['W']
+
+
+def test_identical_feeds_are_merged():
+    exceptionRows = [('W', '20131225', '2')]
+    calendar = readServiceCalendar([createFeed(exceptionRows),
+                                    createFeed(exceptionRows)])
+    assert len(calendar.entryList) == 1
+    assert calendar.getServiceIdsForDate(date(2013, 12, 25)) == []
+    assert calendar.getSingleEntries([date(2013, 12, 24)]).tolist() == [0]
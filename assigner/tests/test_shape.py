@@ -0,0 +1,66 @@
+import random
+import numpy as np
+import pytest
+
+
+def scanProjection(shape, lat, lon, postTarget=None, postTol=None):
+    # projection onto every segment of the shape, as before the segment
+    # grid and the post window
+    xproj, yproj, postKm, convFactor = shape.projectToSegments(lat, lon)
+    perpSq = xproj*xproj + yproj*yproj
+    if postTarget is not None:
+        perpSq[np.fabs(postKm - postTarget) >= postTol] = np.inf
+        perpSq[0] = xproj[0]*xproj[0] + yproj[0]*yproj[0]
+    i = np.argmin(perpSq)
+    return (float(yproj[i] + lat), float(xproj[i]/convFactor + lon),
+            float(postKm[i]))
+
+
+def getTestPoints(shape, rng, n=200):
+    # points near the shape, and some far off it
+    pointList = []
+    for k in range(n):
+        j = rng.randrange(len(shape.latArray))
+        scale = 0.0005 if k % 4 else 0.05
+        pointList.append((shape.latArray[j] + rng.uniform(-scale, scale),
+                          shape.lonArray[j] + rng.uniform(-scale, scale)))
+    return pointList
+
+
+def test_projectPoint_matches_scan(gtfsData):
+    rng = random.Random(2)
+    for shapeId in sorted(gtfsData.shapeDict):
+        shape = gtfsData.getShapeFromShapeId(shapeId)
+        assert shape.segmentGrid is not None
+        for lat, lon in getTestPoints(shape, rng):
+            assert shape.projectPoint(lat, lon) == \
+                pytest.approx(scanProjection(shape, lat, lon), abs=1e-9)
+
+
+def test_projectPointWithTarget_matches_scan(gtfsData):
+    rng = random.Random(3)
+    for shapeId in sorted(gtfsData.shapeDict):
+        shape = gtfsData.getShapeFromShapeId(shapeId)
+        totalPost = shape.postArray[-1]
+        for lat, lon in getTestPoints(shape, rng):
+            postTarget = rng.uniform(-0.5, totalPost + 0.5)
+            postTol = rng.choice([0.05, 0.3, 1.0, 100.0])
+            assert shape.projectPointWithTarget(lat, lon, postTarget, postTol) == \
+                pytest.approx(scanProjection(shape, lat, lon, postTarget, postTol),
+                              abs=1e-9)
+
+
+def test_projectPoints_matches_projectPoint(gtfsData):
+    rng = random.Random(4)
+    for shapeId in sorted(gtfsData.shapeDict):
+        shape = gtfsData.getShapeFromShapeId(shapeId)
+        pointList = getTestPoints(shape, rng)
+        # (a small maxCells, so that the full scan is done in chunks)
+        latProj, lonProj, postKm = shape.projectPoints([p[0] for p in pointList],
+                                                       [p[1] for p in pointList],
+                                                       maxCells=1000)
+        for j, (lat, lon) in enumerate(pointList):
+            assert (latProj[j], lonProj[j], postKm[j]) == \
+                pytest.approx(shape.projectPoint(lat, lon), abs=1e-9)
+
+    assert len(shape.projectPoints([], [])[0]) == 0
@@ -0,0 +1,90 @@
+import random
+import calendar
+from datetime import datetime
+
+from rawLocation import rawLocation
+from tripDistances import TripDistances
+
+
+def getScheduledLatLon(gtfsData, block, relMillis):
+    for trip in sorted(block.tripDict.values()):
+        if (trip.arrArray[0] <= relMillis <= trip.depArray[-1]):
+            return gtfsData.getTripTimeline(trip).getLatLonAtTime(relMillis)
+    return None
+
+
+def runDevices(gtfsData, tripDistancesList, checkEvery, check):
+    '''
+    Feed the same locations of a few devices to each of tripDistancesList
+    for three hours from 06:00 on 2013-11-05 in Madrid, one every 15 s,
+    calling check(ts) every checkEvery of them.
+    '''
+    t0 = calendar.timegm(datetime(2013, 11, 5, 5, 0).utctimetuple())*1000
+    daystart = gtfsData.getDaystartFromTimestampMillis(t0)
+    rng = random.Random(4)
+
+    devices = {'dev0': gtfsData.getBlockFromBlockId('B0_0'),
+               'dev1': gtfsData.getBlockFromBlockId('B1_1'),
+               'dev2': gtfsData.getBlockFromBlockId('B2_0')}
+
+    for step in range(0, 3*60*4):
+        ts = t0 + step*15*1000
+        for deviceId, block in sorted(devices.items()):
+            # dev2 runs ten minutes late
+            lag = 10*60*1000 if deviceId == 'dev2' else 0
+            latLon = getScheduledLatLon(gtfsData, block, ts - daystart - lag)
+            if latLon is not None:
+                lat = latLon[0] + rng.gauss(0, 1e-4)
+                lon = latLon[1] + rng.gauss(0, 1e-4)
+                for tripDistances in tripDistancesList:
+                    tripDistances.addLocation(rawLocation(deviceId, ts, lat, lon))
+        for tripDistances in tripDistancesList:
+            tripDistances.updateTime(ts)
+
+        if (step % checkEvery == 0):
+            check(ts)
+
+
+def test_vectorized_scores_match_scalar(gtfsData):
+    tripDistances = TripDistances(gtfsData, 'test')
+    nScores = [0]
+
+    def check(ts):
+        blockList = gtfsData.getTodayBlocks(ts)
+        for deviceId in sorted(tripDistances.locationBuckets):
+            # scoreBucketAgainstBlocks keeps its distances from one call to
+            # the next, so this also checks the cache
+            projDict = tripDistances.projectBucketToBlocks(deviceId, blockList)
+            scalarList = [tripDistances.avgMillisFromBlock(deviceId, block, projDict)
+                          for block in blockList]
+            assert tripDistances.scoreBucketAgainstBlocks(deviceId, blockList) == \
+                scalarList
+            nScores[0] += len(blockList)
+
+    runDevices(gtfsData, [tripDistances], 8, check)
+    assert nScores[0] > 0
+
+
+def test_default_candidates_match_unfiltered_scalar(gtfsData):
+    # the default (vectorized, with the prefilter) against the scalar
+    # scores of every block
+    tripDistances = TripDistances(gtfsData, 'test')
+    assert tripDistances.prefilterKm == 10.0
+    scanDistances = TripDistances(gtfsData, 'test', vectorized=False,
+                                  prefilterKm=None)
+    nCandidates = [0]
+
+    def getCandidates(tripDistances, deviceId):
+        return [(c['block'].blockId, c['avgMillis'], c['postKm'], c['prob'])
+                for c in tripDistances.candidateBlocks[deviceId]]
+
+    def check(ts):
+        for deviceId in sorted(tripDistances.locationBuckets):
+            tripDistances.checkBucketAgainstAllBlocks(deviceId)
+            scanDistances.checkBucketAgainstAllBlocks(deviceId)
+            candidates = getCandidates(tripDistances, deviceId)
+            assert candidates == getCandidates(scanDistances, deviceId)
+            nCandidates[0] += len(candidates)
+
+    runDevices(gtfsData, [tripDistances, scanDistances], 8, check)
+    assert nCandidates[0] > 0
@@ -0,0 +1,75 @@
+import math
+import numpy as np
+
+
+def scanValueAtTime(arrList, depList, valueList, nextArr, nextValue, relMillis):
+    # the linear scan over the stop times that TripTimeline replaces (as in
+    # TripDistances.getPostmileAtTime and getLocAtTime before it)
+    nStops = len(arrList)
+    for i in range(nStops):
+        if (arrList[i] <= relMillis <= depList[i]):
+            return valueList[i]
+        if (i + 1 < nStops):
+            if (depList[i] < relMillis < arrList[i+1]):
+                pct = (relMillis - depList[i])/float(arrList[i+1] - depList[i])
+                return valueList[i] + pct*(valueList[i+1] - valueList[i])
+        elif nextArr is not None:
+            try:
+                pct = (relMillis - depList[i])/float(nextArr - depList[i])
+            except ZeroDivisionError:
+                pct = 0
+            return valueList[i] + pct*(nextValue - valueList[i])
+    return None
+
+
+def getTestTimes(trip):
+    # around the trip, and exactly at (and next to) each of its stop times
+    relList = range(int(trip.arrArray[0]) - 3600*1000,
+                    int(trip.depArray[-1]) + 3600*1000, 37777)
+    for t in list(trip.arrArray) + list(trip.depArray):
+        relList.extend([int(t) - 1, int(t), int(t) + 1])
+    return relList
+
+
+def test_timeline_matches_scan(gtfsData):
+    nLayovers = 0
+    for tripId in sorted(gtfsData.tripDict):
+        trip = gtfsData.tripDict[tripId]
+        timeline = gtfsData.getTripTimeline(trip)
+        nextTrip = gtfsData.getNextTripInBlock(tripId)
+
+        arrList = trip.arrArray.tolist()
+        depList = trip.depArray.tolist()
+        stopList = [gtfsData.getStopFromStopId(stopId) for stopId in trip.getStopIds()]
+        nextArr = nextPost = nextStop = None
+        if nextTrip is not None:
+            nextArr = int(nextTrip.arrArray[0])
+            nextPost = (float(nextTrip.postArray[0]) +
+                        gtfsData.getShapeFromShapeId(trip.shapeId).postArray[-1])
+            nextStop = gtfsData.getStopFromStopId(nextTrip.getStopIds()[0])
+            nLayovers += (nextArr == depList[-1])
+
+        relList = getTestTimes(trip)
+        postArray = timeline.getPostsAtTimes(relList)
+        latArray, lonArray = timeline.getLatLonsAtTimes(relList)
+
+        for i, relMillis in enumerate(relList):
+            post = scanValueAtTime(arrList, depList, trip.postArray.tolist(),
+                                   nextArr, nextPost, relMillis)
+            lat = scanValueAtTime(arrList, depList, [s.stopLat for s in stopList],
+                                  nextArr, nextStop and nextStop.stopLat, relMillis)
+            lon = scanValueAtTime(arrList, depList, [s.stopLon for s in stopList],
+                                  nextArr, nextStop and nextStop.stopLon, relMillis)
+
+            assert timeline.getPostAtTime(relMillis) == post
+            if post is None:
+                assert timeline.getLatLonAtTime(relMillis) is None
+                assert math.isnan(postArray[i])
+                assert math.isnan(latArray[i]) and math.isnan(lonArray[i])
+            else:
+                assert timeline.getLatLonAtTime(relMillis) == (lat, lon)
+                assert postArray[i] == post
+                assert (latArray[i], lonArray[i]) == (lat, lon)
+
+    # (the feed has some trips with no layover before the next one)
+    assert nLayovers > 0